@@ -0,0 +1,82 @@
+"""Benchmark resolving many sources in parallel.
+
+Assessment resolves which snapshots and backups to keep for each source
+independently. This compares resolving synthetic sources one after another
+with resolving them in worker processes, for increasing numbers of sources.
+Each source has a history of minutely snapshots, each with a backup.
+
+The parallel times include starting the worker processes, and pickling the
+inputs and results.
+
+Usage: python benchmarks/assess_sources.py [snapshots per source] [workers]
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+from typing import TYPE_CHECKING
+from uuid import uuid4
+
+from btrfs2s3._internal.util import mksubvol
+from btrfs2s3._internal.util import SubvolumeFlags
+from btrfs2s3.assessor import _resolve_all
+from btrfs2s3.backups import BackupInfo
+from btrfs2s3.preservation import Params
+from btrfs2s3.preservation import Policy
+
+if TYPE_CHECKING:
+    from btrfs2s3._internal.btrfsioctl import SubvolumeInfo
+
+_NOW = 2e9
+
+
+def _make_source(count: int) -> tuple[list[SubvolumeInfo], list[BackupInfo]]:
+    parent_uuid = uuid4().bytes
+    snapshots = [
+        mksubvol(
+            uuid=uuid4().bytes,
+            parent_uuid=parent_uuid,
+            ctransid=i,
+            ctime=_NOW - (count - i) * 60,
+            flags=SubvolumeFlags.ReadOnly,
+        )
+        for i in range(count)
+    ]
+    backups = [
+        BackupInfo(
+            uuid=snapshot.uuid,
+            parent_uuid=parent_uuid,
+            ctransid=snapshot.ctransid,
+            ctime=snapshot.ctime,
+            send_parent_uuid=None,
+        )
+        for snapshot in snapshots
+    ]
+    return snapshots, backups
+
+
+def main() -> None:
+    """Run the benchmark."""
+    args = sys.argv[1:]
+    count = int(args[0]) if args else 10_000
+    workers = int(args[1]) if args[1:] else len(os.sched_getaffinity(0))
+    policy = Policy(params=Params.parse("1y 12m 30d 24h 60M"), now=_NOW)
+    print(f"{count} snapshots per source, {workers} workers")
+    for sources in (2, 4, 8, 16, 32):
+        inputs = [_make_source(count) for _ in range(sources)]
+        times = []
+        for max_workers in (1, workers):
+            start = time.perf_counter()
+            _resolve_all(inputs, policy=policy, max_workers=max_workers)
+            times.append(time.perf_counter() - start)
+        serial, parallel = times
+        print(
+            f"{sources} sources: serial {serial:.2f}s, parallel {parallel:.2f}s "
+            f"({serial / parallel:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Benchmark the memory used per listed backup.
+
+For each backup in a bucket, assessment keeps a BackupInfo, and a
+BackupAssessment with two Thunks and a KeepMeta. This measures the memory
+allocated for those records, excluding the keys themselves.
+
+Each record is compared with a baseline: an equivalent class with a
+per-instance __dict__, laid out like the records were before they were
+slotted (a lambda per precomputed Thunk, and two new sets per KeepMeta).
+
+Usage: python benchmarks/assessment_memory.py [number of backups]
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import sys
+import tracemalloc
+from typing import Callable
+from typing import Generic
+from typing import TYPE_CHECKING
+from typing import TypeVar
+from uuid import uuid4
+
+from btrfs2s3.assessor import BackupAssessment
+from btrfs2s3.backups import BackupInfo
+from btrfs2s3.resolver import Flags
+from btrfs2s3.resolver import KeepMeta
+from btrfs2s3.resolver import Reasons
+from btrfs2s3.thunk import Thunk
+
+if TYPE_CHECKING:
+    from btrfs2s3.preservation import TS
+
+_T = TypeVar("_T")
+
+
+@dataclasses.dataclass(frozen=True)
+class _DictBackupInfo:
+    uuid: bytes
+    parent_uuid: bytes
+    send_parent_uuid: bytes | None
+    ctransid: int
+    ctime: float
+
+
+class _DictThunk(Generic[_T]):
+    def __init__(self, value: _T) -> None:
+        self._get_value = lambda: value
+        self._value = value
+
+
+@dataclasses.dataclass
+class _DictKeepMeta:
+    reasons: Reasons = Reasons.Empty
+    flags: Flags = Flags.Empty
+    time_spans: set[TS] = dataclasses.field(default_factory=set)
+    other_uuids: set[bytes] = dataclasses.field(default_factory=set)
+
+
+@dataclasses.dataclass
+class _DictBackupAssessment:
+    backup: _DictThunk[_DictBackupInfo]
+    key: _DictThunk[str]
+    keep_meta: _DictKeepMeta = dataclasses.field(default_factory=_DictKeepMeta)
+
+
+def _make_keys(count: int) -> list[str]:
+    keys = []
+    for i in range(count):
+        info = BackupInfo(
+            uuid=uuid4().bytes,
+            parent_uuid=uuid4().bytes,
+            ctransid=i,
+            ctime=1e9 + i,
+            send_parent_uuid=uuid4().bytes,
+        )
+        keys.append(f"source{''.join(info.get_path_suffixes())}")
+    return keys
+
+
+def _parse(keys: list[str]) -> list[BackupInfo]:
+    return [info for info in BackupInfo.from_paths(keys) if info is not None]
+
+
+def _parse_dict(keys: list[str]) -> list[_DictBackupInfo]:
+    return [
+        _DictBackupInfo(
+            uuid=info.uuid,
+            parent_uuid=info.parent_uuid,
+            send_parent_uuid=info.send_parent_uuid,
+            ctransid=info.ctransid,
+            ctime=info.ctime,
+        )
+        for info in _parse(keys)
+    ]
+
+
+def _measure(count: int, func: Callable[[], object]) -> float:
+    tracemalloc.start()
+    result = func()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size / count
+
+
+def main() -> None:
+    """Run the benchmark."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    keys = _make_keys(count)
+    infos = _parse(keys)
+    dict_infos = _parse_dict(keys)
+
+    for name, slotted, baseline in (
+        ("BackupInfo", lambda: _parse(keys), lambda: _parse_dict(keys)),
+        (
+            "Thunk",
+            lambda: [Thunk(info) for info in infos],
+            lambda: [_DictThunk(info) for info in dict_infos],
+        ),
+        (
+            "KeepMeta",
+            lambda: [KeepMeta() for _ in infos],
+            lambda: [_DictKeepMeta() for _ in infos],
+        ),
+        (
+            "BackupInfo + BackupAssessment",
+            lambda: [
+                BackupAssessment(backup=Thunk(info), key=Thunk(key))
+                for key, info in zip(keys, _parse(keys))
+            ],
+            lambda: [
+                _DictBackupAssessment(backup=_DictThunk(info), key=_DictThunk(key))
+                for key, info in zip(keys, _parse_dict(keys))
+            ],
+        ),
+    ):
+        print(
+            f"{name}: {_measure(count, slotted):.0f} bytes per backup "
+            f"({_measure(count, baseline):.0f} with __dict__)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Benchmark parsing of backup keys.
+
+Compares BackupInfo.from_paths() with the general-purpose parser, on keys as
+produced by btrfs2s3.
+
+Usage: python benchmarks/backup_info_from_path.py [number of keys]
+"""
+
+from __future__ import annotations
+
+import random
+import sys
+import timeit
+from uuid import uuid4
+
+from btrfs2s3.backups import BackupInfo
+
+
+def _make_keys(count: int) -> list[str]:
+    rng = random.Random(0)
+    keys = []
+    for _ in range(count):
+        info = BackupInfo(
+            uuid=uuid4().bytes,
+            parent_uuid=uuid4().bytes,
+            ctransid=rng.randrange(2**32),
+            ctime=rng.uniform(0, 2**31),
+            send_parent_uuid=rng.choice([None, uuid4().bytes]),
+        )
+        suffixes = info.get_path_suffixes(tzinfo="America/Los_Angeles")
+        keys.append(f"prefix/source{''.join(suffixes)}.gz")
+    return keys
+
+
+def main() -> None:
+    """Run the benchmark."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    keys = _make_keys(count)
+
+    def slow() -> object:
+        return [BackupInfo._from_any_path(key) for key in keys]
+
+    def fast() -> object:
+        return BackupInfo.from_paths(keys)
+
+    assert slow() == fast()
+    for name, func in (("general parser", slow), ("from_paths()", fast)):
+        seconds = min(timeit.repeat(func, number=1, repeat=3))
+        print(f"{name}: {count} keys in {seconds:.3f}s ({count / seconds:.0f}/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Benchmark Policy.bucket_time_spans().
+
+Compares computing time spans for each timestamp with iter_time_spans() with
+computing them all at once with bucket_time_spans(), on a history of hourly
+snapshots. bucket_time_spans() is only fast when NumPy is installed.
+
+Usage: python benchmarks/policy_bucket_time_spans.py [number of timestamps]
+"""
+
+from __future__ import annotations
+
+import sys
+import timeit
+
+import arrow
+from btrfs2s3._internal.timespanbuckets import _HAVE_NUMPY
+from btrfs2s3.preservation import Policy
+from btrfs2s3.zoneinfo import get_zoneinfo
+
+
+def main() -> None:
+    """Run the benchmark."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    tzinfo = get_zoneinfo("America/Los_Angeles")
+    policy = Policy.all(tzinfo=tzinfo)
+    start = arrow.get("1990", tzinfo=tzinfo).timestamp()
+    timestamps = [start + i * 3600 for i in range(count)]
+
+    def one_at_a_time() -> object:
+        return [list(policy.iter_time_spans(t)) for t in timestamps]
+
+    def bulk() -> object:
+        return policy.bucket_time_spans(timestamps)
+
+    print(f"NumPy is {'installed' if _HAVE_NUMPY else 'not installed'}")
+    for name, func in (("iter_time_spans()", one_at_a_time), ("bulk", bulk)):
+        seconds = min(timeit.repeat(func, number=1, repeat=3))
+        print(f"{name}: {count} timestamps in {seconds:.3f}s ({count / seconds:.0f}/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Benchmark Policy.iter_time_spans().
+
+Compares the arrow-based computation of time spans with Policy's memoized
+implementation, on a history of hourly snapshots.
+
+Usage: python benchmarks/policy_iter_time_spans.py [number of timestamps]
+"""
+
+from __future__ import annotations
+
+import sys
+import timeit
+
+import arrow
+from btrfs2s3._internal.arrowutil import convert_span
+from btrfs2s3._internal.timespans import FRAMES
+from btrfs2s3.preservation import Policy
+from btrfs2s3.zoneinfo import get_zoneinfo
+
+
+def main() -> None:
+    """Run the benchmark."""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    tzinfo = get_zoneinfo("America/Los_Angeles")
+    start = arrow.get("2010", tzinfo=tzinfo).timestamp()
+    timestamps = [start + i * 3600 for i in range(count)]
+
+    def with_arrow() -> object:
+        return [
+            [
+                convert_span(arrow.get(t, tzinfo=tzinfo).span(f, bounds="[]"))
+                for f in FRAMES
+            ]
+            for t in timestamps
+        ]
+
+    def with_policy() -> object:
+        # A new Policy each time, but the memo is shared across runs, as it
+        # would be in a long-lived process
+        policy = Policy.all(tzinfo=tzinfo)
+        return [list(policy.iter_time_spans(t)) for t in timestamps]
+
+    assert with_arrow() == with_policy()
+    for name, func in (("arrow", with_arrow), ("Policy", with_policy)):
+        seconds = min(timeit.repeat(func, number=1, repeat=3))
+        print(f"{name}: {count} timestamps in {seconds:.3f}s ({count / seconds:.0f}/s)")
+
+
+if __name__ == "__main__":
+    main()
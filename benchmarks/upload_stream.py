@@ -0,0 +1,100 @@
+"""Benchmark streaming a pipe to S3.
+
+Streams the output of a subprocess through upload_stream() into a local S3
+stand-in which discards the data, so only the cost of moving data into the
+part buffers is measured. Compares:
+
+- read(): reading each part with read(), which allocates a new bytes object
+  per read, as boto3's upload_fileobj() does
+- readinto(): upload_stream(), with the default pipe size
+- readinto() + large pipe: upload_stream(), with the pipe enlarged like
+  create_backup() does
+
+CPU time is for this process only, which includes the upload threads.
+
+Usage: python benchmarks/upload_stream.py [size in MiB]
+"""
+
+from __future__ import annotations
+
+from subprocess import PIPE
+from subprocess import Popen
+import sys
+import time
+from typing import Callable
+from typing import IO
+
+from btrfs2s3.action import _enlarge_pipe
+from btrfs2s3.upload import upload_stream
+from btrfs2s3.upload import UploadParams
+
+_MIB = 2**20
+
+
+class _NullS3:
+    # A local S3 stand-in, with just the methods used by upload_stream()
+    def put_object(self, *, Body: bytes | bytearray, **_: object) -> None:  # noqa: N803
+        pass
+
+    def create_multipart_upload(self, **_: object) -> dict[str, str]:
+        return {"UploadId": "upload-id"}
+
+    def upload_part(self, *, Body: bytes | bytearray, **_: object) -> dict[str, str]:  # noqa: N803
+        # Touch the data, as sending it would
+        memoryview(Body)[::4096].tobytes()
+        return {"ETag": "etag"}
+
+    def complete_multipart_upload(self, **_: object) -> None:
+        pass
+
+    def abort_multipart_upload(self, **_: object) -> None:
+        pass
+
+
+def _with_read(s3: _NullS3, stream: IO[bytes], params: UploadParams) -> None:
+    while True:
+        data = stream.read(params.part_size)
+        if not data:
+            break
+        s3.upload_part(Body=data)
+
+
+def _with_readinto(s3: _NullS3, stream: IO[bytes], params: UploadParams) -> None:
+    upload_stream(s3, "bucket", "key", stream, params=params)  # type: ignore[arg-type]
+
+
+def _run(
+    size: int,
+    func: Callable[[_NullS3, IO[bytes], UploadParams], None],
+    *,
+    large_pipe: bool,
+) -> tuple[float, float]:
+    process = Popen(["head", "-c", str(size), "/dev/zero"], stdout=PIPE)
+    assert process.stdout is not None
+    if large_pipe:
+        _enlarge_pipe(process.stdout)
+    start, start_cpu = time.perf_counter(), time.process_time()
+    func(_NullS3(), process.stdout, UploadParams())
+    seconds, cpu = time.perf_counter() - start, time.process_time() - start_cpu
+    process.stdout.close()
+    assert process.wait() == 0
+    return seconds, cpu
+
+
+def main() -> None:
+    """Run the benchmark."""
+    size = int(sys.argv[1]) * _MIB if len(sys.argv) > 1 else 4096 * _MIB
+    for name, func, large_pipe in (
+        ("read()", _with_read, False),
+        ("readinto()", _with_readinto, False),
+        ("readinto() + large pipe", _with_readinto, True),
+    ):
+        seconds, cpu = min(_run(size, func, large_pipe=large_pipe) for _ in range(3))
+        print(
+            f"{name}: {size / _MIB / seconds:.0f} MiB/s, "
+            f"{cpu / (size / 2**30):.3f} CPU s/GiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
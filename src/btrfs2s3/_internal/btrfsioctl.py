@@ -0,0 +1,553 @@
+"""Subvolume operations with btrfs ioctls, without libbtrfsutil.
+
+The python bindings for libbtrfsutil are compiled and not distributed on
+PyPI, which forces virtualenvs to use --system-site-packages. This module
+issues the few ioctls we need directly, with ctypes structures laid out as in
+linux/btrfs.h and linux/btrfs_tree.h.
+
+Besides single-subvolume operations, this supports listing all the
+subvolumes in a directory (and its plain subdirectories) with a couple of
+TREE_SEARCH_V2 loops, rather than a sequence of syscalls per subvolume. Tree
+search requires CAP_SYS_ADMIN, so we fall back to scanning the directory
+without it.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import errno
+import fcntl
+import os
+from pathlib import Path
+import struct
+from typing import NamedTuple
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Iterator
+    from typing import Sequence
+
+
+class SubvolumeInfo(NamedTuple):
+    """Information about a subvolume.
+
+    This has the same fields as btrfsutil.SubvolumeInfo.
+    """
+
+    id: int
+    parent_id: int
+    dir_id: int
+    flags: int
+    uuid: bytes
+    parent_uuid: bytes
+    received_uuid: bytes
+    generation: int
+    ctransid: int
+    otransid: int
+    stransid: int
+    rtransid: int
+    ctime: float
+    otime: float
+    stime: float = 0.0
+    rtime: float = 0.0
+
+
+_BTRFS_IOCTL_MAGIC = 0x94
+_IOC_WRITE = 1
+_IOC_READ = 2
+
+_ROOT_TREE_OBJECTID = 1
+# The objectid of the root directory of every subvolume, and the lowest id
+# of a subvolume other than the top-level one
+_FIRST_FREE_OBJECTID = 256
+
+_INODE_ITEM_KEY = 1
+_DIR_INDEX_KEY = 96
+_ROOT_ITEM_KEY = 132
+
+_FT_DIR = 2
+
+_SUBVOL_RDONLY = 1 << 1
+
+_U32_MAX = 2**32 - 1
+_U64_MAX = 2**64 - 1
+
+_VOL_NAME_MAX = 255
+_PATH_NAME_MAX = 4087
+_SUBVOL_NAME_MAX = 4039
+_INO_LOOKUP_PATH_MAX = 4080
+
+_SEARCH_BUF_SIZE = 64 * 1024
+
+
+def _ioc(direction: int, nr: int, size: int) -> int:
+    return (direction << 30) | (size << 16) | (_BTRFS_IOCTL_MAGIC << 8) | nr
+
+
+class _VolArgs(ctypes.Structure):
+    _fields_ = (("fd", ctypes.c_int64), ("name", ctypes.c_char * (_PATH_NAME_MAX + 1)))
+
+
+class _VolArgsV2(ctypes.Structure):
+    _fields_ = (
+        ("fd", ctypes.c_int64),
+        ("transid", ctypes.c_uint64),
+        ("flags", ctypes.c_uint64),
+        ("unused", ctypes.c_uint64 * 4),
+        ("name", ctypes.c_char * (_SUBVOL_NAME_MAX + 1)),
+    )
+
+
+class _InoLookupArgs(ctypes.Structure):
+    _fields_ = (
+        ("treeid", ctypes.c_uint64),
+        ("objectid", ctypes.c_uint64),
+        ("name", ctypes.c_char * _INO_LOOKUP_PATH_MAX),
+    )
+
+
+class _SearchKey(ctypes.Structure):
+    _fields_ = (
+        ("tree_id", ctypes.c_uint64),
+        ("min_objectid", ctypes.c_uint64),
+        ("max_objectid", ctypes.c_uint64),
+        ("min_offset", ctypes.c_uint64),
+        ("max_offset", ctypes.c_uint64),
+        ("min_transid", ctypes.c_uint64),
+        ("max_transid", ctypes.c_uint64),
+        ("min_type", ctypes.c_uint32),
+        ("max_type", ctypes.c_uint32),
+        ("nr_items", ctypes.c_uint32),
+        ("unused", ctypes.c_uint32),
+        ("unused1", ctypes.c_uint64),
+        ("unused2", ctypes.c_uint64),
+        ("unused3", ctypes.c_uint64),
+        ("unused4", ctypes.c_uint64),
+    )
+
+
+class _SearchArgsV2(ctypes.Structure):
+    # Followed by buf_size bytes of results
+    _fields_ = (("key", _SearchKey), ("buf_size", ctypes.c_uint64))
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = (("sec", ctypes.c_uint64), ("nsec", ctypes.c_uint32))
+
+
+class _GetSubvolInfoArgs(ctypes.Structure):
+    _fields_ = (
+        ("treeid", ctypes.c_uint64),
+        ("name", ctypes.c_char * (_VOL_NAME_MAX + 1)),
+        ("parent_id", ctypes.c_uint64),
+        ("dirid", ctypes.c_uint64),
+        ("generation", ctypes.c_uint64),
+        ("flags", ctypes.c_uint64),
+        ("uuid", ctypes.c_uint8 * 16),
+        ("parent_uuid", ctypes.c_uint8 * 16),
+        ("received_uuid", ctypes.c_uint8 * 16),
+        ("ctransid", ctypes.c_uint64),
+        ("otransid", ctypes.c_uint64),
+        ("stransid", ctypes.c_uint64),
+        ("rtransid", ctypes.c_uint64),
+        ("ctime", _Timespec),
+        ("otime", _Timespec),
+        ("stime", _Timespec),
+        ("rtime", _Timespec),
+        ("reserved", ctypes.c_uint64 * 8),
+    )
+
+
+_IOC_SYNC = _ioc(0, 8, 0)
+_IOC_SNAP_DESTROY = _ioc(_IOC_WRITE, 15, ctypes.sizeof(_VolArgs))
+_IOC_TREE_SEARCH_V2 = _ioc(_IOC_READ | _IOC_WRITE, 17, ctypes.sizeof(_SearchArgsV2))
+_IOC_INO_LOOKUP = _ioc(_IOC_READ | _IOC_WRITE, 18, ctypes.sizeof(_InoLookupArgs))
+_IOC_SNAP_CREATE_V2 = _ioc(_IOC_WRITE, 23, ctypes.sizeof(_VolArgsV2))
+_IOC_GET_SUBVOL_INFO = _ioc(_IOC_READ, 60, ctypes.sizeof(_GetSubvolInfoArgs))
+_IOC_SNAP_DESTROY_V2 = _ioc(_IOC_WRITE, 63, ctypes.sizeof(_VolArgsV2))
+
+# struct btrfs_ioctl_search_header
+_SEARCH_HEADER = struct.Struct("=QQQII")
+# struct btrfs_dir_item, including its location key
+_DIR_ITEM = struct.Struct("<QBQQHHB")
+# Fields of struct btrfs_root_item, by offset
+_U64 = struct.Struct("<Q")
+_ROOT_ITEM_GENERATION_OFFSET = 160
+_ROOT_ITEM_FLAGS_OFFSET = 208
+_ROOT_ITEM_UUIDS_OFFSET = 247
+_ROOT_ITEM_TRANSIDS = struct.Struct("<QQQQ")
+_ROOT_ITEM_TRANSIDS_OFFSET = 295
+_ROOT_ITEM_TIMES = struct.Struct("<QIQIQIQI")
+_ROOT_ITEM_TIMES_OFFSET = 327
+# Root items written by old kernels stop before the uuids
+_ROOT_ITEM_SIZE = 439
+
+_NULL_UUID = b"\0" * 16
+
+
+class _SearchItem(NamedTuple):
+    objectid: int
+    type: int
+    offset: int
+    data: bytes
+
+
+def _open_dir(path: Path) -> int:
+    return os.open(path, os.O_RDONLY | os.O_DIRECTORY | os.O_CLOEXEC)
+
+
+def _encode_name(name: str, max_len: int) -> bytes:
+    encoded = os.fsencode(name)
+    if len(encoded) > max_len:
+        raise OSError(errno.ENAMETOOLONG, os.strerror(errno.ENAMETOOLONG), name)
+    return encoded
+
+
+def _to_time(sec: int, nsec: int) -> float:
+    return sec + nsec / 1e9
+
+
+def _tree_search(
+    fd: int,
+    *,
+    tree_id: int,
+    min_objectid: int,
+    max_objectid: int,
+    min_type: int,
+    max_type: int,
+) -> Iterator[_SearchItem]:
+    # The kernel compares whole (objectid, type, offset) keys against the
+    # min and max keys, so items of other types may be returned
+    buf = bytearray(ctypes.sizeof(_SearchArgsV2) + _SEARCH_BUF_SIZE)
+    header_size = ctypes.sizeof(_SearchArgsV2)
+    objectid, type_, offset = min_objectid, min_type, 0
+    while True:
+        args = _SearchArgsV2.from_buffer(buf)
+        args.key.tree_id = tree_id
+        args.key.min_objectid = objectid
+        args.key.max_objectid = max_objectid
+        args.key.min_type = type_
+        args.key.max_type = max_type
+        args.key.min_offset = offset
+        args.key.max_offset = _U64_MAX
+        args.key.min_transid = 0
+        args.key.max_transid = _U64_MAX
+        args.key.nr_items = _U32_MAX
+        args.buf_size = _SEARCH_BUF_SIZE
+        fcntl.ioctl(fd, _IOC_TREE_SEARCH_V2, buf)
+        nr_items = _SearchArgsV2.from_buffer(buf).key.nr_items
+        if nr_items == 0:
+            return
+        pos = header_size
+        for _ in range(nr_items):
+            _, objectid, offset, type_, length = _SEARCH_HEADER.unpack_from(buf, pos)
+            pos += _SEARCH_HEADER.size
+            if min_type <= type_ <= max_type:
+                yield _SearchItem(
+                    objectid=objectid,
+                    type=type_,
+                    offset=offset,
+                    data=bytes(buf[pos : pos + length]),
+                )
+            pos += length
+        # Continue from the key after the last one we saw
+        if offset < _U64_MAX:
+            offset += 1
+        elif type_ < max_type:
+            type_, offset = type_ + 1, 0
+        elif objectid < max_objectid:
+            objectid, type_, offset = objectid + 1, min_type, 0
+        else:
+            return
+
+
+def _parse_root_item(
+    subvol_id: int, parent_id: int, dir_id: int, data: bytes
+) -> SubvolumeInfo:
+    (generation,) = _U64.unpack_from(data, _ROOT_ITEM_GENERATION_OFFSET)
+    (flags,) = _U64.unpack_from(data, _ROOT_ITEM_FLAGS_OFFSET)
+    if len(data) < _ROOT_ITEM_SIZE:
+        uuid = parent_uuid = received_uuid = _NULL_UUID
+        transids = (0, 0, 0, 0)
+        times = (0.0, 0.0, 0.0, 0.0)
+    else:
+        start = _ROOT_ITEM_UUIDS_OFFSET
+        uuid = data[start : start + 16]
+        parent_uuid = data[start + 16 : start + 32]
+        received_uuid = data[start + 32 : start + 48]
+        transids = _ROOT_ITEM_TRANSIDS.unpack_from(data, _ROOT_ITEM_TRANSIDS_OFFSET)
+        c_sec, c_nsec, o_sec, o_nsec, s_sec, s_nsec, r_sec, r_nsec = (
+            _ROOT_ITEM_TIMES.unpack_from(data, _ROOT_ITEM_TIMES_OFFSET)
+        )
+        times = (
+            _to_time(c_sec, c_nsec),
+            _to_time(o_sec, o_nsec),
+            _to_time(s_sec, s_nsec),
+            _to_time(r_sec, r_nsec),
+        )
+    ctransid, otransid, stransid, rtransid = transids
+    ctime, otime, stime, rtime = times
+    return SubvolumeInfo(
+        id=subvol_id,
+        parent_id=parent_id,
+        dir_id=dir_id,
+        flags=flags,
+        uuid=uuid,
+        parent_uuid=parent_uuid,
+        received_uuid=received_uuid,
+        generation=generation,
+        ctransid=ctransid,
+        otransid=otransid,
+        stransid=stransid,
+        rtransid=rtransid,
+        ctime=ctime,
+        otime=otime,
+        stime=stime,
+        rtime=rtime,
+    )
+
+
+def _get_tree_id(fd: int) -> int:
+    # Looking up the root directory of a subvolume doesn't require
+    # CAP_SYS_ADMIN, and with treeid 0 it tells us the subvolume of fd
+    args = _InoLookupArgs(treeid=0, objectid=_FIRST_FREE_OBJECTID)
+    fcntl.ioctl(fd, _IOC_INO_LOOKUP, args)
+    return int(args.treeid)
+
+
+def is_subvolume(path: Path) -> bool:
+    """Returns whether a path is the root of a btrfs subvolume.
+
+    Args:
+        path: The path to check.
+
+    Returns:
+        True if path is a subvolume, False otherwise.
+    """
+    if path.stat().st_ino != _FIRST_FREE_OBJECTID:
+        return False
+    try:
+        fd = _open_dir(path)
+    except NotADirectoryError:
+        return False
+    try:
+        _get_tree_id(fd)
+    except OSError as ex:
+        # Not on btrfs
+        if ex.errno == errno.ENOTTY:
+            return False
+        raise
+    finally:
+        os.close(fd)
+    return True
+
+
+def subvolume_info(path: Path) -> SubvolumeInfo:
+    """Returns information about the subvolume at a path.
+
+    This uses BTRFS_IOC_GET_SUBVOL_INFO, which doesn't require CAP_SYS_ADMIN.
+
+    Args:
+        path: The path to a subvolume.
+
+    Returns:
+        A SubvolumeInfo.
+    """
+    args = _GetSubvolInfoArgs()
+    fd = _open_dir(path)
+    try:
+        fcntl.ioctl(fd, _IOC_GET_SUBVOL_INFO, args)
+    finally:
+        os.close(fd)
+    return SubvolumeInfo(
+        id=args.treeid,
+        parent_id=args.parent_id,
+        dir_id=args.dirid,
+        flags=args.flags,
+        uuid=bytes(args.uuid),
+        parent_uuid=bytes(args.parent_uuid),
+        received_uuid=bytes(args.received_uuid),
+        generation=args.generation,
+        ctransid=args.ctransid,
+        otransid=args.otransid,
+        stransid=args.stransid,
+        rtransid=args.rtransid,
+        ctime=_to_time(args.ctime.sec, args.ctime.nsec),
+        otime=_to_time(args.otime.sec, args.otime.nsec),
+        stime=_to_time(args.stime.sec, args.stime.nsec),
+        rtime=_to_time(args.rtime.sec, args.rtime.nsec),
+    )
+
+
+def create_snapshot(source: Path, path: Path, *, read_only: bool = False) -> None:
+    """Creates a snapshot of a subvolume.
+
+    Args:
+        source: The subvolume to snapshot.
+        path: The path of the new snapshot. Its parent directory must exist.
+        read_only: Whether the snapshot should be read-only.
+    """
+    args = _VolArgsV2(
+        flags=_SUBVOL_RDONLY if read_only else 0,
+        name=_encode_name(path.name, _SUBVOL_NAME_MAX),
+    )
+    source_fd = _open_dir(source)
+    try:
+        parent_fd = _open_dir(path.parent)
+        try:
+            args.fd = source_fd
+            fcntl.ioctl(parent_fd, _IOC_SNAP_CREATE_V2, args)
+        finally:
+            os.close(parent_fd)
+    finally:
+        os.close(source_fd)
+
+
+def delete_subvolume(path: Path) -> None:
+    """Deletes a subvolume.
+
+    Args:
+        path: The path to a subvolume.
+    """
+    parent_fd = _open_dir(path.parent)
+    try:
+        args = _VolArgsV2(name=_encode_name(path.name, _SUBVOL_NAME_MAX))
+        try:
+            fcntl.ioctl(parent_fd, _IOC_SNAP_DESTROY_V2, args)
+        except OSError as ex:
+            # SNAP_DESTROY_V2 requires linux 5.7
+            if ex.errno != errno.ENOTTY:
+                raise
+            args_v1 = _VolArgs(name=_encode_name(path.name, _PATH_NAME_MAX))
+            fcntl.ioctl(parent_fd, _IOC_SNAP_DESTROY, args_v1)
+    finally:
+        os.close(parent_fd)
+
+
+def sync(path: Path) -> None:
+    """Commits the current transaction of a filesystem, and waits for it.
+
+    This is the same as `btrfs filesystem sync`.
+
+    Args:
+        path: Any directory on the filesystem.
+    """
+    fd = _open_dir(path)
+    try:
+        fcntl.ioctl(fd, _IOC_SYNC)
+    finally:
+        os.close(fd)
+
+
+def _get_root_items(
+    fd: int, ids: Sequence[int], parent_id: int, dir_id: int
+) -> dict[int, SubvolumeInfo]:
+    if not ids:
+        return {}
+    wanted = set(ids)
+    return {
+        item.objectid: _parse_root_item(item.objectid, parent_id, dir_id, item.data)
+        for item in _tree_search(
+            fd,
+            tree_id=_ROOT_TREE_OBJECTID,
+            min_objectid=min(ids),
+            max_objectid=max(ids),
+            min_type=_ROOT_ITEM_KEY,
+            max_type=_ROOT_ITEM_KEY,
+        )
+        if item.objectid in wanted
+    }
+
+
+def _list_with_tree_search(
+    top: Path, *, recursive: bool
+) -> list[tuple[Path, SubvolumeInfo]]:
+    result: list[tuple[Path, SubvolumeInfo]] = []
+    fd = _open_dir(top)
+    try:
+        tree_id = _get_tree_id(fd)
+        dirs = [(top, os.fstat(fd).st_ino)]
+        while dirs:
+            path, dir_id = dirs.pop()
+            subvols: list[tuple[str, int]] = []
+            subdirs: list[tuple[str, int]] = []
+            for item in _tree_search(
+                fd,
+                tree_id=tree_id,
+                min_objectid=dir_id,
+                max_objectid=dir_id,
+                min_type=_DIR_INDEX_KEY,
+                max_type=_DIR_INDEX_KEY,
+            ):
+                location_id, location_type, _, _, _, name_len, file_type = (
+                    _DIR_ITEM.unpack_from(item.data)
+                )
+                name = os.fsdecode(
+                    item.data[_DIR_ITEM.size : _DIR_ITEM.size + name_len]
+                )
+                if location_type == _ROOT_ITEM_KEY:
+                    subvols.append((name, location_id))
+                elif location_type == _INODE_ITEM_KEY and file_type == _FT_DIR:
+                    subdirs.append((name, location_id))
+            infos = _get_root_items(
+                fd, [subvol_id for _, subvol_id in subvols], tree_id, dir_id
+            )
+            for name, subvol_id in sorted(subvols):
+                # A subvolume may be deleted but not yet cleaned up
+                if subvol_id in infos:
+                    result.append((path / name, infos[subvol_id]))
+            if recursive:
+                dirs.extend(
+                    (path / name, ino) for name, ino in sorted(subdirs, reverse=True)
+                )
+    finally:
+        os.close(fd)
+    return result
+
+
+def _list_with_scandir(
+    top: Path, *, recursive: bool
+) -> list[tuple[Path, SubvolumeInfo]]:
+    result: list[tuple[Path, SubvolumeInfo]] = []
+    dirs = [top]
+    while dirs:
+        with os.scandir(dirs.pop()) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+        subdirs = []
+        for entry in entries:
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            path = Path(entry.path)
+            if entry.stat(follow_symlinks=False).st_ino == _FIRST_FREE_OBJECTID:
+                result.append((path, subvolume_info(path)))
+            elif recursive:
+                subdirs.append(path)
+        dirs.extend(reversed(subdirs))
+    return result
+
+
+def list_subvolumes(
+    top: Path, *, recursive: bool = True
+) -> list[tuple[Path, SubvolumeInfo]]:
+    """Lists the subvolumes in a directory.
+
+    Subvolumes are found in top and (if recursive) in its subdirectories, but
+    not in subvolumes beneath top (the contents of a snapshot may be huge).
+
+    With CAP_SYS_ADMIN, this uses a TREE_SEARCH_V2 loop to list each
+    directory, and another to get info for all the subvolumes in it.
+    Otherwise, it scans each directory and gets info for each subvolume
+    separately.
+
+    Args:
+        top: A directory on a btrfs filesystem.
+        recursive: Whether to search subdirectories of top.
+
+    Returns:
+        A list of (path, info) for each subvolume, in order of path within
+        each directory.
+    """
+    try:
+        return _list_with_tree_search(top, recursive=recursive)
+    except PermissionError:
+        return _list_with_scandir(top, recursive=recursive)
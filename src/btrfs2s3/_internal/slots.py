@@ -0,0 +1,53 @@
+"""A backport of dataclass(slots=True), which requires python 3.10."""
+
+from __future__ import annotations
+
+import dataclasses
+from typing import Any
+from typing import TypeVar
+
+_C = TypeVar("_C", bound=type)
+
+
+def _frozen_getstate(self: Any) -> tuple[Any, ...]:  # noqa: ANN401
+    return tuple(getattr(self, f.name) for f in dataclasses.fields(self))
+
+
+def _frozen_setstate(self: Any, state: tuple[Any, ...]) -> None:  # noqa: ANN401
+    for f, value in zip(dataclasses.fields(self), state):
+        # The same trick used by the __init__ of frozen dataclasses
+        object.__setattr__(self, f.name, value)
+
+
+def add_slots(cls: _C) -> _C:
+    """Recreate a dataclass with __slots__ for its fields.
+
+    This is the same as dataclass(slots=True) on python 3.10+. It must be
+    applied after (above) the dataclass decorator.
+
+    Instances of slotted classes have no __dict__, which saves a significant
+    amount of memory per instance.
+
+    Args:
+        cls: A dataclass.
+
+    Returns:
+        A new class with the same fields and methods, and __slots__.
+    """
+    cls_dict = dict(cls.__dict__)
+    field_names = tuple(f.name for f in dataclasses.fields(cls))
+    cls_dict["__slots__"] = field_names
+    # Class attributes for field defaults would conflict with the slot
+    # descriptors. The defaults are already baked into __init__
+    for name in field_names:
+        cls_dict.pop(name, None)
+    cls_dict.pop("__dict__", None)
+    cls_dict.pop("__weakref__", None)
+    # Default pickling of slotted objects uses setattr(), which fails for
+    # frozen dataclasses
+    if cls.__dataclass_params__.frozen:  # type: ignore[attr-defined]
+        cls_dict["__getstate__"] = _frozen_getstate
+        cls_dict["__setstate__"] = _frozen_setstate
+    new_cls: _C = type(cls)(cls.__name__, cls.__bases__, cls_dict)
+    new_cls.__qualname__ = cls.__qualname__
+    return new_cls
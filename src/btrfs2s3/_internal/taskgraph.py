@@ -0,0 +1,127 @@
+"""A minimal scheduler for running interdependent tasks on a thread pool."""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+import dataclasses
+from dataclasses import field
+import logging
+from typing import Callable
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+    from typing import Sequence
+
+_LOG = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(eq=False)
+class Task:
+    """A unit of work which may depend on other tasks.
+
+    Attributes:
+        name: A human-readable name for the task, for logging.
+        run: The function to run.
+        dependencies: Tasks which must complete successfully before this task
+            can run.
+    """
+
+    name: str
+    run: Callable[[], object]
+    dependencies: list[Task] = field(default_factory=list)
+
+
+def run_tasks(tasks: Sequence[Task], *, max_workers: int) -> None:
+    """Runs tasks on a thread pool, respecting dependencies.
+
+    Tasks are started in the order given, as soon as all their dependencies
+    have completed. At most max_workers tasks run at once.
+
+    If a task fails, any tasks which depend on it (directly or indirectly) are
+    skipped. Independent tasks still run. After all tasks have completed or
+    been skipped, the first error is raised.
+
+    Args:
+        tasks: The tasks to run. All dependencies must also be in this list.
+        max_workers: The maximum number of tasks to run at once.
+
+    Raises:
+        ValueError: If the dependencies can't all be satisfied.
+    """
+    _Scheduler(tasks).run(max_workers=max_workers)
+
+
+class _Scheduler:
+    def __init__(self, tasks: Sequence[Task]) -> None:
+        self._waiting_on = {task: set(task.dependencies) for task in tasks}
+        self._dependents: dict[Task, list[Task]] = defaultdict(list)
+        for task in tasks:
+            for dependency in task.dependencies:
+                if dependency not in self._waiting_on:
+                    msg = f"{task.name}: dependency {dependency.name} is not scheduled"
+                    raise ValueError(msg)
+                self._dependents[dependency].append(task)
+        # Tasks are started in the order they become ready
+        self._ready = deque(task for task in tasks if not self._waiting_on[task])
+        for task in self._ready:
+            del self._waiting_on[task]
+        self._running: dict[Future[object], Task] = {}
+        self._errors: list[BaseException] = []
+
+    def _skip(self, task: Task) -> None:
+        if self._waiting_on.pop(task, None) is None:
+            return
+        _LOG.warning("skipping %s, because a dependency failed", task.name)
+        for dependent in self._dependents[task]:
+            self._skip(dependent)
+
+    def _finish(self, task: Task, error: BaseException | None) -> None:
+        if error is not None:
+            _LOG.error("%s failed: %s", task.name, error)
+            self._errors.append(error)
+            for dependent in self._dependents[task]:
+                self._skip(dependent)
+            return
+        for dependent in self._dependents[task]:
+            waiting_on = self._waiting_on.get(dependent)
+            if waiting_on is not None:
+                waiting_on.discard(task)
+                if not waiting_on:
+                    del self._waiting_on[dependent]
+                    self._ready.append(dependent)
+
+    def _run(self, executor: ThreadPoolExecutor, max_workers: int) -> None:
+        while self._ready or self._running or self._waiting_on:
+            # Only submit what can run now, so an interruption doesn't have
+            # to wait for a queue of tasks
+            while self._ready and len(self._running) < max_workers:
+                task = self._ready.popleft()
+                self._running[executor.submit(task.run)] = task
+            if not self._running:
+                names = [t.name for t in self._waiting_on]
+                msg = f"cycle in task dependencies: {names}"
+                raise ValueError(msg)
+            done, _ = wait(self._running, return_when=FIRST_COMPLETED)
+            for future in done:
+                self._finish(self._running.pop(future), future.exception())
+
+    def run(self, *, max_workers: int) -> None:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            self._run(executor, max_workers)
+        except BaseException:
+            # This includes KeyboardInterrupt. Don't start anything else, and
+            # don't wait for running tasks, which can't be interrupted
+            for future in self._running:
+                future.cancel()
+            executor.shutdown(wait=False)
+            raise
+        executor.shutdown()
+
+        if self._errors:
+            raise self._errors[0]
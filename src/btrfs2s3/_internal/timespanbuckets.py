@@ -0,0 +1,289 @@
+"""Bulk computation of time spans for many timestamps at once.
+
+This gives the same results as calling timespans.iter_time_spans() for each
+timestamp, but is much faster for large arrays of timestamps when NumPy is
+installed. Without NumPy, it just calls iter_time_spans() for each
+timestamp.
+
+With NumPy, each timestamp is converted to local wall-clock time with a
+vectorized lookup into a table of UTC offsets. The table is built by probing
+the time zone once per day near the given timestamps, and bisecting any day
+in which the offset changes to find the exact transition. This relies on
+transitions being more than a day apart, which is true of every zone in the
+tz database (the closest are about four days apart).
+
+Wall-clock times are then reduced to buckets (the wall-clock start of a time
+span) with integer arithmetic. Each unique bucket is converted to a time
+span once, with timespans.iter_time_spans()'s memoized function. For days,
+hours, minutes and seconds far from any offset transition, time spans are
+instead computed with arithmetic, since there may be nearly as many unique
+buckets as timestamps.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import dataclasses
+from datetime import datetime
+from datetime import timedelta
+from typing import TYPE_CHECKING
+
+from btrfs2s3._internal.timespans import _get_span
+from btrfs2s3._internal.timespans import iter_time_spans
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    _HAVE_NUMPY = False
+else:
+    _HAVE_NUMPY = True
+
+if TYPE_CHECKING:
+    from datetime import tzinfo
+    from typing import Sequence
+
+    from numpy.typing import NDArray
+
+    from btrfs2s3._internal.timespans import _Bucket
+    from btrfs2s3._internal.timespans import Frame
+
+# Below this many timestamps, NumPy's overhead isn't worth it
+_NUMPY_THRESHOLD = 64
+
+_DAY = 86400
+# Time spans are only computed with arithmetic for timestamps at least this
+# far from any offset transition. This is more than the largest transition
+# (24 hours, in Pacific/Apia) plus twice the longest time span we compute this
+# way
+_CLEAN_MARGIN = 4 * _DAY
+
+# Frames whose time spans always have the same length in wall-clock time
+_FIXED_FRAME_SECONDS: dict[Frame, int] = {
+    "day": _DAY,
+    "hour": 3600,
+    "minute": 60,
+    "second": 1,
+}
+
+_EPOCH = datetime(1970, 1, 1)  # noqa: DTZ001
+_EPOCH_DATE = _EPOCH.date()
+
+
+@dataclasses.dataclass(frozen=True)
+class TimeSpanBuckets:
+    """The time spans of one frame which contain each of many timestamps.
+
+    Attributes:
+        time_spans: The distinct time spans which contain any of the
+            timestamps, in order of first appearance.
+        ids: For each timestamp, the index into time_spans of the time span
+            which contains it.
+    """
+
+    time_spans: list[tuple[float, float]]
+    ids: list[int]
+
+
+def _bucket_with_scalar(
+    timestamps: Sequence[float], tzinfo: tzinfo, frames: Sequence[Frame]
+) -> list[TimeSpanBuckets]:
+    indexes: list[dict[tuple[float, float], int]] = [{} for _ in frames]
+    ids: list[list[int]] = [[] for _ in frames]
+    for timestamp in timestamps:
+        for index, frame_ids, span in zip(
+            indexes, ids, iter_time_spans(timestamp, tzinfo, frames)
+        ):
+            frame_ids.append(index.setdefault(span, len(index)))
+    return [
+        TimeSpanBuckets(time_spans=list(index), ids=frame_ids)
+        for index, frame_ids in zip(indexes, ids)
+    ]
+
+
+class _IrregularOffsetError(Exception):
+    pass
+
+
+class _Offsets:
+    def __init__(self, tzinfo: tzinfo) -> None:
+        self._tzinfo = tzinfo
+        self._cache: dict[int, int] = {}
+
+    def get(self, second: int) -> int:
+        offset = self._cache.get(second)
+        if offset is None:
+            utcoffset = datetime.fromtimestamp(second, self._tzinfo).utcoffset()
+            if utcoffset is None or utcoffset % timedelta(seconds=1):
+                # Can't happen with ZoneInfo. The caller falls back to the
+                # scalar path
+                raise _IrregularOffsetError(utcoffset)
+            offset = self._cache[second] = utcoffset // timedelta(seconds=1)
+        return offset
+
+    def find_transition(self, start: int, end: int) -> int:
+        # Find the first second with the offset of end, assuming there is
+        # exactly one transition in between
+        lo, hi = start, end
+        before = self.get(lo)
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if self.get(mid) == before:
+                lo = mid
+            else:
+                hi = mid
+        return hi
+
+
+def _to_seconds(timestamps: NDArray[np.float64]) -> NDArray[np.int64]:
+    # Round to whole seconds the same way datetime.fromtimestamp() does: it
+    # rounds to microseconds (half to even), then takes the floor
+    frac, whole = np.modf(timestamps)
+    micros = np.round(frac * 1e6)
+    seconds = whole.astype(np.int64)
+    seconds += micros >= 1e6
+    seconds -= micros < 0
+    return seconds
+
+
+def _get_local(
+    tzinfo: tzinfo, seconds: NDArray[np.int64]
+) -> tuple[NDArray[np.int64], NDArray[np.int64], NDArray[np.int64]]:
+    # Returns the local wall-clock seconds, UTC offset and distance to the
+    # nearest transition of each timestamp
+    offsets = _Offsets(tzinfo)
+    margin_days = _CLEAN_MARGIN // _DAY
+    days = np.unique(seconds // _DAY)
+    days = np.unique((days[:, None] + np.arange(-margin_days, margin_days + 1)).ravel())
+    starts: list[int] = []
+    values: list[int] = []
+    transitions: list[int] = []
+    for day in days.tolist():
+        start = day * _DAY
+        starts.append(start)
+        values.append(offsets.get(start))
+        if offsets.get(start) != offsets.get(start + _DAY):
+            transition = offsets.find_transition(start, start + _DAY)
+            starts.append(transition)
+            values.append(offsets.get(transition))
+            transitions.append(transition)
+
+    index = np.searchsorted(np.array(starts, dtype=np.int64), seconds, "right") - 1
+    offset = np.array(values, dtype=np.int64)[index]
+
+    if transitions:
+        points = np.array(transitions, dtype=np.int64)
+        after = np.searchsorted(points, seconds)
+        next_point = points[np.minimum(after, len(points) - 1)]
+        prev_point = points[np.maximum(after - 1, 0)]
+        distance = np.minimum(
+            np.abs(next_point - seconds), np.abs(seconds - prev_point)
+        )
+    else:
+        distance = np.full(seconds.shape, _CLEAN_MARGIN + 1, dtype=np.int64)
+    return seconds + offset, offset, distance
+
+
+def _get_keys(frame: Frame, local: NDArray[np.int64]) -> NDArray[np.int64]:
+    if frame in _FIXED_FRAME_SECONDS:
+        return local // _FIXED_FRAME_SECONDS[frame]
+    if frame == "week":
+        # 1970-01-01 was a Thursday
+        return (local // _DAY + 3) // 7
+    months = local.astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+    if frame == "month":
+        return months
+    if frame == "quarter":
+        return months // 3
+    return months // 12
+
+
+def _key_to_bucket(frame: Frame, key: int) -> _Bucket:
+    if frame in _FIXED_FRAME_SECONDS:
+        dt = _EPOCH + timedelta(seconds=key * _FIXED_FRAME_SECONDS[frame])
+        return (dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second)
+    if frame == "week":
+        monday = _EPOCH_DATE + timedelta(days=key * 7 - 3)
+        return (monday.year, monday.month, monday.day, 0, 0, 0)
+    if frame == "month":
+        return (1970 + key // 12, key % 12 + 1, 1, 0, 0, 0)
+    if frame == "quarter":
+        return (1970 + key // 4, key % 4 * 3 + 1, 1, 0, 0, 0)
+    return (1970 + key, 1, 1, 0, 0, 0)
+
+
+def _bucket_frame(
+    tzinfo: tzinfo,
+    frame: Frame,
+    local: NDArray[np.int64],
+    offset: NDArray[np.int64],
+    clean: NDArray[np.bool_],
+) -> TimeSpanBuckets:
+    keys = _get_keys(frame, local)
+    unique_keys, first, inverse = np.unique(
+        keys, return_index=True, return_inverse=True
+    )
+    # Put buckets in order of first appearance, like the scalar path
+    order = np.argsort(first, kind="stable")
+    unique_keys = unique_keys[order]
+    first = first[order]
+
+    # np.unique's inverse indexes the sorted keys; map it through our
+    # reordering
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    ids = rank[inverse.ravel()]
+
+    length = _FIXED_FRAME_SECONDS.get(frame)
+    if length is not None:
+        starts = (unique_keys * length - offset[first]).astype(np.float64)
+        ends = starts + length
+        # Compute time spans near transitions the slow way
+        need_span = np.flatnonzero(~clean[first])
+    else:
+        starts = np.empty(len(unique_keys), dtype=np.float64)
+        ends = np.empty(len(unique_keys), dtype=np.float64)
+        need_span = np.arange(len(unique_keys))
+    for i, key in zip(need_span.tolist(), unique_keys[need_span].tolist()):
+        starts[i], ends[i] = _get_span(tzinfo, frame, _key_to_bucket(frame, key))
+
+    spans = list(zip(starts.tolist(), ends.tolist()))
+    if len(np.unique(starts)) == len(starts):
+        return TimeSpanBuckets(time_spans=spans, ids=ids.tolist())
+    # Some distinct buckets have the same time span. This shouldn't happen,
+    # but the scalar path would merge them, so we do too
+    index: dict[tuple[float, float], int] = {}
+    remap = [index.setdefault(span, len(index)) for span in spans]
+    return TimeSpanBuckets(
+        time_spans=list(index), ids=np.array(remap, dtype=np.int64)[ids].tolist()
+    )
+
+
+def _bucket_with_numpy(
+    timestamps: Sequence[float], tzinfo: tzinfo, frames: Sequence[Frame]
+) -> list[TimeSpanBuckets]:
+    seconds = _to_seconds(np.asarray(timestamps, dtype=np.float64))
+    local, offset, distance = _get_local(tzinfo, seconds)
+    clean = distance > _CLEAN_MARGIN
+    return [_bucket_frame(tzinfo, frame, local, offset, clean) for frame in frames]
+
+
+def bucket_time_spans(
+    timestamps: Sequence[float], tzinfo: tzinfo, frames: Sequence[Frame]
+) -> list[TimeSpanBuckets]:
+    """Computes the time spans of several frames for many timestamps.
+
+    The result is the same as calling iter_time_spans() for each timestamp,
+    but grouped by frame and by time span.
+
+    Args:
+        timestamps: The timestamps to query.
+        tzinfo: The time zone in which to compute time spans.
+        frames: The frames of time spans to compute.
+
+    Returns:
+        A TimeSpanBuckets for each frame, in the same order as frames.
+    """
+    if _HAVE_NUMPY and len(timestamps) >= _NUMPY_THRESHOLD:
+        with contextlib.suppress(_IrregularOffsetError):
+            return _bucket_with_numpy(timestamps, tzinfo, frames)
+    return _bucket_with_scalar(timestamps, tzinfo, frames)
@@ -0,0 +1,149 @@
+"""Fast computation of human-friendly time spans.
+
+This computes the same time spans as Arrow.span() (with bounds="[]") would
+for the Arrow at a given timestamp, but works with builtin datetime objects
+and memoizes results, since many timestamps fall into the same year, month,
+day and so on. This matters because the preservation logic computes the time
+spans of every snapshot and backup on every run.
+
+Arrow's behavior is reproduced exactly, including its handling of times that
+don't exist (in a DST gap) or are ambiguous (in a DST overlap). In
+particular, the start of a time span is always computed with fold=0, and the
+end of a time span is moved forward past any DST gap it falls into.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+import functools
+from typing import Literal
+from typing import Tuple
+from typing import TYPE_CHECKING
+
+from typing_extensions import TypeAlias
+
+if TYPE_CHECKING:
+    from datetime import tzinfo
+    from typing import Iterable
+    from typing import Iterator
+
+Frame: TypeAlias = Literal[
+    "year", "quarter", "month", "week", "day", "hour", "minute", "second"
+]
+"""The type of a time span, in the same terms as Arrow.span()."""
+
+FRAMES: tuple[Frame, ...] = (
+    "year",
+    "quarter",
+    "month",
+    "week",
+    "day",
+    "hour",
+    "minute",
+    "second",
+)
+"""All supported frames, in descending order of length."""
+
+# The wall-clock start of a time span, as (year, month, day, hour, minute,
+# second)
+_Bucket: TypeAlias = Tuple[int, int, int, int, int, int]
+
+_CACHE_SIZE = 2**14
+
+_DELTAS: dict[Frame, timedelta] = {
+    "week": timedelta(days=7),
+    "day": timedelta(days=1),
+    "hour": timedelta(hours=1),
+    "minute": timedelta(minutes=1),
+    "second": timedelta(seconds=1),
+}
+
+
+def _exists(dt: datetime) -> bool:
+    # A wall time exists if it survives a round trip through UTC. This is
+    # the same as dateutil.tz.datetime_exists(), which Arrow uses
+    naive = dt.replace(tzinfo=None)
+    round_trip = dt.astimezone(timezone.utc).astimezone(dt.tzinfo)
+    return round_trip.replace(tzinfo=None) == naive
+
+
+def _resolve_imaginary(dt: datetime) -> datetime:
+    # The same as dateutil.tz.resolve_imaginary(): move a time in a DST gap
+    # forward by the size of the gap
+    if _exists(dt):
+        return dt
+    after = (dt + timedelta(hours=24)).utcoffset()
+    before = (dt - timedelta(hours=24)).utcoffset()
+    if after is None or before is None:
+        raise AssertionError
+    return dt + (after - before)
+
+
+def _add_months(dt: datetime, months: int) -> datetime:
+    # Only called on the start of a month, so the day never needs clamping.
+    # Adding a zero timedelta normalizes fold to 0, as relativedelta does
+    index = dt.month - 1 + months
+    return dt.replace(year=dt.year + index // 12, month=index % 12 + 1) + timedelta()
+
+
+def _get_bucket(local: datetime, frame: Frame) -> _Bucket:
+    if frame == "year":
+        return (local.year, 1, 1, 0, 0, 0)
+    if frame == "quarter":
+        return (local.year, local.month - (local.month - 1) % 3, 1, 0, 0, 0)
+    if frame == "month":
+        return (local.year, local.month, 1, 0, 0, 0)
+    if frame == "week":
+        monday = local.date() - timedelta(days=local.weekday())
+        return (monday.year, monday.month, monday.day, 0, 0, 0)
+    if frame == "day":
+        return (local.year, local.month, local.day, 0, 0, 0)
+    if frame == "hour":
+        return (local.year, local.month, local.day, local.hour, 0, 0)
+    if frame == "minute":
+        return (local.year, local.month, local.day, local.hour, local.minute, 0)
+    return (local.year, local.month, local.day, local.hour, local.minute, local.second)
+
+
+@functools.lru_cache(maxsize=_CACHE_SIZE)
+def _get_span(tzinfo: tzinfo, frame: Frame, bucket: _Bucket) -> tuple[float, float]:
+    year, month, day, hour, minute, second = bucket
+    start = datetime(year, month, day, hour, minute, second, tzinfo=tzinfo)
+    # Arrow computes these frames by shifting from another start time, and
+    # its shift() resolves imaginary times
+    if frame in ("week", "quarter"):
+        start = _resolve_imaginary(start)
+    if frame == "year":
+        end = _add_months(start, 12)
+    elif frame == "quarter":
+        end = _add_months(start, 3)
+    elif frame == "month":
+        end = _add_months(start, 1)
+    else:
+        end = start + _DELTAS[frame]
+    end = _resolve_imaginary(end)
+    return start.timestamp(), end.timestamp()
+
+
+def iter_time_spans(
+    timestamp: float, tzinfo: tzinfo, frames: Iterable[Frame]
+) -> Iterator[tuple[float, float]]:
+    """Yields the time spans of several frames which contain a timestamp.
+
+    For each frame, this yields the same result as
+    convert_span(arrow.get(timestamp, tzinfo=tzinfo).span(frame, bounds="[]")).
+
+    Args:
+        timestamp: A timestamp.
+        tzinfo: The time zone in which to compute time spans.
+        frames: The frames of time spans to yield, in the order they should be
+            yielded.
+
+    Yields:
+        (timestamp, timestamp) time span tuples.
+    """
+    local = datetime.fromtimestamp(timestamp, tzinfo)
+    for frame in frames:
+        yield _get_span(tzinfo, frame, _get_bucket(local, frame))
@@ -2,8 +2,7 @@ from __future__ import annotations
 
 from enum import IntFlag
 
-from btrfsutil import SubvolumeInfo
-
+from btrfs2s3._internal.btrfsioctl import SubvolumeInfo
 from btrfs2s3.backups import BackupInfo
 
 NULL_UUID = b"\0" * 16
@@ -29,23 +28,22 @@ def mksubvol(
     rtime: float = 0.0,
 ) -> SubvolumeInfo:
     return SubvolumeInfo(
-        (
-            id,
-            parent_id,
-            dir_id,
-            flags,
-            uuid,
-            parent_uuid,
-            received_uuid,
-            generation,
-            ctransid,
-            otransid,
-            stransid,
-            rtransid,
-            ctime,
-            otime,
-        ),
-        {"stime": stime, "rtime": rtime},
+        id=id,
+        parent_id=parent_id,
+        dir_id=dir_id,
+        flags=flags,
+        uuid=uuid,
+        parent_uuid=parent_uuid,
+        received_uuid=received_uuid,
+        generation=generation,
+        ctransid=ctransid,
+        otransid=otransid,
+        stransid=stransid,
+        rtransid=rtransid,
+        ctime=ctime,
+        otime=otime,
+        stime=stime,
+        rtime=rtime,
     )
 
 
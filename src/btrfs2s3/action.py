@@ -2,27 +2,56 @@
 
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
 import dataclasses
-from itertools import chain
+import fcntl
+from functools import partial
 import logging
+import random
 from subprocess import PIPE
 from subprocess import Popen
+import threading
+import time
+from typing import cast
 from typing import TYPE_CHECKING
 
-import btrfsutil
+from botocore.exceptions import ClientError
 
+from btrfs2s3._internal import btrfsioctl
+from btrfs2s3._internal.taskgraph import run_tasks
+from btrfs2s3._internal.taskgraph import Task
 from btrfs2s3._internal.util import NULL_UUID
 from btrfs2s3._internal.util import SubvolumeFlags
+from btrfs2s3.compress import compress_stream
+from btrfs2s3.sendstream import COMPRESSED_DATA_ARGS
+from btrfs2s3.sendstream import estimate_send_size
+from btrfs2s3.sendstream import InvalidStreamError
+from btrfs2s3.tee import Tee
 from btrfs2s3.thunk import Thunk
 from btrfs2s3.thunk import ThunkArg
+from btrfs2s3.upload import AutoUploadParams
+from btrfs2s3.upload import upload_stream
 
 if TYPE_CHECKING:
+    from concurrent.futures import Future
+    from io import BufferedReader
     from pathlib import Path
+    from typing import IO
     from typing import Iterator
     from typing import Sequence
 
     from mypy_boto3_s3.client import S3Client
 
+    from btrfs2s3._internal.btrfsioctl import SubvolumeInfo
+    from btrfs2s3.checkpoint import UploadCheckpoint
+    from btrfs2s3.checkpoint import UploadCheckpoints
+    from btrfs2s3.compress import CompressParams
+    from btrfs2s3.tee import TeeBranch
+    from btrfs2s3.upload import SupportsReadinto
+    from btrfs2s3.upload import Throttle
+    from btrfs2s3.upload import UploadParams
+
 _LOG = logging.getLogger(__name__)
 
 
@@ -34,7 +63,21 @@ def create_snapshot(*, source: Path, path: Path) -> None:
         path: The path at which to create a read-only snapshot.
     """
     _LOG.info("creating read-only snapshot of %s at %s", source, path)
-    btrfsutil.create_snapshot(source, path, read_only=True)
+    btrfsioctl.create_snapshot(source, path, read_only=True)
+
+
+def _check_deletable(path: Path, info: SubvolumeInfo | None) -> None:
+    # Do some extra checks to make sure we only ever delete read-only
+    # snapshots, not source subvolumes.
+    if info is None:
+        msg = f"target isn't a subvolume: {path}"
+        raise RuntimeError(msg)
+    if info.parent_uuid == NULL_UUID:
+        msg = f"target isn't a snapshot: {path}"
+        raise RuntimeError(msg)
+    if not info.flags & SubvolumeFlags.ReadOnly:
+        msg = f"target isn't a read-only snapshot: {path}"
+        raise RuntimeError(msg)
 
 
 def delete_snapshot(path: Path) -> None:
@@ -47,20 +90,59 @@ def delete_snapshot(path: Path) -> None:
         RuntimeError: If one of the arguments does not refer to a read-only
             snapshot of a subvolume.
     """
-    # Do some extra checks to make sure we only ever delete read-only
-    # snapshots, not source subvolumes.
-    if not btrfsutil.is_subvolume(path):
-        msg = "target isn't a subvolume"
-        raise RuntimeError(msg)
-    info = btrfsutil.subvolume_info(path)
-    if info.parent_uuid == NULL_UUID:
-        msg = "target isn't a snapshot"
-        raise RuntimeError(msg)
-    if not info.flags & SubvolumeFlags.ReadOnly:
-        msg = "target isn't a read-only snapshot"
-        raise RuntimeError(msg)
+    _check_deletable(
+        path, btrfsioctl.subvolume_info(path) if btrfsioctl.is_subvolume(path) else None
+    )
     _LOG.info("deleting read-only snapshot %s", path)
-    btrfsutil.delete_subvolume(path)
+    btrfsioctl.delete_subvolume(path)
+
+
+def delete_snapshots(paths: Sequence[Path], *, wait_for_commit: bool = False) -> None:
+    """Delete many read-only snapshots at once.
+
+    All the targets are checked before any are deleted, by listing the
+    subvolumes in each of their parent directories. Then they are deleted
+    without waiting for any transaction commits. If wait_for_commit is True,
+    we then commit and wait, like `btrfs subvolume delete --commit-after`.
+
+    The time taken by each phase is logged.
+
+    Args:
+        paths: The paths to read-only snapshots to be deleted.
+        wait_for_commit: Whether to wait for the deletions to be committed.
+
+    Raises:
+        RuntimeError: If any of the paths does not refer to a read-only
+            snapshot of a subvolume. In this case, nothing is deleted.
+    """
+    start = time.monotonic()
+    parents = {path.parent for path in paths}
+    infos = {
+        path: info
+        for parent in parents
+        for path, info in btrfsioctl.list_subvolumes(parent, recursive=False)
+    }
+    for path in paths:
+        _check_deletable(path, infos.get(path))
+    checked = time.monotonic()
+    _LOG.info("checked %d snapshots in %.3fs", len(paths), checked - start)
+
+    for path in paths:
+        _LOG.info("deleting read-only snapshot %s", path)
+        btrfsioctl.delete_subvolume(path)
+    _LOG.info("deleted %d snapshots in %.3fs", len(paths), time.monotonic() - checked)
+
+    if wait_for_commit:
+        _commit_deletions(paths)
+
+
+def _commit_deletions(paths: Sequence[Path]) -> None:
+    if not paths:
+        return
+    start = time.monotonic()
+    for parent in {path.parent for path in paths}:
+        btrfsioctl.sync(parent)
+    _LOG.info("committed deletions in %.3fs", time.monotonic() - start)
 
 
 def rename_snapshot(*, source: Path, target: Path) -> None:
@@ -74,6 +156,191 @@ def rename_snapshot(*, source: Path, target: Path) -> None:
     source.rename(target)
 
 
+# The size of the buffer used to feed compressed data to pipe_through
+_COPY_BUFFER_SIZE = 2**20
+# The size to which we enlarge pipes. Linux's default is 64 KiB, so filling a
+# part buffer takes one read() per 64 KiB, and the writer is woken up just as
+# often. This is the default maximum for unprivileged users
+_PIPE_SIZE = 2**20
+# fcntl.F_SETPIPE_SZ is only defined on python 3.10+
+_F_SETPIPE_SZ = getattr(fcntl, "F_SETPIPE_SZ", 1031)
+
+
+def _enlarge_pipe(pipe: IO[bytes]) -> None:
+    # Not fatal if this fails, for example if the user has exceeded
+    # /proc/sys/fs/pipe-user-pages-soft
+    with contextlib.suppress(OSError):
+        fcntl.fcntl(pipe.fileno(), _F_SETPIPE_SZ, _PIPE_SIZE)
+
+
+def _copy_stream(source: SupportsReadinto, dest: IO[bytes]) -> None:
+    buffer = memoryview(bytearray(_COPY_BUFFER_SIZE))
+    try:
+        while True:
+            count = source.readinto(buffer)
+            if not count:
+                break
+            dest.write(buffer[:count])
+    except BrokenPipeError:
+        # The command exited early. Its exit code will be reported instead
+        pass
+    finally:
+        with contextlib.suppress(BrokenPipeError):
+            dest.close()
+
+
+class _Pipeline:
+    # btrfs send, then optionally in-process compression, then the pipe_through
+    # commands
+    def __init__(
+        self,
+        send_args: Sequence[str | Path],
+        pipe_through: Sequence[Sequence[str]],
+        compress: CompressParams | None,
+    ) -> None:
+        self._processes: list[Popen[bytes]] = []
+        # Popen with the default bufsize gives a BufferedReader, which we need
+        # for reading into part buffers
+        send_stdout = cast("BufferedReader | None", self._start(send_args).stdout)
+        # https://github.com/python/typeshed/issues/3831
+        assert send_stdout is not None  # noqa: S101
+        self._send_stdout = send_stdout
+        self.output: SupportsReadinto = send_stdout
+        if compress is not None:
+            self.output = compress_stream(send_stdout, compress)
+
+        self._executor: ThreadPoolExecutor | None = None
+        self._feeder: Future[None] | None = None
+        for args in pipe_through:
+            prev_stdout = self._processes[-1].stdout
+            if compress is not None and self._feeder is None:
+                # Compress before pipe_through, which may encrypt. The
+                # compressed stream is fed to the first command from a thread
+                process = self._start(args, stdin=PIPE)
+                assert process.stdin is not None  # noqa: S101
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="compress"
+                )
+                self._feeder = self._executor.submit(
+                    _copy_stream, self.output, process.stdin
+                )
+            else:
+                process = self._start(args, stdin=prev_stdout)
+                # https://docs.python.org/3/library/subprocess.html#replacing-shell-pipeline
+                if prev_stdout:
+                    prev_stdout.close()
+            self.output = cast("BufferedReader", process.stdout)
+
+    def _start(
+        self, args: Sequence[str | Path], stdin: int | IO[bytes] | None = None
+    ) -> Popen[bytes]:
+        process = Popen(args, stdin=stdin, stdout=PIPE)  # noqa: S603
+        for pipe in (process.stdin, process.stdout):
+            if pipe is not None:
+                _enlarge_pipe(pipe)
+        self._processes.append(process)
+        return process
+
+    def close(self) -> None:
+        cast("BufferedReader", self._processes[-1].stdout).close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        self._send_stdout.close()
+
+    def wait(self) -> BaseException | None:
+        # Returns the first error from any stage
+        error = self._feeder.exception() if self._feeder is not None else None
+        # reverse order to match the semantics of pipefail
+        for process in reversed(self._processes):
+            if process.wait() != 0 and error is None:
+                msg = f"{process.args!r}: exited with code {process.returncode}"
+                error = RuntimeError(msg)
+        return error
+
+
+@dataclasses.dataclass(frozen=True)
+class Mirror:
+    """Another S3 bucket which gets a copy of every backup.
+
+    Attributes:
+        s3: An S3 client for the bucket.
+        bucket: The name of the bucket.
+        throttle: A bandwidth limit for uploads to the bucket.
+        checkpoints: Checkpoints with which to resume interrupted uploads to
+            the bucket.
+    """
+
+    s3: S3Client
+    bucket: str
+    throttle: Throttle | None = None
+    checkpoints: UploadCheckpoints | None = None
+
+
+@dataclasses.dataclass(frozen=True)
+class _Destination:
+    s3: S3Client
+    bucket: str
+    throttle: Throttle | None
+    checkpoint: UploadCheckpoint | None
+
+
+def _upload_branch(
+    dest: _Destination, key: str, branch: TeeBranch, params: UploadParams
+) -> None:
+    try:
+        upload_stream(
+            dest.s3,
+            dest.bucket,
+            key,
+            branch,
+            params=params,
+            throttle=dest.throttle,
+            checkpoint=dest.checkpoint,
+        )
+    finally:
+        # Don't make the other branches wait for this one
+        branch.close()
+
+
+def _upload_to_all(
+    destinations: Sequence[_Destination],
+    key: str,
+    stream: SupportsReadinto,
+    params: UploadParams,
+) -> None:
+    if len(destinations) == 1:
+        # Read straight into the part buffers
+        (dest,) = destinations
+        upload_stream(
+            dest.s3,
+            dest.bucket,
+            key,
+            stream,
+            params=params,
+            throttle=dest.throttle,
+            checkpoint=dest.checkpoint,
+        )
+        return
+    tee = Tee(stream, len(destinations))
+    with ThreadPoolExecutor(
+        max_workers=len(destinations) + 1, thread_name_prefix="tee"
+    ) as executor:
+        executor.submit(tee.run)
+        futures = [
+            executor.submit(_upload_branch, dest, key, branch, params)
+            for dest, branch in zip(destinations, tee.branches)
+        ]
+    errors = [future.exception() for future in futures]
+    for error in errors:
+        if error is not None:
+            # A backup is only kept if it reached every destination, so that
+            # the destinations don't diverge
+            for dest, dest_error in zip(destinations, errors):
+                if dest_error is None:
+                    delete_backups(dest.s3, dest.bucket, key)
+            raise error
+
+
 def create_backup(  # noqa: PLR0913
     *,
     s3: S3Client,
@@ -82,12 +349,45 @@ def create_backup(  # noqa: PLR0913
     send_parent: Path | None,
     key: str,
     pipe_through: Sequence[Sequence[str]] = (),
+    upload_params: UploadParams | AutoUploadParams | None = None,
+    throttle: Throttle | None = None,
+    estimated_size: int | None = None,
+    compress: CompressParams | None = None,
+    compressed_data: bool = False,
+    checkpoint: UploadCheckpoint | None = None,
+    mirrors: Sequence[Mirror] = (),
 ) -> None:
     """Stores a btrfs archive in S3.
 
     This will spawn "btrfs -q send" as a subprocess, as there is currently no way
     to create a btrfs-send stream via pure python.
 
+    The archive is streamed to S3 with upload_stream(), so memory usage is
+    bounded regardless of the archive size.
+
+    With AutoUploadParams, the part size is chosen according to the estimated
+    size of the archive. If estimated_size isn't given, it's first estimated
+    with "btrfs send --no-data".
+
+    If compress is given, the archive is compressed in-process before it's
+    piped through any commands, so that commands like encryption still see
+    the compressed stream. Without pipe_through, compressed data is read
+    straight into the upload's part buffers. The key should end with
+    compress.suffix.
+
+    If compressed_data is True, "btrfs send --proto 2 --compressed-data" is
+    used, so compressed extents are sent without being decompressed. The key
+    should end with COMPRESSED_DATA_SUFFIX. Check supports_compressed_data()
+    first.
+
+    If checkpoint is given, an interrupted upload is left in place to be
+    resumed by a later call with the same key. See upload_stream().
+
+    If mirrors are given, the archive is also stored in each of them, with
+    the same key. The archive is only created once, and uploaded to all
+    buckets at once. If the upload to any bucket fails, the archive is
+    deleted from all of them.
+
     Args:
         s3: An S3 client.
         bucket: The bucket in which to store the archive.
@@ -97,71 +397,277 @@ def create_backup(  # noqa: PLR0913
         key: The S3 object key.
         pipe_through: A sequence of shell commands through which the archive
             should be piped before uploading.
+        upload_params: Parameters for the streaming upload. If None,
+            AutoUploadParams() will be used.
+        throttle: A bandwidth limit for the upload, possibly shared with
+            other uploads.
+        estimated_size: A previously-computed result of estimate_send_size()
+            for this snapshot and send_parent.
+        compress: Parameters for compressing the archive, or None to not
+            compress it.
+        compressed_data: Whether to send compressed extents as-is.
+        checkpoint: A checkpoint with which to resume an interrupted upload.
+        mirrors: Other buckets in which to store the archive.
     """
     _LOG.info(
         "creating backup of %s (%s)",
         snapshot,
         f"delta from {send_parent}" if send_parent else "full",
     )
+    if upload_params is None:
+        upload_params = AutoUploadParams()
+    if isinstance(upload_params, AutoUploadParams):
+        if estimated_size is None:
+            estimated_size = estimate_send_size(
+                snapshot=snapshot, send_parent=send_parent
+            )
+        upload_params = upload_params.choose(estimated_size)
+        _LOG.info(
+            "estimated backup size %d bytes, using part size %d, concurrency %d",
+            estimated_size,
+            upload_params.part_size,
+            upload_params.concurrency,
+        )
     send_args: list[str | Path] = ["btrfs", "send", "-q"]
+    if compressed_data:
+        send_args += COMPRESSED_DATA_ARGS
     if send_parent is not None:
         send_args += ["-p", send_parent]
     send_args += [snapshot]
 
-    pipeline: list[Popen[bytes]] = []
-    for args in chain((send_args,), pipe_through):
-        prev_stdout = pipeline[-1].stdout if pipeline else None
-        pipeline.append(Popen(args, stdin=prev_stdout, stdout=PIPE))  # noqa: S603
-        # https://docs.python.org/3/library/subprocess.html#replacing-shell-pipeline
-        if prev_stdout:
-            prev_stdout.close()
-
-    pipeline_stdout = pipeline[-1].stdout
-    # https://github.com/python/typeshed/issues/3831
-    assert pipeline_stdout is not None  # noqa: S101
+    destinations = [
+        _Destination(s3=s3, bucket=bucket, throttle=throttle, checkpoint=checkpoint),
+        *(
+            _Destination(
+                s3=mirror.s3,
+                bucket=mirror.bucket,
+                throttle=mirror.throttle,
+                checkpoint=(
+                    mirror.checkpoints.get(key) if mirror.checkpoints else None
+                ),
+            )
+            for mirror in mirrors
+        ),
+    ]
+    pipeline = _Pipeline(send_args, pipe_through, compress)
     try:
-        s3.upload_fileobj(pipeline_stdout, bucket, key)
+        _upload_to_all(destinations, key, pipeline.output, upload_params)
     finally:
         # Allow the pipeline to fail if the upload fails
-        pipeline_stdout.close()
-
-    # reverse order to match the semantics of pipefail
-    for process in reversed(pipeline):
-        if process.wait() != 0:
-            msg = f"{process.args!r}: exited with code {process.returncode}"
-            try:
-                raise RuntimeError(msg)
-            finally:
-                # Assume the backup is corrupted
-                delete_backups(s3, bucket, key)
-
-
-def delete_backups(s3: S3Client, bucket: str, *keys: str) -> None:
+        pipeline.close()
+
+    error = pipeline.wait()
+    if error is not None:
+        try:
+            raise error
+        finally:
+            # Assume the backup is corrupted
+            for dest in destinations:
+                delete_backups(dest.s3, dest.bucket, key)
+
+
+# The maximum number of keys in one DeleteObjects request
+_DELETE_BATCH_SIZE = 1000
+_DELETE_CONCURRENCY = 8
+_DELETE_MAX_ATTEMPTS = 8
+_DELETE_BACKOFF_BASE = 0.1
+_DELETE_BACKOFF_MAX = 10.0
+# Error codes for which a retry may succeed
+_RETRYABLE_CODES = frozenset(
+    {"SlowDown", "ServiceUnavailable", "InternalError", "RequestTimeout"}
+)
+# Error codes which mean we should slow down
+_THROTTLING_CODES = frozenset({"SlowDown", "ServiceUnavailable"})
+
+
+class _AdaptiveLimit:
+    # Limits the number of concurrent requests, with additive increase and
+    # multiplicative decrease when the server asks us to slow down
+    def __init__(self, maximum: int) -> None:
+        self._maximum = maximum
+        self.limit = maximum
+        self._active = 0
+        self._cond = threading.Condition()
+
+    @contextlib.contextmanager
+    def acquire(self) -> Iterator[None]:
+        with self._cond:
+            self._cond.wait_for(lambda: self._active < self.limit)
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    def throttled(self) -> None:
+        with self._cond:
+            self.limit = max(1, self.limit // 2)
+
+    def succeeded(self) -> None:
+        with self._cond:
+            if self.limit < self._maximum:
+                self.limit += 1
+                self._cond.notify_all()
+
+
+def _try_delete_objects(
+    s3: S3Client, bucket: str, keys: Sequence[str]
+) -> dict[str, tuple[str, str]]:
+    # Returns the error code and message for each key which wasn't deleted
+    try:
+        response = s3.delete_objects(
+            Bucket=bucket,
+            Delete={"Quiet": True, "Objects": [{"Key": key} for key in keys]},
+        )
+    except ClientError as ex:
+        # botocore already retried this request, but we can wait longer
+        code = ex.response.get("Error", {}).get("Code", "")
+        if code not in _RETRYABLE_CODES:
+            raise
+        return {key: (code, str(ex)) for key in keys}
+    return {
+        error.get("Key", ""): (error.get("Code", ""), error.get("Message", ""))
+        for error in response.get("Errors", [])
+    }
+
+
+def _delete_batch(
+    s3: S3Client, bucket: str, batch: Sequence[str], *, limit: _AdaptiveLimit
+) -> dict[str, str]:
+    # Returns the keys which couldn't be deleted, with their errors
+    failed: dict[str, str] = {}
+    retryable: dict[str, str] = {}
+    pending = list(batch)
+    for attempt in range(_DELETE_MAX_ATTEMPTS):
+        if attempt:
+            _LOG.debug("retrying deletion of %d keys", len(pending))
+            backoff = min(_DELETE_BACKOFF_MAX, _DELETE_BACKOFF_BASE * 2**attempt)
+            time.sleep(random.uniform(0, backoff))  # noqa: S311
+        with limit.acquire():
+            errors = _try_delete_objects(s3, bucket, pending)
+        if any(code in _THROTTLING_CODES for code, _ in errors.values()):
+            limit.throttled()
+        else:
+            limit.succeeded()
+        retryable = {}
+        for key, (code, message) in errors.items():
+            if code in _RETRYABLE_CODES:
+                retryable[key] = f"{code}: {message}"
+            else:
+                failed[key] = f"{code}: {message}"
+        pending = list(retryable)
+        if not pending:
+            break
+    failed.update(retryable)
+    return failed
+
+
+def delete_backups(
+    s3: S3Client, bucket: str, *keys: str, max_concurrency: int = _DELETE_CONCURRENCY
+) -> None:
     """Batch delete backups from S3.
 
     This will use the DeleteObjects API call, which can delete multiple keys in
-    batches.
+    batches. Batches are sent concurrently.
+
+    DeleteObjects may fail to delete individual keys. Keys which failed with a
+    transient error are retried with exponential backoff. If the server asks
+    us to slow down, we reduce the number of concurrent requests.
 
     Args:
         s3: An S3 client.
         bucket: The bucket from which to delete keys.
         *keys: The keys to delete.
+        max_concurrency: The maximum number of DeleteObjects requests to send
+            at once.
+
+    Raises:
+        RuntimeError: If some keys couldn't be deleted. All other keys are
+            still deleted.
     """
+    if not keys:
+        return
+    for key in keys:
+        _LOG.info("deleting backup %s", key)
+    batches = [
+        keys[i : i + _DELETE_BATCH_SIZE]
+        for i in range(0, len(keys), _DELETE_BATCH_SIZE)
+    ]
+    limit = _AdaptiveLimit(max_concurrency)
+    errors: dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        for batch_errors in executor.map(
+            partial(_delete_batch, s3, bucket, limit=limit), batches
+        ):
+            errors.update(batch_errors)
+    if errors:
+        for key, error in errors.items():
+            _LOG.error("failed to delete %s: %s", key, error)
+        msg = f"failed to delete {len(errors)} backups"
+        raise RuntimeError(msg)
 
-    def batches() -> Iterator[tuple[str, ...]]:
-        for i in range(0, len(keys), 1000):
-            yield keys[i : i + 1000]
-
-    for batch in batches():
-        for key in batch:
-            _LOG.info("deleting backup %s", key)
-        # Do we need to inspect the response for individual errors, or will we
-        # raise an exception in this case? The docs are thousands of words long
-        # but don't explain this
-        s3.delete_objects(
-            Bucket=bucket,
-            Delete={"Quiet": True, "Objects": [{"Key": key} for key in batch]},
+
+def _try_estimate_send_size(snapshot: Path, send_parent: Path | None) -> int | None:
+    try:
+        return estimate_send_size(snapshot=snapshot, send_parent=send_parent)
+    except (RuntimeError, InvalidStreamError):
+        # Let create_backup() raise the error in context
+        _LOG.warning("couldn't estimate size of backup of %s", snapshot, exc_info=True)
+        return None
+
+
+def _estimate_send_sizes(
+    snapshots: Sequence[tuple[Path, Path | None]], *, max_workers: int
+) -> list[int | None]:
+    sizes: list[int | None] = [None] * len(snapshots)
+
+    def estimate(i: int, snapshot: Path, send_parent: Path | None) -> None:
+        sizes[i] = _try_estimate_send_size(snapshot, send_parent)
+
+    # run_tasks() only starts what can run now, so an interruption doesn't
+    # wait for estimates of every remaining snapshot
+    run_tasks(
+        [
+            Task(
+                name=f"estimate of backup size of {snapshot}",
+                run=partial(estimate, i, snapshot, send_parent),
+            )
+            for i, (snapshot, send_parent) in enumerate(snapshots)
+        ],
+        max_workers=max_workers,
+    )
+    return sizes
+
+
+def _make_delete_snapshot_tasks(
+    paths: Sequence[Path], tasks_using_snapshot: dict[Path, list[Task]]
+) -> list[Task]:
+    # Snapshots which aren't needed by any new backup are deleted in one
+    # batch. The rest are deleted as soon as their backups are complete. The
+    # caller commits all deletions at once, at the end
+    tasks = []
+    batch: list[Path] = []
+    for path in paths:
+        if path not in tasks_using_snapshot:
+            batch.append(path)
+            continue
+        tasks.append(
+            Task(
+                name=f"deletion of {path}",
+                run=partial(delete_snapshots, [path]),
+                dependencies=tasks_using_snapshot[path],
+            )
         )
+    if batch:
+        tasks.append(
+            Task(
+                name=f"deletion of {len(batch)} snapshots",
+                run=partial(delete_snapshots, batch),
+            )
+        )
+    return tasks
 
 
 # Future: all the fields of the intent objects should really be
@@ -335,13 +841,25 @@ class Actions:
         """Iterates all the DeleteBackup intents."""
         yield from sorted(self._delete_backups)
 
-    def execute(
-        self, s3: S3Client, bucket: str, pipe_through: Sequence[Sequence[str]] = ()
+    def execute(  # noqa: PLR0913
+        self,
+        s3: S3Client,
+        bucket: str,
+        pipe_through: Sequence[Sequence[str]] = (),
+        *,
+        upload_params: UploadParams | AutoUploadParams | None = None,
+        max_concurrent_backups: int = 1,
+        throttle: Throttle | None = None,
+        wait_for_commit: bool = False,
+        compress: CompressParams | None = None,
+        compressed_data: bool = False,
+        checkpoints: UploadCheckpoints | None = None,
+        mirrors: Sequence[Mirror] = (),
     ) -> None:
         """Executes the intended actions.
 
         This performs all the side effects described in the various intent
-        objects. It will create/rename/delete snapshots using btrfsutil, and
+        objects. It will create/rename/delete snapshots using btrfs ioctls, and
         create/delete backups in the supplied S3 bucket.
 
         The actions are performed in the following order:
@@ -352,16 +870,53 @@ class Actions:
         - Delete snapshots
         - Delete backups
 
-        Within an action type, the actions are performed in the same order
+        Within an action type, the actions are started in the same order
         returned from the iter_*_intents() functions. That is, snapshots are
         created in the same order that they are returned from
         iter_create_snapshot_intents(), etc.
 
+        The exception is backups, which are started in order of priority: full
+        backups first (as they're the base of all later deltas), then largest
+        first. Starting the longest uploads first minimizes the total run
+        time, and means that if a run is interrupted, the most valuable
+        backups are done. Sizes are estimated with estimate_send_size(), when
+        upload_params is AutoUploadParams or max_concurrent_backups > 1.
+
+        Backups are independent of each other, so up to max_concurrent_backups
+        of them are created at once. A snapshot is deleted as soon as all
+        backups which use it (either as the snapshot being backed up, or as
+        the send-parent) are complete, so it may be deleted while unrelated
+        backups are still in progress. Backups are only deleted once all new
+        backups are complete. Snapshots which aren't used by any new backup
+        are deleted together with delete_snapshots().
+
+        If a backup fails, the actions which depend on it are skipped, but
+        independent backups continue. The first error is raised when all
+        actions have finished.
+
+        All Thunks are evaluated on the calling thread, before any backups are
+        started.
+
         Args:
             s3: The S3 client object to use to manipulate S3 objects.
             bucket: The name of the bucket where backups are stored.
             pipe_through: A sequence of shell commands through which backup
                 archives should be piped before uploading.
+            upload_params: Parameters for streaming backups to S3. If None,
+                AutoUploadParams() will be used.
+            max_concurrent_backups: The maximum number of backups to create at
+                once.
+            throttle: A bandwidth limit shared by all backups.
+            wait_for_commit: Whether to wait for snapshot deletions to be
+                committed.
+            compress: Parameters for compressing backup archives, or None to
+                not compress them.
+            compressed_data: Whether to send compressed extents as-is, with
+                "btrfs send --compressed-data".
+            checkpoints: Checkpoints with which to resume interrupted
+                backups. If None, interrupted backups are aborted.
+            mirrors: Other buckets which get a copy of every backup. Backups
+                are created in, and deleted from, all of them.
         """
         for create_snapshot_intent in self.iter_create_snapshot_intents():
             create_snapshot(
@@ -375,18 +930,85 @@ class Actions:
                 target=rename_snapshot_intent.target(),
             )
 
-        for create_backup_intent in self.iter_create_backup_intents():
-            create_backup(
-                s3=s3,
-                bucket=bucket,
-                snapshot=create_backup_intent.snapshot(),
-                send_parent=create_backup_intent.send_parent(),
-                key=create_backup_intent.key(),
-                pipe_through=pipe_through,
+        if upload_params is None:
+            upload_params = AutoUploadParams()
+        backups = [
+            (intent.snapshot(), intent.send_parent(), intent.key())
+            for intent in self.iter_create_backup_intents()
+        ]
+        estimated_sizes: list[int | None] = [None] * len(backups)
+        if backups and (
+            isinstance(upload_params, AutoUploadParams) or max_concurrent_backups > 1
+        ):
+            estimated_sizes = _estimate_send_sizes(
+                [(snapshot, send_parent) for snapshot, send_parent, _ in backups],
+                max_workers=max_concurrent_backups,
             )
+        prioritized = sorted(
+            zip(backups, estimated_sizes),
+            key=lambda item: (item[0][1] is not None, -(item[1] or 0)),
+        )
 
-        for delete_snapshot_intent in self.iter_delete_snapshot_intents():
-            delete_snapshot(delete_snapshot_intent.path())
+        create_backup_tasks: list[Task] = []
+        tasks_using_snapshot: dict[Path, list[Task]] = {}
+        for (snapshot, send_parent, key), estimated_size in prioritized:
+            task = Task(
+                name=f"backup of {snapshot}",
+                run=partial(
+                    create_backup,
+                    s3=s3,
+                    bucket=bucket,
+                    snapshot=snapshot,
+                    send_parent=send_parent,
+                    key=key,
+                    pipe_through=pipe_through,
+                    upload_params=upload_params,
+                    throttle=throttle,
+                    estimated_size=estimated_size,
+                    compress=compress,
+                    compressed_data=compressed_data,
+                    checkpoint=(
+                        checkpoints.get(key) if checkpoints is not None else None
+                    ),
+                    mirrors=mirrors,
+                ),
+            )
+            create_backup_tasks.append(task)
+            tasks_using_snapshot.setdefault(snapshot, []).append(task)
+            if send_parent is not None:
+                tasks_using_snapshot.setdefault(send_parent, []).append(task)
+
+        snapshots_to_delete = [i.path() for i in self.iter_delete_snapshot_intents()]
+        delete_snapshot_tasks = _make_delete_snapshot_tasks(
+            snapshots_to_delete, tasks_using_snapshot
+        )
 
         keys = tuple(d.key() for d in self.iter_delete_backup_intents())
-        delete_backups(s3, bucket, *keys)
+        delete_backups_tasks = [
+            Task(
+                name=f"deletion of backups from {bucket}",
+                run=partial(delete_backups, s3, bucket, *keys),
+                dependencies=create_backup_tasks,
+            ),
+            *(
+                Task(
+                    name=f"deletion of backups from {mirror.bucket}",
+                    run=partial(delete_backups, mirror.s3, mirror.bucket, *keys),
+                    dependencies=create_backup_tasks,
+                )
+                for mirror in mirrors
+            ),
+        ]
+
+        try:
+            run_tasks(
+                [*create_backup_tasks, *delete_snapshot_tasks, *delete_backups_tasks],
+                max_workers=max_concurrent_backups,
+            )
+        except Exception:
+            # Still wait for the deletions which succeeded
+            if wait_for_commit:
+                _commit_deletions(snapshots_to_delete)
+            raise
+        if wait_for_commit:
+            _commit_deletions(snapshots_to_delete)
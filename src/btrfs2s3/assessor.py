@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from dataclasses import field
 from functools import partial
@@ -9,54 +10,62 @@ from typing import TYPE_CHECKING
 from uuid import uuid4
 
 import arrow
-import btrfsutil
-from btrfsutil import SubvolumeInfo
 
+from btrfs2s3._internal import btrfsioctl
+from btrfs2s3._internal.slots import add_slots
 from btrfs2s3._internal.util import mksubvol
 from btrfs2s3._internal.util import SubvolumeFlags
+from btrfs2s3.resolver import EMPTY_KEEP_META
 from btrfs2s3.resolver import Flags
+from btrfs2s3.resolver import IncrementalResolver
 from btrfs2s3.resolver import KeepMeta
 from btrfs2s3.resolver import resolve
-from btrfs2s3.s3 import iter_backups
+from btrfs2s3.s3 import list_backups
 from btrfs2s3.thunk import Thunk
 from btrfs2s3.thunk import ThunkArg
 
 if TYPE_CHECKING:
     from pathlib import Path
+    from typing import Mapping
     from typing import Sequence
 
     from mypy_boto3_s3.client import S3Client
 
-    from btrfs2s3 import resolver
+    from btrfs2s3._internal.btrfsioctl import SubvolumeInfo
     from btrfs2s3.action import Actions
     from btrfs2s3.backups import BackupInfo
+    from btrfs2s3.cache import ListingCache
     from btrfs2s3.preservation import Policy
+    from btrfs2s3.resolver import Result
 
 
+@add_slots
 @dataclass
 class SnapshotAssessment:
     initial_path: Path
     info: SubvolumeInfo
     target_path: Thunk[Path]
     real_info: Thunk[SubvolumeInfo]
-    keep_meta: KeepMeta = field(default_factory=KeepMeta)
+    keep_meta: KeepMeta = EMPTY_KEEP_META
 
     @property
     def new(self) -> bool:
         return bool(self.keep_meta.flags & Flags.New)
 
 
+@add_slots
 @dataclass
 class BackupAssessment:
     backup: Thunk[BackupInfo]
     key: Thunk[str]
-    keep_meta: KeepMeta = field(default_factory=KeepMeta)
+    keep_meta: KeepMeta = EMPTY_KEEP_META
 
     @property
     def new(self) -> bool:
         return bool(self.keep_meta.flags & Flags.New)
 
 
+@add_slots
 @dataclass
 class SourceAssessment:
     path: Path
@@ -65,6 +74,7 @@ class SourceAssessment:
     backups: dict[bytes, BackupAssessment] = field(default_factory=dict)
 
 
+@add_slots
 @dataclass(frozen=True)
 class Assessment:
     sources: dict[bytes, SourceAssessment] = field(default_factory=dict)
@@ -130,6 +140,13 @@ class _SourceAssessor:
     assessment: SourceAssessment
     snapshot_dir: Path
     policy: Policy
+    prefix: str = ""
+    # Appended to new backup keys, for example to record compression
+    suffix: str = ""
+
+    # Resolves snapshots which really exist, to which newly-created snapshots
+    # are added
+    _real_resolver: IncrementalResolver | None = field(default=None, init=False)
 
     def _make_snapshot_path(self, info: SubvolumeInfo) -> Path:
         ctime = arrow.get(info.ctime, tzinfo=self.policy.tzinfo)
@@ -142,7 +159,9 @@ class _SourceAssessor:
 
     def _make_backup_key(self, backup: BackupInfo) -> str:
         suffixes = backup.get_path_suffixes(tzinfo=self.policy.tzinfo)
-        return f"{self.assessment.path.name}{''.join(suffixes)}"
+        return (
+            f"{self.prefix}{self.assessment.path.name}{''.join(suffixes)}{self.suffix}"
+        )
 
     def _is_new_snapshot_needed(self) -> bool:
         if not self.assessment.snapshots:
@@ -171,7 +190,7 @@ class _SourceAssessor:
         initial_path = self._make_new_snapshot_path()
 
         def get_real_info() -> SubvolumeInfo:
-            return btrfsutil.subvolume_info(initial_path)
+            return btrfsioctl.subvolume_info(initial_path)
 
         self.assessment.snapshots[proposed_uuid] = SnapshotAssessment(
             initial_path=initial_path,
@@ -186,7 +205,9 @@ class _SourceAssessor:
             return lambda: self._make_snapshot_path(snapshot.real_info())
         return self._make_snapshot_path(snapshot.real_info())
 
-    def _do_resolve(self, *, include_proposed: bool = True) -> resolver.Result:
+    def get_resolver_inputs(
+        self, *, include_proposed: bool = True
+    ) -> tuple[list[SubvolumeInfo], list[BackupInfo]]:
         snapshots = []
         for snapshot in self.assessment.snapshots.values():
             if snapshot.info.flags & SubvolumeFlags.Proposed and not include_proposed:
@@ -197,13 +218,16 @@ class _SourceAssessor:
             for b in self.assessment.backups.values()
             if not b.backup.is_tbd()
         ]
+        return snapshots, backups
 
-        return resolve(snapshots=snapshots, backups=backups, policy=self.policy)
-
-    def _resolve(self) -> None:
-        # Run resolve including proposed snapshots.
-        result = self._do_resolve(include_proposed=True)
+    def _make_resolver(self, *, include_proposed: bool = True) -> IncrementalResolver:
+        snapshots, backups = self.get_resolver_inputs(include_proposed=include_proposed)
+        return IncrementalResolver(
+            snapshots=snapshots, backups=backups, policy=self.policy
+        )
 
+    def apply_result(self, result: Result) -> None:
+        # result is from resolve() including proposed snapshots.
         # Mark snapshots as kept, and rename these if necessary
         for uuid, keep_snapshot in result.keep_snapshots.items():
             snapshot = self.assessment.snapshots[uuid]
@@ -234,18 +258,52 @@ class _SourceAssessor:
     def _get_real_backup(
         self, target_path: Path, real_info: SubvolumeInfo
     ) -> BackupInfo:
+        # Only resolve existing snapshots once. Each new snapshot is then
+        # added incrementally
+        if self._real_resolver is None:
+            self._real_resolver = self._make_resolver(include_proposed=False)
         self.assessment.snapshots[real_info.uuid] = SnapshotAssessment(
             initial_path=target_path,
             info=real_info,
             real_info=Thunk(real_info),
             target_path=Thunk(target_path),
         )
-        result = self._do_resolve(include_proposed=False)
-        return result.keep_backups[real_info.uuid].item
+        keep_backup = self._real_resolver.add_snapshot(real_info)
+        if keep_backup is None:
+            # A new snapshot is always the most recent, so it's always kept
+            raise AssertionError
+        return keep_backup.item
 
-    def assess(self) -> None:
+    def propose(self) -> None:
         self._maybe_propose_new_snapshot()
-        self._resolve()
+
+
+def _resolve_inputs(
+    inputs: tuple[list[SubvolumeInfo], list[BackupInfo]], policy: Policy
+) -> Result:
+    snapshots, backups = inputs
+    return resolve(snapshots=snapshots, backups=backups, policy=policy)
+
+
+# Below this many snapshots and backups in total, starting worker processes
+# and pickling takes longer than resolving everything in this process
+_MIN_ITEMS_FOR_WORKERS = 20_000
+
+
+def _resolve_all(
+    inputs: Sequence[tuple[list[SubvolumeInfo], list[BackupInfo]]],
+    *,
+    policy: Policy,
+    max_workers: int,
+) -> list[Result]:
+    # Resolving is CPU-bound pure python, so it's done in worker processes
+    # rather than threads. All inputs and results are plain data, so they can
+    # be pickled
+    items = sum(len(snapshots) + len(backups) for snapshots, backups in inputs)
+    if max_workers <= 1 or len(inputs) <= 1 or items < _MIN_ITEMS_FOR_WORKERS:
+        return [_resolve_inputs(i, policy) for i in inputs]
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(inputs))) as executor:
+        return list(executor.map(partial(_resolve_inputs, policy=policy), inputs))
 
 
 @dataclass
@@ -253,32 +311,31 @@ class _Assessor:
     snapshot_dir: Path
     sources: Sequence[Path]
     policy: Policy
+    prefixes: Mapping[Path, str] = field(default_factory=dict)
+    suffixes: Mapping[Path, str] = field(default_factory=dict)
+    max_workers: int = 1
 
     _assessment: Assessment = field(init=False, default_factory=Assessment)
 
     def _collect_sources(self) -> None:
         for source in self.sources:
-            info = btrfsutil.subvolume_info(source)
+            info = btrfsioctl.subvolume_info(source)
             self._assessment.sources[info.uuid] = SourceAssessment(
                 path=source, info=info
             )
 
     def _collect_snapshots(self) -> None:
-        # SubvolumeIterator only works at a subvolume boundary, so search for
-        # one
+        # Fail early if snapshot_dir isn't on btrfs at all
         search_base = self.snapshot_dir
         while (
-            not btrfsutil.is_subvolume(search_base)
+            not btrfsioctl.is_subvolume(search_base)
             and search_base != search_base.parent
         ):
             search_base = search_base.parent
         if search_base == search_base.parent:
             msg = f"no subvolume found. is {self.snapshot_dir} on a btrfs filesystem?"
             raise RuntimeError(msg)
-        for name, info in btrfsutil.SubvolumeIterator(search_base, info=True):
-            path = search_base / name
-            if self.snapshot_dir not in path.parents:
-                continue
+        for path, info in btrfsioctl.list_subvolumes(self.snapshot_dir):
             if info.parent_uuid not in self._assessment.sources:
                 continue
             if not info.flags & SubvolumeFlags.ReadOnly:
@@ -292,8 +349,16 @@ class _Assessor:
                 )
             )
 
-    def _collect_backups(self, s3: S3Client, bucket: str) -> None:
-        for obj, backup in iter_backups(s3, bucket):
+    def _collect_backups(
+        self, s3: S3Client, bucket: str, cache: ListingCache | None
+    ) -> None:
+        prefixes = [self.prefixes.get(source, "") for source in self.sources]
+        backups = (
+            list_backups(s3, bucket, prefixes=prefixes)
+            if cache is None
+            else cache.list_backups(s3, bucket, prefixes=prefixes)
+        )
+        for obj, backup in backups:
             if backup.parent_uuid not in self._assessment.sources:
                 continue
             self._assessment.sources[backup.parent_uuid].backups[backup.uuid] = (
@@ -301,30 +366,60 @@ class _Assessor:
             )
 
     def _assess_for_all_sources(self) -> None:
-        for source in self._assessment.sources.values():
-            assessor = _SourceAssessor(
-                assessment=source, snapshot_dir=self.snapshot_dir, policy=self.policy
+        assessors = [
+            _SourceAssessor(
+                assessment=source,
+                snapshot_dir=self.snapshot_dir,
+                policy=self.policy,
+                prefix=self.prefixes.get(source.path, ""),
+                suffix=self.suffixes.get(source.path, ""),
             )
-            assessor.assess()
+            for source in self._assessment.sources.values()
+        ]
+        for assessor in assessors:
+            assessor.propose()
+        # Sources are independent, so the expensive part can be done in
+        # parallel. Results are applied in the original order, so the
+        # assessment is the same either way
+        results = _resolve_all(
+            [assessor.get_resolver_inputs() for assessor in assessors],
+            policy=self.policy,
+            max_workers=self.max_workers,
+        )
+        for assessor, result in zip(assessors, results):
+            assessor.apply_result(result)
 
-    def assess(self, s3: S3Client, bucket: str) -> None:
+    def assess(
+        self, s3: S3Client, bucket: str, cache: ListingCache | None = None
+    ) -> None:
         self._collect_sources()
         self._collect_snapshots()
-        self._collect_backups(s3, bucket)
+        self._collect_backups(s3, bucket, cache)
         self._assess_for_all_sources()
 
     def get_assessment(self) -> Assessment:
         return self._assessment
 
 
-def assess(
+def assess(  # noqa: PLR0913
     *,
     snapshot_dir: Path,
     sources: Sequence[Path],
     s3: S3Client,
     bucket: str,
     policy: Policy,
+    cache: ListingCache | None = None,
+    prefixes: Mapping[Path, str] | None = None,
+    suffixes: Mapping[Path, str] | None = None,
+    max_workers: int = 1,
 ) -> Assessment:
-    assessor = _Assessor(snapshot_dir=snapshot_dir, sources=sources, policy=policy)
-    assessor.assess(s3, bucket)
+    assessor = _Assessor(
+        snapshot_dir=snapshot_dir,
+        sources=sources,
+        policy=policy,
+        prefixes=prefixes or {},
+        suffixes=suffixes or {},
+        max_workers=max_workers,
+    )
+    assessor.assess(s3, bucket, cache)
     return assessor.get_assessment()
@@ -4,8 +4,10 @@ from __future__ import annotations
 
 from contextlib import suppress
 import dataclasses
+from datetime import datetime
 from math import floor
 import pathlib
+import re
 from typing import TYPE_CHECKING
 from uuid import UUID
 
@@ -13,11 +15,32 @@ import arrow
 from arrow import Arrow
 from typing_extensions import Self
 
+from btrfs2s3._internal.slots import add_slots
+
 if TYPE_CHECKING:
     from datetime import tzinfo
+    from typing import Iterable
     from typing import Sequence
 
 
+_UUID_PATTERN = r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+# Matches the file name of a backup key in exactly the form produced by
+# get_path_suffixes(), with a base name and possibly other suffixes
+_NAME_PATTERN = re.compile(
+    r"[^./][^/]*?"
+    r"\.t(?P<ctime>\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}[+-]\d{2}:\d{2})"
+    r"\.i(?P<ctransid>\d+)"
+    rf"\.u(?P<uuid>{_UUID_PATTERN})"
+    rf"\.(?:full|s(?P<send_parent_uuid>{_UUID_PATTERN}))"
+    rf"\.p(?P<parent_uuid>{_UUID_PATTERN})"
+    r"(?:\.[^./]+)*",
+    re.ASCII,
+)
+# The first characters of suffixes which are interpreted by from_path()
+_CODES = frozenset("tiusp")
+
+
+@add_slots
 @dataclasses.dataclass(frozen=True)
 class BackupInfo:
     """Information about a backup."""
@@ -89,6 +112,40 @@ class BackupInfo:
         suffixes.append(f".p{parent_uuid}")
         return suffixes
 
+    @classmethod
+    def _from_canonical_path(cls, path: str) -> Self | None:
+        # A fast path for parsing keys produced by get_path_suffixes(). Returns
+        # None if the path isn't in that exact form, or contains any other
+        # suffixes which _from_any_path() would interpret. This ensures it
+        # gives the same result as _from_any_path()
+        name = path.rpartition("/")[2]
+        match = _NAME_PATTERN.fullmatch(name)
+        if match is None:
+            return None
+        other_parts = (
+            name[: match.start("ctime") - 2].split(".")[1:]
+            + name[match.end("parent_uuid") :].split(".")[1:]
+        )
+        for part in other_parts:
+            if not part or part == "full" or part[0] in _CODES:
+                return None
+        try:
+            ctime = datetime.fromisoformat(match.group("ctime"))
+        except ValueError:
+            return None
+        send_parent_uuid = match.group("send_parent_uuid")
+        return cls(
+            uuid=bytes.fromhex(match.group("uuid").replace("-", "")),
+            parent_uuid=bytes.fromhex(match.group("parent_uuid").replace("-", "")),
+            ctransid=int(match.group("ctransid")),
+            ctime=ctime.timestamp(),
+            send_parent_uuid=(
+                bytes.fromhex(send_parent_uuid.replace("-", ""))
+                if send_parent_uuid
+                else None
+            ),
+        )
+
     @classmethod
     def from_path(cls, path: str) -> Self:
         """Creates a BackupInfo from a backup filename or path.
@@ -110,6 +167,40 @@ class BackupInfo:
         Raises:
             ValueError: If the input isn't a valid encoded BackupInfo.
         """
+        info = cls._from_canonical_path(path)
+        if info is not None:
+            return info
+        return cls._from_any_path(path)
+
+    @classmethod
+    def from_paths(cls, paths: Iterable[str]) -> list[Self | None]:
+        """Creates BackupInfos from many backup filenames or paths at once.
+
+        This is equivalent to calling from_path() on each path, but is faster
+        for large batches, such as a page of ListObjectsV2 results.
+
+        Args:
+            paths: Filenames or paths, as accepted by from_path().
+
+        Returns:
+            A list with one element per path: a BackupInfo, or None if the
+                path isn't a valid encoded BackupInfo.
+        """
+        from_canonical_path = cls._from_canonical_path
+        from_any_path = cls._from_any_path
+        result: list[Self | None] = []
+        for path in paths:
+            info = from_canonical_path(path)
+            if info is None:
+                try:
+                    info = from_any_path(path)
+                except ValueError:
+                    info = None
+            result.append(info)
+        return result
+
+    @classmethod
+    def _from_any_path(cls, path: str) -> Self:
         uuid: UUID | None = None
         parent_uuid: UUID | None = None
         send_parent_uuid: UUID | None = None
@@ -0,0 +1,270 @@
+"""An on-disk cache of the backups stored in an S3 bucket.
+
+Listing a large bucket with ListObjectsV2 takes one request per 1000 keys. If
+btrfs2s3 runs often, the listing can dominate both its run time and API cost.
+
+btrfs2s3 is usually the only writer to its bucket, so it can keep track of the
+bucket's contents itself: after a full listing, the cache is updated with the
+backups that btrfs2s3 creates and deletes. To detect changes made by others,
+each run checks the most recently-modified cached object with a single
+HeadObject request, and the bucket is fully listed again if the check fails,
+or every refresh_interval runs.
+
+The cache is just a hint. If it's missing or unreadable, it's rebuilt.
+"""
+
+from __future__ import annotations
+
+from contextlib import suppress
+from datetime import datetime
+import hashlib
+import json
+import logging
+import os
+from typing import TYPE_CHECKING
+
+from botocore.exceptions import ClientError
+
+from btrfs2s3.backups import BackupInfo
+from btrfs2s3.s3 import list_backups
+from btrfs2s3.s3 import minimize_prefixes
+
+if TYPE_CHECKING:
+    from pathlib import Path
+    from typing import Any
+    from typing import Iterable
+
+    from mypy_boto3_s3.client import S3Client
+    from mypy_boto3_s3.type_defs import ObjectTypeDef
+
+_LOG = logging.getLogger(__name__)
+
+DEFAULT_REFRESH_INTERVAL = 60
+"""The default number of runs after which the bucket is fully listed again."""
+
+# Increment this when changing the format of the cache file
+_VERSION = 2
+
+
+def _encode(obj: ObjectTypeDef, info: BackupInfo) -> dict[str, Any]:
+    return {
+        "key": obj["Key"],
+        "etag": obj["ETag"],
+        "last_modified": obj["LastModified"].isoformat(),
+        "size": obj["Size"],
+        "uuid": info.uuid.hex(),
+        "parent_uuid": info.parent_uuid.hex(),
+        "send_parent_uuid": (
+            info.send_parent_uuid.hex() if info.send_parent_uuid else None
+        ),
+        "ctransid": info.ctransid,
+        "ctime": info.ctime,
+    }
+
+
+def _decode(entry: dict[str, Any]) -> tuple[ObjectTypeDef, BackupInfo]:
+    obj: ObjectTypeDef = {
+        "Key": entry["key"],
+        "ETag": entry["etag"],
+        "LastModified": datetime.fromisoformat(entry["last_modified"]),
+        "Size": entry["size"],
+    }
+    info = BackupInfo(
+        uuid=bytes.fromhex(entry["uuid"]),
+        parent_uuid=bytes.fromhex(entry["parent_uuid"]),
+        send_parent_uuid=(
+            bytes.fromhex(entry["send_parent_uuid"])
+            if entry["send_parent_uuid"]
+            else None
+        ),
+        ctransid=entry["ctransid"],
+        ctime=entry["ctime"],
+    )
+    return obj, info
+
+
+class ListingCache:
+    """An on-disk (or in-memory) cache of the backups in one S3 bucket.
+
+    Callers should use list_backups() in place of btrfs2s3.s3.list_backups(),
+    and report changes to the bucket with record_created() and
+    record_deleted(). If changes may have been made but can't be reported
+    (for example, if executing actions failed partway), callers should call
+    invalidate().
+    """
+
+    def __init__(
+        self, path: Path | None, *, refresh_interval: int = DEFAULT_REFRESH_INTERVAL
+    ) -> None:
+        """Constructs a ListingCache.
+
+        Args:
+            path: The path of the cache file. It will be created if it doesn't
+                exist. If None, the cache is only kept in memory, which is
+                useful for a long-lived process.
+            refresh_interval: Fully list the bucket after this many runs which
+                used the cache.
+        """
+        self._path = path
+        self._refresh_interval = refresh_interval
+        self._entries: dict[str, tuple[ObjectTypeDef, BackupInfo]] = {}
+        self._prefixes: list[str] = []
+        self._runs_since_refresh = 0
+        # Whether _entries reflects the bucket, when kept in memory
+        self._valid = False
+
+    @classmethod
+    def for_bucket(
+        cls,
+        state_dir: Path,
+        bucket: str,
+        *,
+        endpoint_url: str | None = None,
+        refresh_interval: int = DEFAULT_REFRESH_INTERVAL,
+    ) -> ListingCache:
+        """Constructs a ListingCache for a bucket, under a state directory.
+
+        Args:
+            state_dir: The directory in which to store the cache file.
+            bucket: The name of the bucket.
+            endpoint_url: The S3 endpoint of the bucket, if not the default.
+            refresh_interval: Fully list the bucket after this many runs which
+                used the cache.
+
+        Returns:
+            A ListingCache whose file name is unique to the bucket and
+                endpoint.
+        """
+        digest = hashlib.sha256(f"{endpoint_url or ''}\0{bucket}".encode()).hexdigest()
+        return cls(
+            state_dir / f"listing-{digest[:16]}.json", refresh_interval=refresh_interval
+        )
+
+    def _load(self) -> bool:
+        if self._path is None:
+            return self._valid
+        try:
+            with self._path.open() as fp:
+                data = json.load(fp)
+            if data["version"] != _VERSION:
+                return False
+            entries = [_decode(entry) for entry in data["objects"]]
+            self._prefixes = data["prefixes"]
+            self._runs_since_refresh = data["runs_since_refresh"]
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, TypeError):
+            _LOG.warning("ignoring unreadable listing cache %s", self._path)
+            return False
+        self._entries = {obj["Key"]: (obj, info) for obj, info in entries}
+        return True
+
+    def _save(self) -> None:
+        self._valid = True
+        if self._path is None:
+            return
+        data = {
+            "version": _VERSION,
+            "runs_since_refresh": self._runs_since_refresh,
+            "prefixes": self._prefixes,
+            "objects": [_encode(obj, info) for obj, info in self._entries.values()],
+        }
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        # Write atomically, in case another instance is reading
+        tmp_path = self._path.with_name(f"{self._path.name}.{os.getpid()}.tmp")
+        with tmp_path.open("w") as fp:
+            json.dump(data, fp)
+        tmp_path.replace(self._path)
+
+    def _check(self, s3: S3Client, bucket: str) -> bool:
+        if self._runs_since_refresh >= self._refresh_interval:
+            _LOG.debug("listing cache is due for a refresh")
+            return False
+        if not self._entries:
+            # Nothing to check. Listing an empty bucket is cheap anyway
+            return False
+        obj, _ = max(self._entries.values(), key=lambda item: item[0]["LastModified"])
+        try:
+            response = s3.head_object(Bucket=bucket, Key=obj["Key"])
+        except ClientError:
+            _LOG.info("listing cache is stale: %s is missing", obj["Key"])
+            return False
+        # LastModified from ListObjectsV2 and HeadObject have different
+        # precision
+        cached_mtime = int(obj["LastModified"].timestamp())
+        mtime = int(response["LastModified"].timestamp())
+        if response["ETag"] != obj["ETag"] or mtime != cached_mtime:
+            _LOG.info("listing cache is stale: %s has changed", obj["Key"])
+            return False
+        return True
+
+    def list_backups(
+        self, s3: S3Client, bucket: str, *, prefixes: Iterable[str] = ("",)
+    ) -> list[tuple[ObjectTypeDef, BackupInfo]]:
+        """Find backups in an S3 bucket, using the cache if it's valid.
+
+        This is a drop-in replacement for btrfs2s3.s3.list_backups(). If the
+        cache is missing, stale, due for a refresh or was built from different
+        prefixes, the bucket is listed again and the cache is rebuilt.
+
+        Args:
+            s3: An S3 client.
+            bucket: The bucket to enumerate.
+            prefixes: The prefixes to list.
+
+        Returns:
+            Pairs of object info and BackupInfo.
+        """
+        prefixes = minimize_prefixes(prefixes)
+        if self._load() and self._prefixes == prefixes and self._check(s3, bucket):
+            self._runs_since_refresh += 1
+        else:
+            _LOG.debug("listing all objects in %s with prefixes %s", bucket, prefixes)
+            self._entries = {
+                obj["Key"]: (obj, info)
+                for obj, info in list_backups(s3, bucket, prefixes=prefixes)
+            }
+            self._prefixes = prefixes
+            self._runs_since_refresh = 0
+        self._save()
+        return list(self._entries.values())
+
+    def record_created(self, s3: S3Client, bucket: str, keys: Iterable[str]) -> None:
+        """Update the cache with newly-created backups.
+
+        This uses one HeadObject request per key, to record the metadata of
+        the new objects.
+
+        Args:
+            s3: An S3 client.
+            bucket: The bucket containing the backups.
+            keys: The keys of the newly-created backups.
+        """
+        for key in keys:
+            response = s3.head_object(Bucket=bucket, Key=key)
+            obj: ObjectTypeDef = {
+                "Key": key,
+                "ETag": response["ETag"],
+                "LastModified": response["LastModified"],
+                "Size": response["ContentLength"],
+            }
+            self._entries[key] = (obj, BackupInfo.from_path(key))
+        self._save()
+
+    def record_deleted(self, keys: Iterable[str]) -> None:
+        """Update the cache with deleted backups.
+
+        Args:
+            keys: The keys of the deleted backups.
+        """
+        for key in keys:
+            self._entries.pop(key, None)
+        self._save()
+
+    def invalidate(self) -> None:
+        """Delete the cache, so the next run will fully list the bucket."""
+        if self._path is not None:
+            with suppress(FileNotFoundError):
+                self._path.unlink()
+        self._entries = {}
+        self._valid = False
@@ -0,0 +1,240 @@
+"""On-disk checkpoints of multipart uploads, for resuming interrupted backups.
+
+A full backup may be many terabytes, and take longer than the time between
+interruptions (timeouts, reboots, network failures). Without checkpoints,
+every attempt starts again from the beginning.
+
+A checkpoint records the id of a multipart upload, and the ETag and SHA-256
+digest of each part uploaded so far. btrfs send produces the same stream for
+the same snapshot, so an interrupted upload can be resumed by generating the
+stream again: each part is read and hashed, and only uploaded if it doesn't
+match the checkpoint. Parts which don't match (for example if pipe_through
+encrypts with a random key) are just uploaded again.
+
+A checkpoint file is a header line followed by one line per uploaded part,
+so recording a part is a cheap append.
+"""
+
+from __future__ import annotations
+
+from contextlib import suppress
+import dataclasses
+import hashlib
+import json
+import logging
+import threading
+from typing import TYPE_CHECKING
+
+from botocore.exceptions import ClientError
+
+if TYPE_CHECKING:
+    from pathlib import Path
+    from typing import Collection
+    from typing import IO
+
+    from mypy_boto3_s3.client import S3Client
+
+_LOG = logging.getLogger(__name__)
+
+# Increment this when changing the format of checkpoint files
+_VERSION = 1
+
+
+@dataclasses.dataclass(frozen=True)
+class CheckpointPart:
+    """A part of a multipart upload recorded in a checkpoint.
+
+    Attributes:
+        etag: The ETag returned by UploadPart.
+        sha256: The SHA-256 digest of the part's data.
+    """
+
+    etag: str
+    sha256: bytes
+
+
+@dataclasses.dataclass(frozen=True)
+class CheckpointState:
+    """The state of a multipart upload recorded in a checkpoint.
+
+    Attributes:
+        upload_id: The id of the multipart upload.
+        part_size: The part size of the upload.
+        parts: The uploaded parts, by part number.
+    """
+
+    upload_id: str
+    part_size: int
+    parts: dict[int, CheckpointPart]
+
+
+def _digest(key: str) -> str:
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+class UploadCheckpoint:
+    """An on-disk checkpoint of one multipart upload.
+
+    It's safe to call record_part() from several threads.
+    """
+
+    def __init__(self, path: Path, key: str) -> None:
+        """Constructs an UploadCheckpoint.
+
+        Args:
+            path: The path of the checkpoint file.
+            key: The S3 object key of the upload.
+        """
+        self._path = path
+        self._key = key
+        self._lock = threading.Lock()
+        self._fp: IO[str] | None = None
+
+    def load(self) -> CheckpointState | None:
+        """Reads the checkpoint.
+
+        Returns:
+            The recorded state, or None if there is no usable checkpoint.
+        """
+        try:
+            with self._path.open() as fp:
+                header = json.loads(fp.readline())
+                if header["version"] != _VERSION or header["key"] != self._key:
+                    return None
+                parts = {}
+                for line in fp:
+                    try:
+                        entry = json.loads(line)
+                        part = CheckpointPart(
+                            etag=entry["etag"], sha256=bytes.fromhex(entry["sha256"])
+                        )
+                    except (ValueError, KeyError, TypeError):
+                        # Probably a partly-written line, from an interruption.
+                        # The part will just be uploaded again
+                        continue
+                    parts[entry["part_number"]] = part
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError):
+            _LOG.warning("ignoring unreadable upload checkpoint %s", self._path)
+            return None
+        return CheckpointState(
+            upload_id=header["upload_id"], part_size=header["part_size"], parts=parts
+        )
+
+    def start(self, state: CheckpointState) -> None:
+        """Starts recording parts of an upload.
+
+        If the state is new, the checkpoint file is replaced. Otherwise,
+        parts are appended to the existing file.
+
+        Args:
+            state: The state of the upload, as created or loaded.
+        """
+        self.close()
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        if state.parts:
+            self._fp = self._path.open("a")
+            # Terminate any partly-written line
+            self._fp.write("\n")
+            return
+        self._fp = self._path.open("w")
+        header = {
+            "version": _VERSION,
+            "key": self._key,
+            "upload_id": state.upload_id,
+            "part_size": state.part_size,
+        }
+        self._fp.write(json.dumps(header) + "\n")
+        self._fp.flush()
+
+    def record_part(self, part_number: int, part: CheckpointPart) -> None:
+        """Records an uploaded part.
+
+        Args:
+            part_number: The part number.
+            part: The uploaded part.
+        """
+        entry = {
+            "part_number": part_number,
+            "etag": part.etag,
+            "sha256": part.sha256.hex(),
+        }
+        with self._lock:
+            if self._fp is None:
+                return
+            self._fp.write(json.dumps(entry) + "\n")
+            self._fp.flush()
+
+    def close(self) -> None:
+        """Stops recording parts, leaving the checkpoint for a later resume."""
+        with self._lock:
+            if self._fp is not None:
+                self._fp.close()
+                self._fp = None
+
+    def clear(self) -> None:
+        """Deletes the checkpoint."""
+        self.close()
+        with suppress(FileNotFoundError):
+            self._path.unlink()
+
+
+class UploadCheckpoints:
+    """The checkpoints of multipart uploads to one S3 bucket."""
+
+    def __init__(self, path: Path) -> None:
+        """Constructs an UploadCheckpoints.
+
+        Args:
+            path: The directory containing checkpoint files. It will be
+                created if it doesn't exist.
+        """
+        self._path = path
+
+    @classmethod
+    def for_bucket(
+        cls, state_dir: Path, bucket: str, *, endpoint_url: str | None = None
+    ) -> UploadCheckpoints:
+        """Constructs an UploadCheckpoints for a bucket, under a state directory.
+
+        Args:
+            state_dir: The directory in which to store checkpoints.
+            bucket: The name of the bucket.
+            endpoint_url: The S3 endpoint of the bucket, if not the default.
+
+        Returns:
+            An UploadCheckpoints whose directory is unique to the bucket and
+                endpoint.
+        """
+        digest = _digest(f"{endpoint_url or ''}\0{bucket}")
+        return cls(state_dir / f"uploads-{digest}")
+
+    def get(self, key: str) -> UploadCheckpoint:
+        """Returns the checkpoint for uploading an S3 object key."""
+        return UploadCheckpoint(self._path / f"{_digest(key)}.jsonl", key)
+
+    def prune(self, s3: S3Client, bucket: str, *, keep: Collection[str] = ()) -> None:
+        """Aborts checkpointed uploads which won't be resumed.
+
+        Args:
+            s3: An S3 client.
+            bucket: The bucket of the uploads.
+            keep: The S3 object keys of uploads which may still be resumed.
+        """
+        if not self._path.is_dir():
+            return
+        for path in sorted(self._path.glob("*.jsonl")):
+            try:
+                with path.open() as fp:
+                    header = json.loads(fp.readline())
+                key, upload_id = header["key"], header["upload_id"]
+            except (OSError, ValueError, KeyError, TypeError):
+                path.unlink()
+                continue
+            if key in keep:
+                continue
+            _LOG.info("aborting interrupted upload of %s", key)
+            with suppress(ClientError):
+                s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+            path.unlink()
@@ -0,0 +1,124 @@
+"""Code for "btrfs2s3 daemon".
+
+The daemon runs the same updates as "btrfs2s3 update", but as a long-lived
+process. The S3 clients (and their connection pools) and the listing of the
+bucket are kept between updates, so an update which has nothing to do is
+cheap.
+
+Between updates, the daemon sleeps until the next time span boundary of the
+preservation policy (see next_wakeup()), or until the data in a source
+changes. Changes are detected by polling the ctransid of each source, which
+is one ioctl per source.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import time
+from typing import cast
+from typing import TYPE_CHECKING
+
+from btrfs2s3.commands.update import Updater
+from btrfs2s3.config import Config
+from btrfs2s3.config import load_from_path
+from btrfs2s3.lastrun import read_ctransids
+from btrfs2s3.preservation import next_wakeup
+
+if TYPE_CHECKING:
+    import argparse
+    from pathlib import Path
+    from typing import Sequence
+    from typing import TypedDict
+
+    from rich.console import Console
+
+_LOG = logging.getLogger(__name__)
+
+NAME = "daemon"
+
+DEFAULT_POLL_INTERVAL = 60.0
+"""The default number of seconds between checks for changes to sources."""
+
+
+if TYPE_CHECKING:
+
+    class _Args(TypedDict, total=False):
+        help: str
+        description: str
+        epilog: str
+
+
+ARGS: _Args = {
+    # shown in top-level help
+    "help": "continuously update snapshots and backups as needed",
+    # shown in subcommand help
+    "description": "Continuously update snapshots and backups as needed.",
+    "epilog": "For detailed docs and usage, see https://github.com/sbrudenell/btrfs2s3",
+}
+
+
+def add_args(parser: argparse.ArgumentParser) -> None:
+    """Add args for "btrfs2s3 daemon" to an ArgumentParser."""
+    parser.add_argument("config_file", type=load_from_path)
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL,
+        help="seconds between checks for changes to sources, and between "
+        f"retries of failed updates (default: {DEFAULT_POLL_INTERVAL:g})",
+    )
+    parser.add_argument(
+        "--wait-for-commit",
+        action="store_true",
+        help="wait for snapshot deletions to be committed to disk after each update",
+    )
+
+
+def _wait(
+    sources: Sequence[Path],
+    ctransids: dict[str, int],
+    *,
+    until: float,
+    poll_interval: float,
+) -> None:
+    while (remaining := until - time.time()) > 0:
+        time.sleep(min(remaining, poll_interval))
+        if read_ctransids(sources) != ctransids:
+            _LOG.debug("source data changed")
+            return
+
+
+def _run_update(updater: Updater, *, wait_for_commit: bool) -> None:
+    start, start_cpu = time.perf_counter(), time.process_time()
+    _, actions = updater.assess()
+    assessed = time.perf_counter()
+    if not actions.empty():
+        updater.execute(actions, wait_for_commit=wait_for_commit)
+    end, end_cpu = time.perf_counter(), time.process_time()
+    _LOG.info(
+        "update took %.3fs (%.3fs assessing), %.3fs CPU",
+        end - start,
+        assessed - start,
+        end_cpu - start_cpu,
+    )
+
+
+def command(*, console: Console, args: argparse.Namespace) -> int:
+    """Implements "btrfs2s3 daemon"."""
+    updater = Updater(
+        console=console, config=cast(Config, args.config_file), keep_listing=True
+    )
+    while True:
+        # Read these first, so we don't miss changes made during the update
+        ctransids = read_ctransids(updater.sources)
+        try:
+            _run_update(updater, wait_for_commit=args.wait_for_commit)
+        # Keep running through transient errors, like network failures
+        except Exception:  # noqa: BLE001
+            _LOG.exception("update failed, retrying in %gs", args.poll_interval)
+            until = time.time() + args.poll_interval
+        else:
+            wakeup = next_wakeup(updater.policy())
+            until = math.inf if wakeup is None else wakeup
+        _wait(updater.sources, ctransids, until=until, poll_interval=args.poll_interval)
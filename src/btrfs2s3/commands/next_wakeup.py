@@ -0,0 +1,94 @@
+"""Code for "btrfs2s3 next-wakeup"."""
+
+from __future__ import annotations
+
+from typing import cast
+from typing import TYPE_CHECKING
+
+import arrow
+
+from btrfs2s3.config import Config
+from btrfs2s3.config import load_from_path
+from btrfs2s3.preservation import next_wakeup
+from btrfs2s3.preservation import Params
+from btrfs2s3.preservation import Policy
+from btrfs2s3.zoneinfo import get_zoneinfo
+
+if TYPE_CHECKING:
+    import argparse
+    from typing import TypedDict
+
+    from rich.console import Console
+
+NAME = "next-wakeup"
+
+
+if TYPE_CHECKING:
+
+    class _Args(TypedDict, total=False):
+        help: str
+        description: str
+        epilog: str
+
+
+ARGS: _Args = {
+    # shown in top-level help
+    "help": "print the next time a time span boundary requires an update",
+    # shown in subcommand help
+    "description": "Print the next time at which a new time span starts in any "
+    "preservation policy, so new snapshots may be needed or old ones may expire. "
+    "Until then, an update is only needed if a source changes.",
+    "epilog": "For detailed docs and usage, see https://github.com/sbrudenell/btrfs2s3",
+}
+
+
+def add_args(parser: argparse.ArgumentParser) -> None:
+    """Add args for "btrfs2s3 next-wakeup" to an ArgumentParser."""
+    parser.add_argument("config_file", type=load_from_path)
+    parser.add_argument(
+        "--timestamp",
+        action="store_true",
+        help="print a unix timestamp, rather than an ISO 8601 time",
+    )
+
+
+def get_next_wakeup(config: Config, *, now: float | None = None) -> float | None:
+    """Returns the next time at which any policy in a config may change.
+
+    Args:
+        config: The config.
+        now: A timestamp to use as the current time. If None, defaults to the
+            actual current time.
+
+    Returns:
+        The earliest next_wakeup() of all the config's preservation policies,
+            or None if none of them preserve anything.
+    """
+    tzinfo = get_zoneinfo(config["timezone"])
+    if now is None:
+        now = arrow.get(tzinfo=tzinfo).timestamp()
+    preserves = {
+        upload["preserve"]
+        for source in config["sources"]
+        for upload in source["upload_to_remotes"]
+    }
+    wakeups = [
+        next_wakeup(Policy(params=Params.parse(preserve), tzinfo=tzinfo, now=now))
+        for preserve in preserves
+    ]
+    return min((w for w in wakeups if w is not None), default=None)
+
+
+def command(*, console: Console, args: argparse.Namespace) -> int:
+    """Implements "btrfs2s3 next-wakeup"."""
+    config = cast(Config, args.config_file)
+    wakeup = get_next_wakeup(config)
+    if wakeup is None:
+        console.print("no preservation policy preserves anything")
+        return 1
+    if args.timestamp:
+        console.print(f"{wakeup:.0f}", highlight=False)
+    else:
+        tzinfo = get_zoneinfo(config["timezone"])
+        console.print(arrow.get(wakeup, tzinfo=tzinfo).isoformat(), highlight=False)
+    return 0
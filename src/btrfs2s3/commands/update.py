@@ -3,12 +3,15 @@
 from __future__ import annotations
 
 from collections import defaultdict
+import os
 from pathlib import Path
+import time
 from typing import cast
 from typing import TYPE_CHECKING
 
 import arrow
 from boto3.session import Session
+from botocore.config import Config as BotocoreConfig
 from rich.box import HORIZONTALS
 from rich.console import Console
 from rich.console import Group
@@ -21,20 +24,36 @@ from rich.text import Text
 from rich.tree import Tree
 
 from btrfs2s3.action import Actions
+from btrfs2s3.action import Mirror
 from btrfs2s3.assessor import assess
 from btrfs2s3.assessor import Assessment
 from btrfs2s3.assessor import assessment_to_actions
 from btrfs2s3.assessor import BackupAssessment
 from btrfs2s3.assessor import SourceAssessment
+from btrfs2s3.cache import DEFAULT_REFRESH_INTERVAL
+from btrfs2s3.cache import ListingCache
+from btrfs2s3.checkpoint import UploadCheckpoints
+from btrfs2s3.commands.next_wakeup import get_next_wakeup
+from btrfs2s3.compress import check_available
+from btrfs2s3.compress import CompressParams
 from btrfs2s3.config import Config
 from btrfs2s3.config import load_from_path
+from btrfs2s3.lastrun import LastRun
+from btrfs2s3.lastrun import read_ctransids
 from btrfs2s3.preservation import Params
 from btrfs2s3.preservation import Policy
 from btrfs2s3.preservation import TS
 from btrfs2s3.resolver import Flags
 from btrfs2s3.resolver import KeepMeta
 from btrfs2s3.resolver import Reasons
+from btrfs2s3.sendstream import COMPRESSED_DATA_SUFFIX
+from btrfs2s3.sendstream import supports_compressed_data
 from btrfs2s3.thunk import TBD
+from btrfs2s3.upload import AutoUploadParams
+from btrfs2s3.upload import DEFAULT_CONCURRENCY
+from btrfs2s3.upload import DEFAULT_MAX_MEMORY
+from btrfs2s3.upload import Throttle
+from btrfs2s3.upload import UploadParams
 from btrfs2s3.zoneinfo import get_zoneinfo
 
 if TYPE_CHECKING:
@@ -45,8 +64,13 @@ if TYPE_CHECKING:
     from typing import Sequence
     from typing import TypedDict
 
+    from mypy_boto3_s3.client import S3Client
     from typing_extensions import TypeAlias
 
+    from btrfs2s3.config import CompressConfig
+    from btrfs2s3.config import S3RemoteConfig
+    from btrfs2s3.config import S3UploadConfig
+
     _Bounds: TypeAlias = Literal["[)", "()", "(]", "[]"]
 
 _iso8601_highlight = ISO8601Highlighter()
@@ -333,6 +357,41 @@ def print_actions(*, console: Console, actions: Actions) -> None:
             console.print()
 
 
+def get_upload_params(config: S3UploadConfig) -> UploadParams | AutoUploadParams:
+    """Returns parameters for uploading backups, from an upload config."""
+    concurrency = config.get("concurrency", DEFAULT_CONCURRENCY)
+    if "part_size" in config:
+        return UploadParams(part_size=config["part_size"], concurrency=concurrency)
+    return AutoUploadParams(
+        concurrency=concurrency, max_memory=config.get("max_memory", DEFAULT_MAX_MEMORY)
+    )
+
+
+def get_compress_params(config: CompressConfig | None) -> CompressParams | None:
+    """Returns parameters for compressing backups, from a compress config."""
+    if config is None:
+        return None
+    return CompressParams(
+        codec=config["codec"],
+        level=config.get("level", CompressParams.level),
+        window_log=config.get("window_log"),
+        threads=config.get("threads", CompressParams.threads),
+    )
+
+
+def _use_compressed_data(console: Console, requested: bool) -> bool:  # noqa: FBT001
+    if requested and not supports_compressed_data():
+        console.print(
+            "btrfs send --compressed-data isn't supported by this kernel or "
+            "btrfs-progs, sending uncompressed data instead"
+        )
+        return False
+    return requested
+
+
+# botocore's default
+_DEFAULT_MAX_POOL_CONNECTIONS = 10
+
 NAME = "update"
 
 
@@ -364,32 +423,85 @@ def add_args(parser: argparse.ArgumentParser) -> None:
         action="store_true",
         help="do not perform actions, just print a preview and exit",
     )
+    parser.add_argument(
+        "--wait-for-commit",
+        action="store_true",
+        help="wait for snapshot deletions to be committed to disk before exiting",
+    )
 
 
-def command(*, console: Console, args: argparse.Namespace) -> int:
-    """Implements "btrfs2s3 update"."""
-    if not console.is_terminal and not (args.force or args.pretend):
-        console.print("to run in unattended mode, use --force")
-        return 1
-
-    config = cast(Config, args.config_file)
-    tzinfo = get_zoneinfo(config["timezone"])
-    assert len(config["remotes"]) == 1  # noqa: S101
-    s3_remote = config["remotes"][0]["s3"]
+def _make_s3_client(
+    s3_remote: S3RemoteConfig, *, max_pool_connections: int
+) -> S3Client:
     s3_endpoint = s3_remote.get("endpoint", {})
+    session = Session(
+        region_name=s3_endpoint.get("region_name"),
+        profile_name=s3_endpoint.get("profile_name"),
+    )
+    return session.client(
+        "s3",
+        verify=s3_endpoint.get("verify"),
+        endpoint_url=s3_endpoint.get("endpoint_url"),
+        config=BotocoreConfig(max_pool_connections=max_pool_connections),
+    )
+
+
+def _get_throttle(s3_remote: S3RemoteConfig) -> Throttle | None:
+    s3_upload = s3_remote.get("upload", {})
+    if "max_bandwidth" not in s3_upload:
+        return None
+    return Throttle(s3_upload["max_bandwidth"])
+
 
+def _get_cache(
+    config: Config, s3_remote: S3RemoteConfig, *, keep_listing: bool
+) -> ListingCache | None:
+    refresh_interval = s3_remote.get("list_refresh_interval", DEFAULT_REFRESH_INTERVAL)
+    if "state_dir" in config:
+        return ListingCache.for_bucket(
+            Path(config["state_dir"]),
+            s3_remote["bucket"],
+            endpoint_url=s3_remote.get("endpoint", {}).get("endpoint_url"),
+            refresh_interval=refresh_interval,
+        )
+    if keep_listing:
+        return ListingCache(None, refresh_interval=refresh_interval)
+    return None
+
+
+def _get_checkpoints(
+    config: Config, s3_remote: S3RemoteConfig
+) -> UploadCheckpoints | None:
+    if "state_dir" not in config:
+        return None
+    return UploadCheckpoints.for_bucket(
+        Path(config["state_dir"]),
+        s3_remote["bucket"],
+        endpoint_url=s3_remote.get("endpoint", {}).get("endpoint_url"),
+    )
+
+
+def _check_config(config: Config) -> None:
     sources = config["sources"]
     assert len({source["snapshots"] for source in sources}) == 1  # noqa: S101
+    # Every source is uploaded to the same remotes. Backups are assessed
+    # against the first remote, and the others mirror it
     assert (  # noqa: S101
         len(
             {
-                upload["id"]
+                tuple(upload["id"] for upload in source["upload_to_remotes"])
                 for source in sources
-                for upload in source["upload_to_remotes"]
             }
         )
         == 1
     )
+    remote_ids = [upload["id"] for upload in sources[0]["upload_to_remotes"]]
+    assert len(set(remote_ids)) == len(remote_ids)  # noqa: S101
+    # A backup has the same key on every remote
+    assert all(  # noqa: S101
+        len({upload.get("prefix", "") for upload in source["upload_to_remotes"]}) == 1
+        for source in sources
+    )
     assert (  # noqa: S101
         len(
             {
@@ -410,37 +522,203 @@ def command(*, console: Console, args: argparse.Namespace) -> int:
         )
         == 1
     )
-
-    session = Session(
-        region_name=s3_endpoint.get("region_name"),
-        profile_name=s3_endpoint.get("profile_name"),
-    )
-    s3 = session.client(
-        "s3",
-        verify=s3_endpoint.get("verify"),
-        endpoint_url=s3_endpoint.get("endpoint_url"),
-    )
-    policy = Policy(
-        tzinfo=tzinfo,
-        params=Params.parse(sources[0]["upload_to_remotes"][0]["preserve"]),
+    assert (  # noqa: S101
+        len(
+            {
+                get_compress_params(upload.get("compress"))
+                for source in sources
+                for upload in source["upload_to_remotes"]
+            }
+        )
+        == 1
     )
-    asmt = assess(
-        snapshot_dir=Path(sources[0]["snapshots"]),
-        sources=[Path(source["path"]) for source in sources],
-        s3=s3,
-        bucket=s3_remote["bucket"],
-        policy=policy,
+    assert (  # noqa: S101
+        len(
+            {
+                upload.get("send_compressed_data", False)
+                for source in sources
+                for upload in source["upload_to_remotes"]
+            }
+        )
+        == 1
     )
-    actions = Actions()
-    assessment_to_actions(asmt, actions)
+
+
+class Updater:
+    """Runs updates of snapshots and backups, as described by a config.
+
+    Everything which doesn't change between updates (S3 clients and their
+    connection pools, upload settings and optionally the listing of the
+    bucket) is set up once, so a long-lived process can run many updates
+    cheaply.
+    """
+
+    def __init__(
+        self, *, console: Console, config: Config, keep_listing: bool = False
+    ) -> None:
+        """Constructs an Updater.
+
+        Args:
+            console: A Console on which to print warnings.
+            config: The config.
+            keep_listing: Whether to keep the listing of the bucket in memory
+                between updates, even if the config has no state_dir.
+        """
+        _check_config(config)
+        self.tzinfo = get_zoneinfo(config["timezone"])
+        sources = config["sources"]
+        upload_to_remote = sources[0]["upload_to_remotes"][0]
+        self.snapshot_dir = Path(sources[0]["snapshots"])
+        self.sources = [Path(source["path"]) for source in sources]
+        self._params = Params.parse(upload_to_remote["preserve"])
+        self._pipe_through = upload_to_remote.get("pipe_through", [])
+        self._compress = get_compress_params(upload_to_remote.get("compress"))
+        if self._compress is not None:
+            check_available(self._compress)
+        self._compressed_data = _use_compressed_data(
+            console, upload_to_remote.get("send_compressed_data", False)
+        )
+        key_suffix = (COMPRESSED_DATA_SUFFIX if self._compressed_data else "") + (
+            self._compress.suffix if self._compress is not None else ""
+        )
+        self._prefixes = {
+            Path(source["path"]): source["upload_to_remotes"][0].get("prefix", "")
+            for source in sources
+        }
+        self._suffixes = {path: key_suffix for path in self.sources}
+
+        s3_remotes = {remote["id"]: remote["s3"] for remote in config["remotes"]}
+        remote_ids = [upload["id"] for upload in sources[0]["upload_to_remotes"]]
+        s3_remote = s3_remotes[remote_ids[0]]
+        s3_upload = s3_remote.get("upload", {})
+        self._upload_params = get_upload_params(s3_upload)
+        self._max_concurrent_backups = s3_upload.get("max_concurrent_backups", 1)
+        # Every concurrent part upload needs its own connection
+        max_pool_connections = max(
+            _DEFAULT_MAX_POOL_CONNECTIONS,
+            self._upload_params.concurrency * self._max_concurrent_backups,
+        )
+        self.bucket = s3_remote["bucket"]
+        self._s3 = _make_s3_client(s3_remote, max_pool_connections=max_pool_connections)
+        self._throttle = _get_throttle(s3_remote)
+        self._checkpoints = _get_checkpoints(config, s3_remote)
+        self._mirrors = [
+            Mirror(
+                s3=_make_s3_client(
+                    s3_remotes[remote_id], max_pool_connections=max_pool_connections
+                ),
+                bucket=s3_remotes[remote_id]["bucket"],
+                throttle=_get_throttle(s3_remotes[remote_id]),
+                checkpoints=_get_checkpoints(config, s3_remotes[remote_id]),
+            )
+            for remote_id in remote_ids[1:]
+        ]
+        self._cache = _get_cache(config, s3_remote, keep_listing=keep_listing)
+
+    def policy(self) -> Policy:
+        """Returns the preservation policy, relative to the current time."""
+        return Policy(tzinfo=self.tzinfo, params=self._params)
+
+    def assess(self) -> tuple[Assessment, Actions]:
+        """Assesses the current state, relative to the current time.
+
+        Returns:
+            The assessment, and the actions needed to update.
+        """
+        asmt = assess(
+            snapshot_dir=self.snapshot_dir,
+            sources=self.sources,
+            s3=self._s3,
+            bucket=self.bucket,
+            policy=self.policy(),
+            cache=self._cache,
+            prefixes=self._prefixes,
+            suffixes=self._suffixes,
+            # One worker per CPU we may use
+            max_workers=len(os.sched_getaffinity(0)),
+        )
+        actions = Actions()
+        assessment_to_actions(asmt, actions)
+        return asmt, actions
+
+    def execute(self, actions: Actions, *, wait_for_commit: bool = False) -> None:
+        """Executes actions returned by assess().
+
+        Args:
+            actions: The actions to execute.
+            wait_for_commit: Whether to wait for snapshot deletions to be
+                committed.
+        """
+        try:
+            actions.execute(
+                self._s3,
+                self.bucket,
+                pipe_through=self._pipe_through,
+                upload_params=self._upload_params,
+                max_concurrent_backups=self._max_concurrent_backups,
+                throttle=self._throttle,
+                wait_for_commit=wait_for_commit,
+                compress=self._compress,
+                compressed_data=self._compressed_data,
+                checkpoints=self._checkpoints,
+                mirrors=self._mirrors,
+            )
+        except BaseException:
+            # We don't know which backups were created or deleted
+            if self._cache is not None:
+                self._cache.invalidate()
+            raise
+        # Abort uploads for backups which are no longer wanted
+        if self._checkpoints is not None:
+            self._checkpoints.prune(self._s3, self.bucket)
+        for mirror in self._mirrors:
+            if mirror.checkpoints is not None:
+                mirror.checkpoints.prune(mirror.s3, mirror.bucket)
+        if self._cache is not None:
+            self._cache.record_created(
+                self._s3,
+                self.bucket,
+                (intent.key() for intent in actions.iter_create_backup_intents()),
+            )
+            self._cache.record_deleted(
+                intent.key() for intent in actions.iter_delete_backup_intents()
+            )
+
+
+def _get_last_run(config: Config) -> LastRun | None:
+    if "state_dir" not in config:
+        return None
+    return LastRun.for_config(Path(config["state_dir"]), config)
+
+
+def command(*, console: Console, args: argparse.Namespace) -> int:
+    """Implements "btrfs2s3 update"."""
+    if not console.is_terminal and not (args.force or args.pretend):
+        console.print("to run in unattended mode, use --force")
+        return 1
+
+    config = cast(Config, args.config_file)
+    now = time.time()
+    last_run = _get_last_run(config)
+    ctransids: dict[str, int] = {}
+    if last_run is not None:
+        # Read these first, so changes made during the update aren't missed
+        ctransids = read_ctransids(Path(source["path"]) for source in config["sources"])
+        # With --pretend, the user wants to see the full assessment
+        if not args.pretend and last_run.nothing_changed(ctransids, now=now):
+            console.print("nothing to be done! (no changes since the last update)")
+            return 0
+
+    updater = Updater(console=console, config=config)
+    asmt, actions = updater.assess()
 
     if console.is_terminal:
         print_assessment(
             console=console,
             asmt=asmt,
-            tzinfo=tzinfo,
-            snapshot_dir=Path(sources[0]["snapshots"]),
-            bucket=s3_remote["bucket"],
+            tzinfo=updater.tzinfo,
+            snapshot_dir=updater.snapshot_dir,
+            bucket=updater.bucket,
         )
         print_actions(console=console, actions=actions)
 
@@ -449,13 +727,11 @@ def command(*, console: Console, args: argparse.Namespace) -> int:
 
     if actions.empty():
         console.print("nothing to be done!")
+    elif args.force or Confirm(console=console).ask("continue?"):
+        updater.execute(actions, wait_for_commit=args.wait_for_commit)
+    else:
         return 0
 
-    if args.force or Confirm(console=console).ask("continue?"):
-        actions.execute(
-            s3,
-            s3_remote["bucket"],
-            pipe_through=sources[0]["upload_to_remotes"][0].get("pipe_through", []),
-        )
-
+    if last_run is not None:
+        last_run.record(ctransids, next_wakeup=get_next_wakeup(config, now=now))
     return 0
@@ -0,0 +1,144 @@
+"""In-process compression of backup streams.
+
+Compressing with a pipe_through command like ["gzip"] costs an extra process
+and an extra pipe, and gzip is single-threaded, which limits the throughput
+of large backups. This module compresses a stream in-process with zstd, which
+can use several threads, and can be read directly into upload part buffers.
+
+zstd is provided by the optional zstandard package.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+from typing import Literal
+from typing import TYPE_CHECKING
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    _HAVE_ZSTANDARD = False
+else:
+    _HAVE_ZSTANDARD = True
+
+if TYPE_CHECKING:
+    from typing import IO
+
+    from btrfs2s3.upload import SupportsReadinto
+
+Codec = Literal["zstd"]
+"""The name of a compression codec."""
+
+SUFFIXES: dict[Codec, str] = {"zstd": ".zst"}
+"""The key suffix for backups compressed with each codec."""
+
+MIN_LEVEL = 1
+"""The minimum zstd compression level."""
+MAX_LEVEL = 22
+"""The maximum zstd compression level."""
+DEFAULT_LEVEL = 3
+"""The default zstd compression level (the same as the zstd command)."""
+MIN_WINDOW_LOG = 10
+"""The minimum zstd window size, as a power of 2."""
+MAX_WINDOW_LOG = 31
+"""The maximum zstd window size, as a power of 2."""
+
+# Read from the source stream in chunks of this size. This is larger than
+# zstandard's default, to reduce the number of calls across the GIL
+_READ_SIZE = 2**20
+
+
+@dataclasses.dataclass(frozen=True)
+class CompressParams:
+    """Parameters which control compression of a backup stream.
+
+    Attributes:
+        codec: The compression codec. Only "zstd" is supported.
+        level: The compression level.
+        window_log: The compression window size, as a power of 2. If None,
+            it's chosen according to level. Windows larger than 2**27 bytes
+            need a matching option when decompressing (for example
+            "zstd -d --long=31").
+        threads: The number of compression threads. 0 means compression is
+            done on the thread reading the stream, and -1 means one thread
+            per CPU.
+    """
+
+    codec: Codec = "zstd"
+    level: int = DEFAULT_LEVEL
+    window_log: int | None = None
+    threads: int = -1
+
+    def __post_init__(self) -> None:
+        """Do validation checks."""
+        if self.codec not in SUFFIXES:
+            msg = f"unsupported codec {self.codec!r}"
+            raise ValueError(msg)
+        if not MIN_LEVEL <= self.level <= MAX_LEVEL:
+            msg = (
+                f"level must be between {MIN_LEVEL} and {MAX_LEVEL}, "
+                f"got {self.level}"
+            )
+            raise ValueError(msg)
+        if self.window_log is not None and not (
+            MIN_WINDOW_LOG <= self.window_log <= MAX_WINDOW_LOG
+        ):
+            msg = (
+                f"window_log must be between {MIN_WINDOW_LOG} and "
+                f"{MAX_WINDOW_LOG}, got {self.window_log}"
+            )
+            raise ValueError(msg)
+        if self.threads < -1:
+            msg = f"threads must be at least -1, got {self.threads}"
+            raise ValueError(msg)
+
+    @property
+    def suffix(self) -> str:
+        """The key suffix for backups compressed with these parameters."""
+        return SUFFIXES[self.codec]
+
+
+def check_available(params: CompressParams) -> None:
+    """Checks that the library for a compression codec is installed.
+
+    Args:
+        params: The compression parameters.
+
+    Raises:
+        RuntimeError: If the codec's library isn't installed.
+    """
+    if params.codec == "zstd" and not _HAVE_ZSTANDARD:
+        msg = "compression with zstd requires the zstandard package"
+        raise RuntimeError(msg)
+
+
+def compress_stream(stream: IO[bytes], params: CompressParams) -> SupportsReadinto:
+    """Wraps a binary stream so that reading from it gives compressed data.
+
+    The source stream is read lazily as the result is read. Closing the
+    result doesn't close the source stream.
+
+    Args:
+        stream: The stream to compress.
+        params: The compression parameters.
+
+    Returns:
+        A stream of compressed data, which supports readinto().
+
+    Raises:
+        RuntimeError: If the codec's library isn't installed.
+    """
+    check_available(params)
+    overrides: dict[str, int | bool] = {}
+    if params.window_log is not None:
+        # Like "zstd --long", a larger window comes with long-distance
+        # matching, which is what makes use of it
+        overrides = {"window_log": params.window_log, "enable_ldm": True}
+    compression_params = zstandard.ZstdCompressionParameters.from_level(
+        params.level, threads=params.threads, **overrides
+    )
+    compressor = zstandard.ZstdCompressor(compression_params=compression_params)
+    reader: SupportsReadinto = compressor.stream_reader(
+        stream, read_size=_READ_SIZE, closefd=False
+    )
+    return reader
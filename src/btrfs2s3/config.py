@@ -10,6 +10,9 @@ from typing import TypedDict
 
 from cfgv import Array
 from cfgv import check_array
+from cfgv import check_bool
+from cfgv import check_int
+from cfgv import check_one_of
 from cfgv import check_string
 from cfgv import check_type
 from cfgv import load_from_filename
@@ -21,11 +24,18 @@ from cfgv import RequiredRecurse
 from typing_extensions import NotRequired
 from yaml import safe_load
 
+from btrfs2s3.compress import CompressParams
+from btrfs2s3.compress import SUFFIXES
 from btrfs2s3.preservation import Params
+from btrfs2s3.upload import AutoUploadParams
+from btrfs2s3.upload import Throttle
+from btrfs2s3.upload import UploadParams
 
 if TYPE_CHECKING:
     from os import PathLike
 
+    from btrfs2s3.compress import Codec
+
 
 class Error(Exception):
     """The top-level class for exceptions generated by this module."""
@@ -44,6 +54,83 @@ def _check_preserve(v: Any) -> None:  # noqa: ANN401
         raise InvalidConfigError(msg) from ex
 
 
+def _check_part_size(v: Any) -> None:  # noqa: ANN401
+    check_int(v)
+    try:
+        UploadParams(part_size=v)
+    except ValueError as ex:
+        msg = "Expected a valid part size"
+        raise InvalidConfigError(msg) from ex
+
+
+def _check_concurrency(v: Any) -> None:  # noqa: ANN401
+    check_int(v)
+    try:
+        UploadParams(concurrency=v)
+    except ValueError as ex:
+        msg = "Expected a valid concurrency"
+        raise InvalidConfigError(msg) from ex
+
+
+def _check_max_memory(v: Any) -> None:  # noqa: ANN401
+    check_int(v)
+    try:
+        AutoUploadParams(max_memory=v)
+    except ValueError as ex:
+        msg = "Expected a valid memory limit"
+        raise InvalidConfigError(msg) from ex
+
+
+def _check_max_concurrent_backups(v: Any) -> None:  # noqa: ANN401
+    check_int(v)
+    if v < 1:
+        msg = "Expected at least 1 concurrent backup"
+        raise InvalidConfigError(msg)
+
+
+def _check_max_bandwidth(v: Any) -> None:  # noqa: ANN401
+    check_int(v)
+    try:
+        Throttle(v)
+    except ValueError as ex:
+        msg = "Expected a valid bandwidth limit"
+        raise InvalidConfigError(msg) from ex
+
+
+def _check_list_refresh_interval(v: Any) -> None:  # noqa: ANN401
+    check_int(v)
+    if v < 1:
+        msg = "Expected a refresh interval of at least 1 run"
+        raise InvalidConfigError(msg)
+
+
+def _check_level(v: Any) -> None:  # noqa: ANN401
+    check_int(v)
+    try:
+        CompressParams(level=v)
+    except ValueError as ex:
+        msg = "Expected a valid compression level"
+        raise InvalidConfigError(msg) from ex
+
+
+def _check_window_log(v: Any) -> None:  # noqa: ANN401
+    check_int(v)
+    try:
+        CompressParams(window_log=v)
+    except ValueError as ex:
+        msg = "Expected a valid window size"
+        raise InvalidConfigError(msg) from ex
+
+
+def _check_threads(v: Any) -> None:  # noqa: ANN401
+    check_int(v)
+    try:
+        CompressParams(threads=v)
+    except ValueError as ex:
+        msg = "Expected a valid number of threads"
+        raise InvalidConfigError(msg) from ex
+
+
 # this is the same style used in cfgv
 _OptionalRecurseNoDefault = namedtuple(  # noqa: PYI024
     "_OptionalRecurseNoDefault", ("key", "schema")
@@ -79,11 +166,34 @@ _S3_ENDPOINT_SCHEMA = Map(
 )
 
 
+class S3UploadConfig(TypedDict):
+    """A config dict for how to upload backups to an S3 remote."""
+
+    part_size: NotRequired[int]
+    concurrency: NotRequired[int]
+    max_memory: NotRequired[int]
+    max_concurrent_backups: NotRequired[int]
+    max_bandwidth: NotRequired[int]
+
+
+_S3_UPLOAD_SCHEMA = Map(
+    "S3UploadConfig",
+    None,
+    OptionalNoDefault("part_size", _check_part_size),
+    OptionalNoDefault("concurrency", _check_concurrency),
+    OptionalNoDefault("max_memory", _check_max_memory),
+    OptionalNoDefault("max_concurrent_backups", _check_max_concurrent_backups),
+    OptionalNoDefault("max_bandwidth", _check_max_bandwidth),
+)
+
+
 class S3RemoteConfig(TypedDict):
     """A config dict for how to access an S3 remote."""
 
     bucket: str
     endpoint: NotRequired[S3EndpointConfig]
+    upload: NotRequired[S3UploadConfig]
+    list_refresh_interval: NotRequired[int]
 
 
 _S3_SCHEMA = Map(
@@ -91,6 +201,8 @@ _S3_SCHEMA = Map(
     None,
     Required("bucket", check_string),
     _OptionalRecurseNoDefault("endpoint", _S3_ENDPOINT_SCHEMA),
+    _OptionalRecurseNoDefault("upload", _S3_UPLOAD_SCHEMA),
+    OptionalNoDefault("list_refresh_interval", _check_list_refresh_interval),
 )
 
 
@@ -109,12 +221,34 @@ _REMOTE_SCHEMA = Map(
 )
 
 
+class CompressConfig(TypedDict):
+    """A config dict for compressing backups in-process."""
+
+    codec: Codec
+    level: NotRequired[int]
+    window_log: NotRequired[int]
+    threads: NotRequired[int]
+
+
+_COMPRESS_SCHEMA = Map(
+    "CompressConfig",
+    None,
+    Required("codec", check_one_of(tuple(SUFFIXES))),
+    OptionalNoDefault("level", _check_level),
+    OptionalNoDefault("window_log", _check_window_log),
+    OptionalNoDefault("threads", _check_threads),
+)
+
+
 class UploadToRemoteConfig(TypedDict):
     """A config dict for uploading a source to a remote."""
 
     id: str
     preserve: str
     pipe_through: NotRequired[list[list[str]]]
+    prefix: NotRequired[str]
+    compress: NotRequired[CompressConfig]
+    send_compressed_data: NotRequired[bool]
 
 
 _UPLOAD_TO_REMOTE_SCHEMA = Map(
@@ -122,6 +256,9 @@ _UPLOAD_TO_REMOTE_SCHEMA = Map(
     "id",
     Required("preserve", _check_preserve),
     OptionalNoDefault("pipe_through", check_array(check_array(check_string))),
+    OptionalNoDefault("prefix", check_string),
+    _OptionalRecurseNoDefault("compress", _COMPRESS_SCHEMA),
+    OptionalNoDefault("send_compressed_data", check_bool),
 )
 
 
@@ -155,6 +292,7 @@ class Config(TypedDict):
     timezone: str
     sources: list[SourceConfig]
     remotes: list[RemoteConfig]
+    state_dir: NotRequired[str]
 
 
 _SCHEMA = Map(
@@ -163,6 +301,7 @@ _SCHEMA = Map(
     Required("timezone", check_string),
     RequiredRecurse("sources", Array(_SOURCE_SCHEMA, allow_empty=False)),
     RequiredRecurse("remotes", Array(_REMOTE_SCHEMA, allow_empty=False)),
+    OptionalNoDefault("state_dir", check_string),
 )
 
 
@@ -0,0 +1,137 @@
+"""A record of the last successful update, for skipping updates with nothing to do.
+
+Most runs of "btrfs2s3 update" from cron have nothing to do: no source has
+changed, and no time span of the preservation policy has started. Finding
+that out the usual way means listing the snapshot directory and the bucket,
+and running the resolver.
+
+After a successful update, we record the ctransid of each source and the next
+time at which the policy may change (see next_wakeup()). Until either of
+those changes, the next update can exit after one ioctl per source.
+
+The record is keyed by a digest of the config, so changing the config always
+results in a full update.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from typing import TYPE_CHECKING
+
+from btrfs2s3._internal import btrfsioctl
+
+if TYPE_CHECKING:
+    from pathlib import Path
+    from typing import Iterable
+
+    from btrfs2s3.config import Config
+
+_LOG = logging.getLogger(__name__)
+
+# Increment this when changing the format of the file
+_VERSION = 1
+
+
+def read_ctransids(sources: Iterable[Path]) -> dict[str, int]:
+    """Reads the ctransid of each source subvolume.
+
+    Args:
+        sources: The paths of the source subvolumes.
+
+    Returns:
+        The ctransid of each source, keyed by path.
+    """
+    return {
+        str(source): btrfsioctl.subvolume_info(source).ctransid for source in sources
+    }
+
+
+def _config_digest(config: Config) -> str:
+    data = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class LastRun:
+    """An on-disk record of the last successful update of a config."""
+
+    def __init__(self, path: Path, config: Config) -> None:
+        """Constructs a LastRun.
+
+        Args:
+            path: The path of the record file. It will be created if it
+                doesn't exist.
+            config: The config being updated.
+        """
+        self._path = path
+        self._digest = _config_digest(config)
+
+    @classmethod
+    def for_config(cls, state_dir: Path, config: Config) -> LastRun:
+        """Constructs a LastRun for a config, under a state directory.
+
+        Args:
+            state_dir: The directory in which to store the record file.
+            config: The config being updated.
+
+        Returns:
+            A LastRun whose file name is unique to the config.
+        """
+        digest = _config_digest(config)
+        return cls(state_dir / f"last-run-{digest[:16]}.json", config)
+
+    def nothing_changed(self, ctransids: dict[str, int], *, now: float) -> bool:
+        """Returns whether an update is known to have nothing to do.
+
+        Args:
+            ctransids: The current ctransids of the sources, as returned by
+                read_ctransids().
+            now: The current time.
+
+        Returns:
+            True if the last successful update had the same config and the
+                same source ctransids, and the next time span boundary it
+                recorded hasn't passed.
+        """
+        try:
+            with self._path.open() as fp:
+                data = json.load(fp)
+            if data["version"] != _VERSION or data["config_digest"] != self._digest:
+                return False
+            next_wakeup = data["next_wakeup"]
+            if data["ctransids"] != ctransids:
+                _LOG.debug("sources have changed since the last update")
+                return False
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, TypeError):
+            _LOG.warning("ignoring unreadable last-run record %s", self._path)
+            return False
+        if next_wakeup is not None and now >= next_wakeup:
+            _LOG.debug("a time span boundary has passed since the last update")
+            return False
+        return True
+
+    def record(self, ctransids: dict[str, int], *, next_wakeup: float | None) -> None:
+        """Records a successful update.
+
+        Args:
+            ctransids: The ctransids of the sources, read before the update
+                started.
+            next_wakeup: The next time at which the policy may change, as of
+                the start of the update, or None if it never changes.
+        """
+        data = {
+            "version": _VERSION,
+            "config_digest": self._digest,
+            "ctransids": ctransids,
+            "next_wakeup": next_wakeup,
+        }
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        # Write atomically, in case another instance is reading
+        tmp_path = self._path.with_name(f"{self._path.name}.{os.getpid()}.tmp")
+        with tmp_path.open("w") as fp:
+            json.dump(data, fp)
+        tmp_path.replace(self._path)
@@ -9,6 +9,8 @@ from typing import TYPE_CHECKING
 
 from rich.logging import RichHandler
 
+from btrfs2s3.commands import daemon
+from btrfs2s3.commands import next_wakeup
 from btrfs2s3.commands import update
 from btrfs2s3.console import CONSOLE
 
@@ -38,6 +40,8 @@ def main(*, console: Console | None = None, argv: Sequence[str] | None = None) -
     )
 
     update.add_args(subparsers.add_parser(update.NAME, **update.ARGS))
+    daemon.add_args(subparsers.add_parser(daemon.NAME, **daemon.ARGS))
+    next_wakeup.add_args(subparsers.add_parser(next_wakeup.NAME, **next_wakeup.ARGS))
 
     args = parser.parse_args(argv)
 
@@ -50,6 +54,10 @@ def main(*, console: Console | None = None, argv: Sequence[str] | None = None) -
 
     if args.command == update.NAME:
         return update.command(console=console, args=args)
+    if args.command == daemon.NAME:
+        return daemon.command(console=console, args=args)
+    if args.command == next_wakeup.NAME:
+        return next_wakeup.command(console=console, args=args)
     raise NotImplementedError
 
 
@@ -59,11 +59,16 @@ from typing_extensions import Self
 from typing_extensions import TypeAlias
 from typing_extensions import TypedDict
 
+from btrfs2s3._internal import timespans
 from btrfs2s3._internal.arrowutil import convert_span
 from btrfs2s3._internal.arrowutil import iter_time_spans
+from btrfs2s3._internal.timespanbuckets import bucket_time_spans
+from btrfs2s3._internal.timespanbuckets import TimeSpanBuckets
+from btrfs2s3._internal.timespans import FRAMES
 
 if TYPE_CHECKING:
     from typing import Iterator
+    from typing import Sequence
 
 TS: TypeAlias = Tuple[float, float]
 """An alias for tuple[float, float] which is used as a time span type.
@@ -249,6 +254,8 @@ class Policy:
         self._params = params
         self._tzinfo = tzinfo
         self._now = now
+        # Frames are named in the singular, e.g. "years" -> "year"
+        self._frames = tuple(f for f in FRAMES if getattr(params, f"{f}s"))
 
         kwargs = {t: range(0, -getattr(params, t), -1) for t in TIMEFRAMES}
         # https://github.com/python/mypy/issues/10023
@@ -261,6 +268,11 @@ class Policy:
             )
         }
 
+    @property
+    def params(self) -> Params:
+        """Returns the Params which define this Policy."""
+        return self._params
+
     @property
     def tzinfo(self) -> tzinfo:
         """Returns the time zone object used by this Policy."""
@@ -306,14 +318,27 @@ class Policy:
             (timestamp, timestamp) time span tuples, in descending order of
                 length.
         """
-        kwargs = {t: (0,) if getattr(self._params, t) else () for t in TIMEFRAMES}
-        # https://github.com/python/mypy/issues/10023
-        for span in iter_time_spans(
-            arrow.get(timestamp, tzinfo=self._tzinfo),
-            bounds="[]",
-            **kwargs,  # type: ignore[misc]
-        ):
-            yield convert_span(span)
+        yield from timespans.iter_time_spans(timestamp, self._tzinfo, self._frames)
+
+    def bucket_time_spans(self, timestamps: Sequence[float]) -> list[TimeSpanBuckets]:
+        """Computes the time spans which overlap each of many timestamps.
+
+        This is a bulk version of iter_time_spans(). It returns the same time
+        spans, but grouped by timeframe, with each timestamp's time span
+        identified by an index. This is much faster than calling
+        iter_time_spans() for each timestamp when there are many timestamps
+        and NumPy is installed.
+
+        Args:
+            timestamps: The timestamps to query.
+
+        Returns:
+            A TimeSpanBuckets for each timeframe, in the same order as
+                iter_time_spans() yields time spans. For each timeframe,
+                buckets.time_spans[buckets.ids[i]] is the time span which
+                contains timestamps[i].
+        """
+        return bucket_time_spans(timestamps, self._tzinfo, self._frames)
 
     def should_preserve_for_time_span(self, time_span: TS) -> bool:
         """Returns whether we want to retain a snapshot for a time span.
@@ -329,3 +354,30 @@ class Policy:
                 given time span.
         """
         return time_span in self._preserve_for_time_spans
+
+
+def next_wakeup(policy: Policy) -> float | None:
+    """Returns the next time at which a Policy's decisions may change.
+
+    At the end of the current time span of each of the policy's timeframes, a
+    new time span starts, in which a new snapshot may be nominal. At the same
+    time, the oldest preserved time span of that timeframe falls out of the
+    policy, so snapshots may expire. Nothing else changes what the policy
+    preserves, so between these times, btrfs2s3 only needs to run to back up
+    changes to sources.
+
+    Args:
+        policy: The policy in question.
+
+    Returns:
+        The earliest timestamp after policy.now at which a new time span
+            starts, or None if the policy doesn't preserve anything.
+    """
+    kwargs = {t: (0,) for t in TIMEFRAMES if getattr(policy.params, t)}
+    # https://github.com/python/mypy/issues/10023
+    time_spans = iter_time_spans(
+        arrow.get(policy.now, tzinfo=policy.tzinfo),
+        bounds="[]",
+        **kwargs,  # type: ignore[misc]
+    )
+    return min((end.timestamp() for _, end in time_spans), default=None)
@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import collections
 import contextlib
 from contextvars import ContextVar
 import dataclasses
@@ -13,16 +12,19 @@ from typing import TYPE_CHECKING
 import uuid
 import warnings
 
-from btrfsutil import SubvolumeInfo
 from typing_extensions import Self
 from typing_extensions import TypeAlias
 from typing_extensions import TypeVar
 
+from btrfs2s3._internal.btrfsioctl import SubvolumeInfo
+from btrfs2s3._internal.slots import add_slots
 from btrfs2s3._internal.util import backup_of_snapshot
 from btrfs2s3.backups import BackupInfo
 
 if TYPE_CHECKING:
+    from typing import AbstractSet
     from typing import Collection
+    from typing import Iterable
     from typing import Iterator
 
     from btrfs2s3.preservation import Policy
@@ -43,30 +45,55 @@ _I = TypeVar("_I", bound=_Info)
 
 class _Index(Generic[_I]):
     def __init__(self, *, items: Collection[_I], policy: Policy) -> None:
-        self._item_by_uuid = {}
-        self._items_by_time_span = collections.defaultdict(list)
+        self._policy = policy
+        self._item_by_uuid: dict[bytes, _I] = {}
+        # The nominal item of each time span is the one with the lowest
+        # ctransid. It's maintained as items are added, so lookups are O(1)
+        self._nominal_by_time_span: dict[TS, _I] = {}
+        self._most_recent: _I | None = None
 
+        items = list(items)
         for item in items:
-            self._item_by_uuid[item.uuid] = item
-            for time_span in policy.iter_time_spans(item.ctime):
-                self._items_by_time_span[time_span].append(item)
+            self._add_item(item)
+        # Compute all time spans at once, which is much faster for long
+        # histories
+        for buckets in policy.bucket_time_spans([item.ctime for item in items]):
+            nominals: list[_I | None] = [None] * len(buckets.time_spans)
+            for item, bucket_id in zip(items, buckets.ids):
+                nominal = nominals[bucket_id]
+                if nominal is None or item.ctransid < nominal.ctransid:
+                    nominals[bucket_id] = item
+            for time_span, nominal in zip(buckets.time_spans, nominals):
+                if nominal is not None:
+                    self._add_to_time_span(time_span, nominal)
+
+    def _add_item(self, item: _I) -> None:
+        self._item_by_uuid[item.uuid] = item
+        if self._most_recent is None or item.ctransid > self._most_recent.ctransid:
+            self._most_recent = item
+
+    def _add_to_time_span(self, time_span: TS, item: _I) -> None:
+        nominal = self._nominal_by_time_span.get(time_span)
+        # Ties go to the item added first
+        if nominal is None or item.ctransid < nominal.ctransid:
+            self._nominal_by_time_span[time_span] = item
+
+    def add(self, item: _I) -> None:
+        self._add_item(item)
+        for time_span in self._policy.iter_time_spans(item.ctime):
+            self._add_to_time_span(time_span, item)
 
     def get_nominal(self, time_span: TS) -> _I | None:
-        items = self._items_by_time_span.get(time_span)
-        if items:
-            return min(items, key=lambda i: i.ctransid)
-        return None
+        return self._nominal_by_time_span.get(time_span)
 
     def get(self, uuid: bytes) -> _I | None:
         return self._item_by_uuid.get(uuid)
 
     def get_most_recent(self) -> _I | None:
-        if self._item_by_uuid:
-            return max(self._item_by_uuid.values(), key=lambda i: i.ctransid)
-        return None
+        return self._most_recent
 
     def get_all_time_spans(self) -> Collection[TS]:
-        return self._items_by_time_span.keys()
+        return self._nominal_by_time_span.keys()
 
 
 class Reasons(enum.Flag):
@@ -84,26 +111,48 @@ class Flags(enum.Flag):
     SnapshotIsNewer = enum.auto()
 
 
-@dataclasses.dataclass
+# Shared by all KeepMeta with no time spans or other uuids
+_NO_TIME_SPANS: frozenset[TS] = frozenset()
+_NO_UUIDS: frozenset[bytes] = frozenset()
+
+_V = TypeVar("_V")
+
+
+def _union(a: AbstractSet[_V], b: AbstractSet[_V]) -> AbstractSet[_V]:
+    # Avoid allocating new sets in the common case that one side is empty
+    if not b:
+        return a
+    if not a:
+        return b
+    return a | b
+
+
+@add_slots
+@dataclasses.dataclass(frozen=True)
 class KeepMeta:
     reasons: Reasons = Reasons.Empty
     flags: Flags = Flags.Empty
-    time_spans: set[TS] = field(default_factory=set)
-    other_uuids: set[bytes] = field(default_factory=set)
+    time_spans: AbstractSet[TS] = _NO_TIME_SPANS
+    other_uuids: AbstractSet[bytes] = _NO_UUIDS
 
     def __or__(self, other: Self) -> Self:
         return self.__class__(
             reasons=self.reasons | other.reasons,
             flags=self.flags | other.flags,
-            time_spans=self.time_spans | other.time_spans,
-            other_uuids=self.other_uuids | other.other_uuids,
+            time_spans=_union(self.time_spans, other.time_spans),
+            other_uuids=_union(self.other_uuids, other.other_uuids),
         )
 
 
+EMPTY_KEEP_META = KeepMeta()
+"""A KeepMeta with no reasons, which may be shared as KeepMeta is immutable."""
+
+
+@add_slots
 @dataclasses.dataclass
 class _MarkedItem(Generic[_I]):
     item: _I
-    meta: KeepMeta = field(default_factory=KeepMeta)
+    meta: KeepMeta = EMPTY_KEEP_META
 
 
 class _Marker(Generic[_I]):
@@ -113,8 +162,8 @@ class _Marker(Generic[_I]):
             "reasons", default=Reasons.Empty
         )
         self._flags_ctx: ContextVar[Flags] = ContextVar("flags", default=Flags.Empty)
-        self._time_span_ctx: ContextVar[set[TS]] = ContextVar(
-            "time_span", default=set()
+        self._time_span_ctx: ContextVar[frozenset[TS]] = ContextVar(
+            "time_span", default=_NO_TIME_SPANS
         )
 
     @contextlib.contextmanager
@@ -148,7 +197,9 @@ class _Marker(Generic[_I]):
             reasons=self._reasons_ctx.get(),
             flags=flags | self._flags_ctx.get(),
             time_spans=self._time_span_ctx.get(),
-            other_uuids={other_uuid} if other_uuid is not None else set(),
+            other_uuids=(
+                frozenset((other_uuid,)) if other_uuid is not None else _NO_UUIDS
+            ),
         )
         if not update.reasons:
             raise AssertionError
@@ -273,11 +324,12 @@ class _Resolver:
         with self._with_reasons(Reasons.MostRecent):
             self._keep_most_recent_snapshot()
 
-    def _keep_send_ancestors_of_backups(self) -> None:
-        # Ensure the send-parent ancestors of any kept backups are also kept
+    def _keep_send_ancestors_of_backups(self, backups: Iterable[BackupInfo]) -> None:
+        # Ensure the send-parent ancestors of the given kept backups are also
+        # kept
         backups_to_check: SimpleQueue[BackupInfo] = SimpleQueue()
-        for marked_item in self._keep_backups.get_result().values():
-            backups_to_check.put(marked_item.item)
+        for backup in backups:
+            backups_to_check.put(backup)
         while not backups_to_check.empty():
             backup = backups_to_check.get()
             if not backup.send_parent_uuid:
@@ -308,7 +360,73 @@ class _Resolver:
 
     def keep_send_ancestors_of_backups(self) -> None:
         with self._with_reasons(Reasons.SendAncestor):
-            self._keep_send_ancestors_of_backups()
+            self._keep_send_ancestors_of_backups(
+                [
+                    marked_item.item
+                    for marked_item in self._keep_backups.get_result().values()
+                ]
+            )
+
+    def add_snapshot(self, snapshot: SubvolumeInfo) -> KeepBackup | None:
+        # Do the same work as resolve(), but only for time spans which
+        # include the new snapshot
+        self._snapshots.add(snapshot)
+        with self._with_reasons(Reasons.Preserved):
+            for time_span in self._policy.iter_time_spans(snapshot.ctime):
+                if not self._policy.should_preserve_for_time_span(time_span):
+                    continue
+                nominal_snapshot = self._snapshots.get_nominal(time_span)
+                if nominal_snapshot is None or nominal_snapshot.uuid != snapshot.uuid:
+                    continue
+                with self._with_time_span(time_span):
+                    self._keep_snapshot_and_backup_for_time_span(time_span)
+        most_recent_snapshot = self._snapshots.get_most_recent()
+        if most_recent_snapshot and most_recent_snapshot.uuid == snapshot.uuid:
+            self.keep_most_recent_snapshot()
+        keep_backup = self._keep_backups.get_result().get(snapshot.uuid)
+        if keep_backup is None:
+            return None
+        with self._with_reasons(Reasons.SendAncestor):
+            self._keep_send_ancestors_of_backups([keep_backup.item])
+        return keep_backup
+
+
+class IncrementalResolver:
+    """Resolves which snapshots and backups to keep, and allows adding snapshots.
+
+    Constructing an IncrementalResolver does the same work as resolve(). Then
+    add_snapshot() adds a newly-created snapshot, doing only the work needed
+    for the time spans which include it.
+    """
+
+    def __init__(
+        self,
+        *,
+        snapshots: Collection[SubvolumeInfo],
+        backups: Collection[BackupInfo],
+        policy: Policy,
+    ) -> None:
+        self._resolver = _Resolver(snapshots=snapshots, backups=backups, policy=policy)
+        self._resolver.keep_snapshots_and_backups_for_preserved_time_spans()
+
+        self._resolver.keep_most_recent_snapshot()
+
+        # Future: is there a case where we need to keep a snapshot because it'll
+        # be used as the send-parent of a future backup, but *isn't* otherwise
+        # kept?
+
+        self._resolver.keep_send_ancestors_of_backups()
+
+    def get_result(self) -> Result:
+        return self._resolver.get_result()
+
+    def add_snapshot(self, snapshot: SubvolumeInfo) -> KeepBackup | None:
+        # The snapshot and a backup of it are kept for the same reasons
+        # resolve() would keep them, and the backup's send-parent is chosen
+        # the same way. Marks on existing items are never removed: if the new
+        # snapshot is the most recent, the previous most recent snapshot is
+        # still kept. Returns None if the new snapshot shouldn't be kept
+        return self._resolver.add_snapshot(snapshot)
 
 
 def resolve(
@@ -317,13 +435,6 @@ def resolve(
     backups: Collection[BackupInfo],
     policy: Policy,
 ) -> Result:
-    resolver = _Resolver(snapshots=snapshots, backups=backups, policy=policy)
-    resolver.keep_snapshots_and_backups_for_preserved_time_spans()
-
-    resolver.keep_most_recent_snapshot()
-
-    # Future: is there a case where we need to keep a snapshot because it'll be
-    # used as the send-parent of a future backup, but *isn't* otherwise kept?
-
-    resolver.keep_send_ancestors_of_backups()
-    return resolver.get_result()
+    return IncrementalResolver(
+        snapshots=snapshots, backups=backups, policy=policy
+    ).get_result()
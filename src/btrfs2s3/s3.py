@@ -2,11 +2,13 @@
 
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
 from typing import TYPE_CHECKING
 
 from btrfs2s3.backups import BackupInfo
 
 if TYPE_CHECKING:
+    from typing import Iterable
     from typing import Iterator
 
     from mypy_boto3_s3.client import S3Client
@@ -14,14 +16,19 @@ if TYPE_CHECKING:
     from mypy_boto3_s3.type_defs import ObjectTypeDef
 
 
+DEFAULT_LIST_CONCURRENCY = 8
+"""The default number of prefixes to list at once."""
+
+
 def iter_backups(
-    client: S3Client, bucket: str
+    client: S3Client, bucket: str, *, prefix: str = ""
 ) -> Iterator[tuple[ObjectTypeDef, BackupInfo]]:
     """Find backups in an S3 bucket that were created by btrfs2s3.
 
     Args:
         client: An S3 client (e.g. created with boto3.client("s3")).
         bucket: The bucket to enumerate.
+        prefix: Only find backups whose keys start with this prefix.
 
     Yields:
         Pairs of object info (as returned by ListObjectsV2) and BackupInfo.
@@ -30,15 +37,67 @@ def iter_backups(
     continuation_token: str | None = None
     while not done:
         kwargs: ListObjectsV2RequestRequestTypeDef = {"Bucket": bucket}
+        if prefix:
+            kwargs["Prefix"] = prefix
         if continuation_token is not None:
             kwargs["ContinuationToken"] = continuation_token
         response = client.list_objects_v2(**kwargs)
-        for obj in response.get("Contents", []):
-            try:
-                info = BackupInfo.from_path(obj["Key"])
-            except ValueError:
-                continue
-            yield obj, info
+        objs = response.get("Contents", [])
+        infos = BackupInfo.from_paths(obj["Key"] for obj in objs)
+        for obj, info in zip(objs, infos):
+            if info is not None:
+                yield obj, info
         done = not response["IsTruncated"]
         if not done:
             continuation_token = response["NextContinuationToken"]
+
+
+def minimize_prefixes(prefixes: Iterable[str]) -> list[str]:
+    """Remove prefixes which are redundant with other prefixes.
+
+    Args:
+        prefixes: Some S3 key prefixes.
+
+    Returns:
+        A sorted list of unique prefixes, such that no prefix starts with
+            another. Listing all the returned prefixes finds the same keys as
+            listing all the input prefixes, without duplicates.
+    """
+    result: list[str] = []
+    for prefix in sorted(set(prefixes)):
+        if not result or not prefix.startswith(result[-1]):
+            result.append(prefix)
+    return result
+
+
+def list_backups(
+    client: S3Client,
+    bucket: str,
+    *,
+    prefixes: Iterable[str] = ("",),
+    max_workers: int = DEFAULT_LIST_CONCURRENCY,
+) -> list[tuple[ObjectTypeDef, BackupInfo]]:
+    """Find backups under several prefixes of an S3 bucket.
+
+    Each prefix is listed with iter_backups() in a separate thread, so
+    listing time scales with the number of keys under the largest prefix,
+    rather than the whole bucket.
+
+    Args:
+        client: An S3 client (e.g. created with boto3.client("s3")).
+        bucket: The bucket to enumerate.
+        prefixes: The prefixes to list. Redundant prefixes are removed with
+            minimize_prefixes().
+        max_workers: The maximum number of prefixes to list at once.
+
+    Returns:
+        Pairs of object info (as returned by ListObjectsV2) and BackupInfo,
+            in order of prefix.
+    """
+
+    def list_prefix(prefix: str) -> list[tuple[ObjectTypeDef, BackupInfo]]:
+        return list(iter_backups(client, bucket, prefix=prefix))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(list_prefix, minimize_prefixes(prefixes))
+        return [item for result in results for item in result]
@@ -0,0 +1,230 @@
+"""Functions for examining btrfs send streams.
+
+The format of a send stream is documented at
+https://btrfs.readthedocs.io/en/latest/dev/dev-send-stream.html. A stream is
+a header, followed by a sequence of commands. Each command is a sequence of
+type-length-value attributes.
+"""
+
+from __future__ import annotations
+
+import enum
+import logging
+from pathlib import Path
+import struct
+from subprocess import DEVNULL
+from subprocess import PIPE
+from subprocess import Popen
+from subprocess import run
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import IO
+    from typing import Iterator
+
+_LOG = logging.getLogger(__name__)
+
+MAGIC = b"btrfs-stream\0"
+"""The magic bytes at the start of every send stream."""
+
+_HEADER = struct.Struct("<13sI")
+_COMMAND_HEADER = struct.Struct("<IHI")
+_ATTRIBUTE_HEADER = struct.Struct("<HH")
+_U64 = struct.Struct("<Q")
+
+# The first protocol version where the data attribute has an implicit length
+_IMPLICIT_DATA_LENGTH_VERSION = 2
+
+COMPRESSED_DATA_VERSION = 2
+"""The protocol version needed for "btrfs send --compressed-data"."""
+COMPRESSED_DATA_SUFFIX = f".v{COMPRESSED_DATA_VERSION}"
+"""The key suffix for backups sent with "--compressed-data".
+
+A stream of this protocol version can only be received by btrfs-progs 5.19
+or later.
+"""
+COMPRESSED_DATA_ARGS = ("--proto", str(COMPRESSED_DATA_VERSION), "--compressed-data")
+"""Arguments to "btrfs send" to pass compressed extents through as-is."""
+
+# The highest send protocol version supported by the kernel. This doesn't
+# exist before Linux 5.19, which only supports version 1
+_SEND_STREAM_VERSION = Path("/sys/fs/btrfs/features/send_stream_version")
+
+
+class Error(Exception):
+    """The top-level class for errors produced by this module."""
+
+
+class InvalidStreamError(Error):
+    """The stream is not a valid btrfs send stream."""
+
+
+class Command(enum.IntEnum):
+    """Send stream command types which are relevant to btrfs2s3."""
+
+    WRITE = 15
+    CLONE = 16
+    END = 21
+    UPDATE_EXTENT = 22
+    ENCODED_WRITE = 25
+
+
+class Attribute(enum.IntEnum):
+    """Send stream attribute types which are relevant to btrfs2s3."""
+
+    SIZE = 4
+    DATA = 19
+
+
+def _read_exactly(stream: IO[bytes], size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        msg = f"unexpected end of stream (wanted {size} bytes, got {len(data)})"
+        raise InvalidStreamError(msg)
+    return data
+
+
+def _iter_raw_commands(stream: IO[bytes]) -> Iterator[tuple[int, int, bytes]]:
+    magic, version = _HEADER.unpack(_read_exactly(stream, _HEADER.size))
+    if magic != MAGIC:
+        msg = "not a btrfs send stream"
+        raise InvalidStreamError(msg)
+    while True:
+        header = stream.read(_COMMAND_HEADER.size)
+        if not header:
+            return
+        if len(header) != _COMMAND_HEADER.size:
+            msg = "truncated command header"
+            raise InvalidStreamError(msg)
+        length, command, _ = _COMMAND_HEADER.unpack(header)
+        yield version, command, _read_exactly(stream, length)
+
+
+def _parse_attributes(version: int, payload: bytes) -> dict[int, bytes]:
+    attributes: dict[int, bytes] = {}
+    offset = 0
+    while offset < len(payload):
+        attribute, length = _ATTRIBUTE_HEADER.unpack_from(payload, offset)
+        offset += _ATTRIBUTE_HEADER.size
+        # In protocol version 2, the data attribute has an implicit length
+        # which extends to the end of the command
+        if version >= _IMPLICIT_DATA_LENGTH_VERSION and attribute == Attribute.DATA:
+            length = len(payload) - offset
+        attributes[attribute] = payload[offset : offset + length]
+        offset += length
+    return attributes
+
+
+def iter_commands(stream: IO[bytes]) -> Iterator[tuple[int, dict[int, bytes]]]:
+    """Parses the commands in a send stream.
+
+    Args:
+        stream: A binary stream positioned at the start of a send stream. It
+            will be read until EOF.
+
+    Yields:
+        Pairs of (command type, attributes). The attributes are a dict of
+            attribute type to raw attribute value.
+
+    Raises:
+        InvalidStreamError: If the stream is malformed.
+    """
+    for version, command, payload in _iter_raw_commands(stream):
+        yield command, _parse_attributes(version, payload)
+
+
+def measure_no_data_stream(stream: IO[bytes]) -> int:
+    """Estimates the size of a full send stream, given a "--no-data" stream.
+
+    "btrfs send --no-data" produces a stream which contains only metadata.
+    Each write command of a full stream is replaced with an update-extent
+    command which records the size of the data, rather than the data itself.
+
+    The result is the size of the metadata, plus the sizes of the data
+    described by all update-extent commands. This slightly underestimates the
+    size of a full stream, as it doesn't account for the extra command headers
+    of a full stream.
+
+    Args:
+        stream: A binary stream positioned at the start of a send stream
+            produced with "--no-data". It will be read until EOF.
+
+    Returns:
+        The estimated size of a full send stream, in bytes.
+
+    Raises:
+        InvalidStreamError: If the stream is malformed.
+    """
+    size = _HEADER.size
+    for version, command, payload in _iter_raw_commands(stream):
+        size += _COMMAND_HEADER.size + len(payload)
+        if command == Command.UPDATE_EXTENT:
+            attributes = _parse_attributes(version, payload)
+            (extent_size,) = _U64.unpack(attributes[Attribute.SIZE])
+            size += extent_size
+    return size
+
+
+def supports_compressed_data() -> bool:
+    """Checks whether "btrfs send --compressed-data" can be used.
+
+    This requires the kernel to support send protocol version 2 (Linux 6.0 or
+    later), and btrfs-progs to support "--compressed-data" (5.19 or later).
+
+    Returns:
+        True if both the kernel and btrfs-progs support "--compressed-data".
+    """
+    try:
+        kernel_version = int(_SEND_STREAM_VERSION.read_text())
+    except (OSError, ValueError):
+        return False
+    if kernel_version < COMPRESSED_DATA_VERSION:
+        return False
+    try:
+        result = run(  # noqa: S603
+            ["btrfs", "send", "--help"],  # noqa: S607
+            stdout=PIPE,
+            stderr=DEVNULL,
+            check=False,
+        )
+    except OSError:
+        return False
+    return b"--compressed-data" in result.stdout
+
+
+def estimate_send_size(*, snapshot: Path, send_parent: Path | None) -> int:
+    """Estimates the size of the stream produced by "btrfs send".
+
+    This runs "btrfs send --no-data" as a subprocess. This needs to read all
+    the metadata which differs between the snapshot and its send-parent, but
+    no file data.
+
+    Args:
+        snapshot: The snapshot to be sent.
+        send_parent: The parent snapshot for a delta stream, or None for a
+            full stream.
+
+    Returns:
+        The estimated size of the stream in bytes.
+
+    Raises:
+        RuntimeError: If "btrfs send" fails.
+    """
+    args: list[str | Path] = ["btrfs", "send", "-q", "--no-data"]
+    if send_parent is not None:
+        args += ["-p", send_parent]
+    args += [snapshot]
+    with Popen(args, stdout=PIPE) as process:  # noqa: S603
+        # https://github.com/python/typeshed/issues/3831
+        assert process.stdout is not None  # noqa: S101
+        try:
+            size = measure_no_data_stream(process.stdout)
+        except InvalidStreamError:
+            # If btrfs send failed, its exit code is the more useful error
+            if process.wait() == 0:
+                raise
+    if process.returncode != 0:
+        msg = f"{process.args!r}: exited with code {process.returncode}"
+        raise RuntimeError(msg)
+    _LOG.debug("estimated size of send stream for %s: %d bytes", snapshot, size)
+    return size
@@ -0,0 +1,174 @@
+"""Splitting one stream into several, each read at its own pace.
+
+This is used to upload one backup stream to several remotes, while only
+running "btrfs send" (and any pipe_through commands) once.
+
+The source stream is read in chunks, which are shared by all branches rather
+than copied. Each branch buffers a bounded number of chunks. A slow branch
+doesn't stall the others until its buffer is full, so memory usage is bounded
+by the number of branches times the buffer size.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Sequence
+    from typing import Union
+
+    from typing_extensions import TypeAlias
+
+    from btrfs2s3.upload import SupportsReadinto
+
+    # A chunk of data, or an error from the source stream. An empty chunk
+    # means the end of the stream
+    _Item: TypeAlias = Union[bytearray, BaseException]
+
+DEFAULT_CHUNK_SIZE = 2**20
+"""The default size of chunks read from the source stream."""
+DEFAULT_MAX_BUFFER = 64 * 2**20
+"""The default maximum number of bytes buffered for each branch."""
+
+
+class TeeBranch:
+    """One of the streams produced by a Tee.
+
+    It supports readinto(), so it can be given to upload_stream().
+    """
+
+    def __init__(self, max_chunks: int) -> None:
+        """Constructs a TeeBranch.
+
+        Args:
+            max_chunks: The maximum number of chunks to buffer.
+        """
+        self._max_chunks = max_chunks
+        self._items: deque[_Item] = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._current = memoryview(b"")
+        self._eof = False
+
+    @property
+    def closed(self) -> bool:
+        """Whether the reader of this branch has closed it."""
+        return self._closed
+
+    def put(self, item: _Item) -> None:
+        """Adds an item to the buffer. This is called by the Tee.
+
+        Blocks while the buffer is full. The item is discarded if the branch
+        is closed.
+
+        Args:
+            item: A chunk of data (empty at the end of the stream), or an error
+                to raise to the reader.
+        """
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._closed or len(self._items) < self._max_chunks
+            )
+            if not self._closed:
+                self._items.append(item)
+                self._cond.notify_all()
+
+    def _get(self) -> _Item:
+        with self._cond:
+            self._cond.wait_for(lambda: bool(self._items))
+            item = self._items.popleft()
+            self._cond.notify_all()
+        return item
+
+    def readinto(self, buffer: memoryview) -> int:
+        """Reads data into a buffer.
+
+        Args:
+            buffer: The buffer to fill.
+
+        Returns:
+            The number of bytes read, which is 0 at the end of the stream.
+
+        Raises:
+            BaseException: Any error raised when reading the source stream.
+        """
+        while not self._current and not self._eof:
+            item = self._get()
+            if isinstance(item, BaseException):
+                raise item
+            self._current = memoryview(item)
+            self._eof = not item
+        size = min(len(buffer), len(self._current))
+        buffer[:size] = self._current[:size]
+        self._current = self._current[size:]
+        return size
+
+    def close(self) -> None:
+        """Stops reading from this branch.
+
+        Any buffered data is discarded, and the Tee stops writing to this
+        branch, so the other branches don't wait for it.
+        """
+        with self._cond:
+            self._closed = True
+            self._items.clear()
+            self._cond.notify_all()
+
+
+class Tee:
+    """Splits one stream into several.
+
+    run() reads the source stream and must be called on its own thread, while
+    each of the branches is read on other threads.
+    """
+
+    def __init__(
+        self,
+        stream: SupportsReadinto,
+        count: int,
+        *,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_buffer: int = DEFAULT_MAX_BUFFER,
+    ) -> None:
+        """Constructs a Tee.
+
+        Args:
+            stream: The source stream.
+            count: The number of branches.
+            chunk_size: The size of chunks to read from the source stream.
+            max_buffer: The maximum number of bytes to buffer for each branch.
+        """
+        self._stream = stream
+        self._chunk_size = chunk_size
+        max_chunks = max(1, max_buffer // chunk_size)
+        self.branches: Sequence[TeeBranch] = [
+            TeeBranch(max_chunks) for _ in range(count)
+        ]
+
+    def _live(self) -> list[TeeBranch]:
+        return [branch for branch in self.branches if not branch.closed]
+
+    def run(self) -> None:
+        """Copies the source stream to all branches.
+
+        Returns when the end of the source stream is reached, or when all
+        branches are closed. Errors from the source stream are passed on to
+        the branches, rather than raised.
+        """
+        while self._live():
+            chunk = bytearray(self._chunk_size)
+            try:
+                with memoryview(chunk) as view:
+                    size = self._stream.readinto(view)
+            except BaseException as ex:  # noqa: BLE001
+                for branch in self._live():
+                    branch.put(ex)
+                return
+            # Shrinks in place, without copying
+            del chunk[size:]
+            for branch in self._live():
+                branch.put(chunk)
+            if not size:
+                return
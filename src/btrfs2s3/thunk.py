@@ -7,6 +7,7 @@ from functools import total_ordering
 from typing import Callable
 from typing import Generic
 from typing import Literal
+from typing import NoReturn
 from typing import overload
 from typing import Protocol
 from typing import runtime_checkable
@@ -44,6 +45,12 @@ TBD = _TbdType.TBD
 """A sentinel value, meaning the real value hasn't been determined yet."""
 
 
+def _never_called() -> NoReturn:  # pragma: no cover
+    # The evaluation function of a pre-computed Thunk. Sharing this avoids
+    # allocating a closure for each Thunk
+    raise AssertionError
+
+
 @total_ordering
 class Thunk(Generic[_T]):
     """A Thunk is a wrapper for a value which may or may not be lazily computed.
@@ -73,6 +80,8 @@ class Thunk(Generic[_T]):
     is pushed to the code that creates the intent objects.
     """
 
+    __slots__ = ("_value", "_get_value")
+
     _value: _T | Literal[_TbdType.TBD]
     _get_value: Callable[[], _T]
 
@@ -108,7 +117,7 @@ class Thunk(Generic[_T]):
             self._get_value = other
             self._value = TBD
         else:
-            self._get_value = lambda: other  # pragma: no cover
+            self._get_value = _never_called
             self._value = other
 
     def peek(self) -> _T | Literal[_TbdType.TBD]:
@@ -0,0 +1,491 @@
+"""Streaming multipart uploads to S3.
+
+boto3's managed transfers (upload_fileobj()) are designed around seekable
+files. A backup is a pipe of unknown length, which boto3 reads serially into
+freshly-allocated buffers, with part sizes and concurrency that aren't tuned
+for multi-terabyte streams.
+
+This module implements an uploader specialized for streams. It reads the
+stream into a fixed pool of reusable part buffers, and uploads several parts
+at once from a thread pool. Memory usage is bounded by part_size *
+concurrency, regardless of the size of the stream.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import dataclasses
+import hashlib
+import logging
+from queue import SimpleQueue
+import threading
+import time
+from typing import Protocol
+from typing import TYPE_CHECKING
+
+from botocore.exceptions import ClientError
+
+from btrfs2s3.checkpoint import CheckpointPart
+from btrfs2s3.checkpoint import CheckpointState
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+    from mypy_boto3_s3.client import S3Client
+    from mypy_boto3_s3.type_defs import CompletedPartTypeDef
+
+    from btrfs2s3.checkpoint import UploadCheckpoint
+
+_LOG = logging.getLogger(__name__)
+
+MIN_PART_SIZE = 5 * 2**20
+"""The minimum size of a part of a multipart upload (except the last part)."""
+MAX_PART_SIZE = 5 * 2**30
+"""The maximum size of a part of a multipart upload."""
+MAX_PARTS = 10_000
+"""The maximum number of parts in a multipart upload."""
+
+DEFAULT_PART_SIZE = 64 * 2**20
+"""The default part size for uploads."""
+DEFAULT_CONCURRENCY = 4
+"""The default number of parts to upload at once."""
+DEFAULT_MAX_MEMORY = DEFAULT_PART_SIZE * DEFAULT_CONCURRENCY
+"""The default memory limit for automatically-sized uploads."""
+
+_MIB = 2**20
+# Estimates of stream size may be low, for example if pipe_through expands the
+# stream. Leave room for streams this many times larger than estimated.
+_SIZE_HEADROOM = 2
+# When throttling, read the stream in chunks of this size, so a large part
+# doesn't arrive as a single burst
+_THROTTLE_CHUNK_SIZE = _MIB
+# A Throttle allows bursts of this many seconds' worth of bytes
+_THROTTLE_BURST_SECONDS = 1.0
+
+
+class SupportsReadinto(Protocol):
+    """A binary stream which can be read into a pre-allocated buffer."""
+
+    def readinto(self, buffer: memoryview, /) -> int | None:
+        """Read bytes into a buffer, returning the number of bytes read."""
+
+
+@dataclasses.dataclass(frozen=True)
+class UploadParams:
+    """Parameters which control a streaming upload.
+
+    The memory used by an upload is bounded by part_size * concurrency (see
+    max_memory).
+
+    Attributes:
+        part_size: The size of each part of a multipart upload, in bytes. The
+            size of the stream must not exceed MAX_PARTS * part_size.
+        concurrency: The maximum number of parts to upload at once. This is
+            also the number of part buffers which may be allocated.
+    """
+
+    part_size: int = DEFAULT_PART_SIZE
+    concurrency: int = DEFAULT_CONCURRENCY
+
+    def __post_init__(self) -> None:
+        """Do validation checks."""
+        if not MIN_PART_SIZE <= self.part_size <= MAX_PART_SIZE:
+            msg = (
+                f"part_size must be between {MIN_PART_SIZE} and {MAX_PART_SIZE}, "
+                f"got {self.part_size}"
+            )
+            raise ValueError(msg)
+        if self.concurrency < 1:
+            msg = f"concurrency must be at least 1, got {self.concurrency}"
+            raise ValueError(msg)
+
+    @property
+    def max_memory(self) -> int:
+        """The maximum size of all part buffers of an upload, in bytes."""
+        return self.part_size * self.concurrency
+
+
+class Throttle:
+    """A bandwidth limit which may be shared by several uploads.
+
+    This is a token bucket: up to one second's worth of bytes may be consumed
+    in a burst, after which consumers are delayed to hold the average rate at
+    the limit. It's safe to share between threads.
+
+    Attributes:
+        rate: The bandwidth limit, in bytes per second.
+    """
+
+    def __init__(self, rate: int) -> None:
+        """Construct a Throttle.
+
+        Args:
+            rate: The bandwidth limit, in bytes per second.
+
+        Raises:
+            ValueError: If rate is not positive.
+        """
+        if rate < 1:
+            msg = f"rate must be at least 1, got {rate}"
+            raise ValueError(msg)
+        self.rate = rate
+        self._lock = threading.Lock()
+        # The time at which all bytes consumed so far will have "drained"
+        self._drained_at = time.monotonic()
+
+    def consume(self, count: int) -> None:
+        """Consume bandwidth, blocking if the limit has been exceeded.
+
+        Args:
+            count: The number of bytes about to be transferred.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._drained_at = max(self._drained_at, now) + count / self.rate
+            delay = self._drained_at - now - _THROTTLE_BURST_SECONDS
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _round_up(value: int, multiple: int) -> int:
+    return -(-value // multiple) * multiple
+
+
+@dataclasses.dataclass(frozen=True)
+class AutoUploadParams:
+    """Limits for choosing UploadParams automatically for each stream.
+
+    A fixed part size either fails on huge streams (which need more than
+    MAX_PARTS parts) or wastes requests on small ones. Given an estimate of
+    the size of a stream, choose() picks a part size such that:
+
+    - Small streams are uploaded with a single PutObject call.
+    - Larger streams are split into parts which are uploaded concurrently.
+    - Huge streams use parts large enough to stay within MAX_PARTS.
+
+    Attributes:
+        concurrency: The maximum number of parts to upload at once.
+        max_memory: The maximum memory to use for part buffers, in bytes. This
+            may be exceeded if the estimated stream size requires a part size
+            larger than max_memory.
+    """
+
+    concurrency: int = DEFAULT_CONCURRENCY
+    max_memory: int = DEFAULT_MAX_MEMORY
+
+    def __post_init__(self) -> None:
+        """Do validation checks."""
+        if self.concurrency < 1:
+            msg = f"concurrency must be at least 1, got {self.concurrency}"
+            raise ValueError(msg)
+        if self.max_memory < MIN_PART_SIZE:
+            msg = f"max_memory must be at least {MIN_PART_SIZE}, got {self.max_memory}"
+            raise ValueError(msg)
+
+    def choose(self, estimated_size: int) -> UploadParams:
+        """Returns UploadParams suitable for a stream of a given size.
+
+        Args:
+            estimated_size: The estimated size of the stream, in bytes.
+
+        Returns:
+            An UploadParams for the stream.
+        """
+        expected_size = estimated_size * _SIZE_HEADROOM
+        min_part_size = _round_up(
+            max(MIN_PART_SIZE, _round_up(expected_size, MAX_PARTS) // MAX_PARTS), _MIB
+        )
+        if min_part_size > MAX_PART_SIZE:
+            _LOG.warning(
+                "estimated stream size %d is too large for a multipart upload",
+                estimated_size,
+            )
+            min_part_size = MAX_PART_SIZE
+        max_part_size = max(
+            min_part_size, self.max_memory // self.concurrency // _MIB * _MIB
+        )
+
+        if expected_size <= max_part_size:
+            # Use one request for small streams
+            part_size = max(min_part_size, _round_up(expected_size, _MIB))
+        else:
+            part_size = _round_up(
+                _round_up(estimated_size, self.concurrency) // self.concurrency, _MIB
+            )
+            part_size = min(max(part_size, min_part_size), max_part_size)
+        concurrency = max(1, min(self.concurrency, self.max_memory // part_size))
+        return UploadParams(part_size=part_size, concurrency=concurrency)
+
+
+def _fill(
+    stream: SupportsReadinto, buffer: bytearray, throttle: Throttle | None = None
+) -> int:
+    # Pipes may return short reads, so read until the buffer is full or the
+    # stream is exhausted. If the buffer isn't filled, it's truncated in place
+    # (which doesn't copy it), since botocore doesn't accept memoryviews
+    chunk_size = len(buffer) if throttle is None else _THROTTLE_CHUNK_SIZE
+    filled = 0
+    # Release the view before resizing the buffer
+    with memoryview(buffer) as view:
+        while filled < len(view):
+            count = stream.readinto(view[filled : filled + chunk_size])
+            if not count:
+                break
+            if throttle is not None:
+                throttle.consume(count)
+            filled += count
+    del buffer[filled:]
+    return filled
+
+
+class _MultipartUpload:
+    def __init__(  # noqa: PLR0913
+        self,
+        *,
+        s3: S3Client,
+        bucket: str,
+        key: str,
+        state: CheckpointState,
+        executor: ThreadPoolExecutor,
+        release: SimpleQueue[bytearray],
+        checkpoint: UploadCheckpoint | None = None,
+    ) -> None:
+        self._s3 = s3
+        self._bucket = bucket
+        self._key = key
+        self._upload_id = state.upload_id
+        self._executor = executor
+        self._release = release
+        self._checkpoint = checkpoint
+        # Parts uploaded before an interruption
+        self._resumed = state.parts
+        if checkpoint is not None:
+            checkpoint.start(state)
+        self._futures: list[Future[CompletedPartTypeDef]] = []
+        self._failed = threading.Event()
+        # Set on errors which would happen again if the upload were resumed
+        self._unresumable = False
+
+    def failed(self) -> bool:
+        return self._failed.is_set()
+
+    def _upload_part(self, part_number: int, buffer: bytearray) -> CompletedPartTypeDef:
+        try:
+            sha256 = b""
+            if self._checkpoint is not None:
+                sha256 = hashlib.sha256(buffer).digest()
+                resumed = self._resumed.get(part_number)
+                if resumed is not None and resumed.sha256 == sha256:
+                    _LOG.debug(
+                        "part %d of %s was already uploaded", part_number, self._key
+                    )
+                    return {"PartNumber": part_number, "ETag": resumed.etag}
+            _LOG.debug(
+                "uploading part %d of %s (%d bytes)",
+                part_number,
+                self._key,
+                len(buffer),
+            )
+            response = self._s3.upload_part(
+                Bucket=self._bucket,
+                Key=self._key,
+                UploadId=self._upload_id,
+                PartNumber=part_number,
+                Body=buffer,
+            )
+            if self._checkpoint is not None:
+                self._checkpoint.record_part(
+                    part_number, CheckpointPart(etag=response["ETag"], sha256=sha256)
+                )
+        except BaseException:
+            self._failed.set()
+            raise
+        finally:
+            self._release.put(buffer)
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    def submit(self, buffer: bytearray) -> None:
+        part_number = len(self._futures) + 1
+        if part_number > MAX_PARTS:
+            msg = (
+                f"{self._key}: stream exceeds {MAX_PARTS} parts of "
+                f"{len(buffer)} bytes. try a larger part_size"
+            )
+            self._unresumable = True
+            raise RuntimeError(msg)
+        self._futures.append(
+            self._executor.submit(self._upload_part, part_number, buffer)
+        )
+
+    def complete(self) -> None:
+        parts = [future.result() for future in self._futures]
+        try:
+            self._s3.complete_multipart_upload(
+                Bucket=self._bucket,
+                Key=self._key,
+                UploadId=self._upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except ClientError:
+            # For example, if a part from a checkpoint is missing
+            self._unresumable = True
+            raise
+        if self._checkpoint is not None:
+            self._checkpoint.clear()
+
+    def abort(self) -> None:
+        for future in self._futures:
+            future.cancel()
+        self._executor.shutdown(wait=True)
+        if self._checkpoint is not None and not self._unresumable:
+            self._checkpoint.close()
+            _LOG.info("leaving interrupted upload of %s to be resumed", self._key)
+            return
+        self._s3.abort_multipart_upload(
+            Bucket=self._bucket, Key=self._key, UploadId=self._upload_id
+        )
+        if self._checkpoint is not None:
+            self._checkpoint.clear()
+
+
+def _resume(
+    s3: S3Client,
+    bucket: str,
+    key: str,
+    params: UploadParams,
+    checkpoint: UploadCheckpoint | None,
+) -> tuple[UploadParams, CheckpointState | None]:
+    # Returns the params and state with which to resume an upload, if any
+    state = None if checkpoint is None else checkpoint.load()
+    if checkpoint is None or state is None:
+        return params, None
+    try:
+        params = dataclasses.replace(params, part_size=state.part_size)
+        s3.list_parts(Bucket=bucket, Key=key, UploadId=state.upload_id, MaxParts=1)
+    except (ValueError, ClientError) as ex:
+        _LOG.info("can't resume upload of %s: %s", key, ex)
+        checkpoint.clear()
+        return params, None
+    _LOG.info(
+        "resuming upload of %s, with %d parts already uploaded", key, len(state.parts)
+    )
+    return params, state
+
+
+def _put_object(  # noqa: PLR0913
+    s3: S3Client,
+    bucket: str,
+    key: str,
+    body: bytearray,
+    state: CheckpointState | None,
+    checkpoint: UploadCheckpoint | None,
+) -> None:
+    if state is not None and checkpoint is not None:
+        # The stream has changed since the upload was interrupted
+        with contextlib.suppress(ClientError):
+            s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=state.upload_id)
+        checkpoint.clear()
+    _LOG.debug("uploading %s in a single request (%d bytes)", key, len(body))
+    s3.put_object(Bucket=bucket, Key=key, Body=body)
+
+
+def upload_stream(  # noqa: PLR0913
+    s3: S3Client,
+    bucket: str,
+    key: str,
+    stream: SupportsReadinto,
+    *,
+    params: UploadParams | None = None,
+    throttle: Throttle | None = None,
+    checkpoint: UploadCheckpoint | None = None,
+) -> None:
+    """Uploads a stream of unknown length to S3.
+
+    If the whole stream fits in one part, it will be uploaded with a single
+    PutObject call. Otherwise, it will be uploaded as a multipart upload, with
+    up to params.concurrency parts being uploaded at once.
+
+    Part buffers are allocated lazily and reused, so at most
+    params.max_memory bytes will be allocated. When all buffers are in use,
+    reading from the stream blocks until an upload finishes.
+
+    If a Throttle is given, reading from the stream is slowed to keep within
+    its bandwidth limit. Since the stream is read at the rate it's uploaded,
+    this limits the upload rate.
+
+    If the upload fails, the multipart upload will be aborted.
+
+    If a checkpoint is given, each uploaded part is recorded in it, and a
+    failed multipart upload is left in place rather than aborted. If the
+    checkpoint records an upload in progress, that upload is resumed: the
+    stream is read from the start with the checkpoint's part size, and parts
+    whose SHA-256 digests match the checkpoint aren't uploaded again. This
+    relies on the stream being the same as before. Parts which differ are
+    just uploaded again.
+
+    Args:
+        s3: An S3 client.
+        bucket: The bucket in which to store the object.
+        key: The S3 object key.
+        stream: The stream to upload. It will be read until EOF, but not
+            closed.
+        params: Parameters for the upload. If None, defaults will be used.
+        throttle: A bandwidth limit, possibly shared with other uploads.
+        checkpoint: A checkpoint with which to make the upload resumable.
+
+    Raises:
+        RuntimeError: If the stream is too large to be uploaded with the given
+            part size.
+    """
+    if params is None:
+        params = UploadParams()
+    params, state = _resume(s3, bucket, key, params, checkpoint)
+
+    first = bytearray(params.part_size)
+    size = _fill(stream, first, throttle)
+    if size < params.part_size:
+        _put_object(s3, bucket, key, first, state, checkpoint)
+        return
+
+    part_size, concurrency = params.part_size, params.concurrency
+    buffers: SimpleQueue[bytearray] = SimpleQueue()
+    allocated = 1
+
+    def get_buffer() -> bytearray:
+        nonlocal allocated
+        if buffers.empty() and allocated < concurrency:
+            allocated += 1
+            return bytearray(part_size)
+        return buffers.get()
+
+    if state is None:
+        upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key)["UploadId"]
+        state = CheckpointState(upload_id=upload_id, part_size=part_size, parts={})
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="upload")
+    upload = _MultipartUpload(
+        s3=s3,
+        bucket=bucket,
+        key=key,
+        state=state,
+        executor=executor,
+        release=buffers,
+        checkpoint=checkpoint,
+    )
+    try:
+        upload.submit(first)
+        while not upload.failed():
+            buffer = get_buffer()
+            size = _fill(stream, buffer, throttle)
+            if size:
+                upload.submit(buffer)
+            if size < part_size:
+                # The stream is exhausted
+                break
+        # This raises the first error from any part upload
+        upload.complete()
+    except BaseException:
+        upload.abort()
+        raise
+    finally:
+        executor.shutdown(wait=True)
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import struct
+
+from btrfs2s3._internal import btrfsioctl
+from btrfs2s3._internal.btrfsioctl import _parse_root_item
+from btrfs2s3._internal.btrfsioctl import SubvolumeInfo
+
+
+def test_ioctl_numbers() -> None:
+    # Known values of the ioctl numbers in linux/btrfs.h, which encode the
+    # sizes of the argument structures
+    assert btrfsioctl._IOC_SNAP_DESTROY == 0x5000940F
+    assert btrfsioctl._IOC_TREE_SEARCH_V2 == 0xC0709411
+    assert btrfsioctl._IOC_INO_LOOKUP == 0xD0009412
+    assert btrfsioctl._IOC_SNAP_CREATE_V2 == 0x50009417
+    assert btrfsioctl._IOC_GET_SUBVOL_INFO == 0x81F8943C
+    assert btrfsioctl._IOC_SNAP_DESTROY_V2 == 0x5000943F
+
+
+def test_parse_root_item() -> None:
+    data = bytearray(439)
+    struct.pack_into("<Q", data, 160, 100)  # generation
+    struct.pack_into("<Q", data, 208, 1)  # flags
+    data[247:263] = b"u" * 16
+    data[263:279] = b"p" * 16
+    data[279:295] = b"r" * 16
+    struct.pack_into("<QQQQ", data, 295, 1, 2, 3, 4)
+    struct.pack_into("<QIQIQIQI", data, 327, 10, 5 * 10**8, 20, 0, 30, 0, 40, 0)
+
+    got = _parse_root_item(257, 5, 256, bytes(data))
+
+    assert got == SubvolumeInfo(
+        id=257,
+        parent_id=5,
+        dir_id=256,
+        flags=1,
+        uuid=b"u" * 16,
+        parent_uuid=b"p" * 16,
+        received_uuid=b"r" * 16,
+        generation=100,
+        ctransid=1,
+        otransid=2,
+        stransid=3,
+        rtransid=4,
+        ctime=10.5,
+        otime=20.0,
+        stime=30.0,
+        rtime=40.0,
+    )
+
+
+def test_parse_old_root_item() -> None:
+    data = bytearray(239)
+    struct.pack_into("<Q", data, 160, 100)  # generation
+    struct.pack_into("<Q", data, 208, 1)  # flags
+
+    got = _parse_root_item(257, 5, 256, bytes(data))
+
+    assert got.generation == 100
+    assert got.flags == 1
+    assert got.uuid == b"\0" * 16
+    assert got.ctransid == 0
+    assert got.ctime == 0.0
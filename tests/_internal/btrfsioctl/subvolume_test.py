@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+from unittest.mock import patch
+
+from btrfs2s3._internal import btrfsioctl
+from btrfs2s3._internal.util import SubvolumeFlags
+import btrfsutil
+import pytest
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def _assert_same_info(got: btrfsioctl.SubvolumeInfo, path: Path) -> None:
+    expected = btrfsutil.subvolume_info(path)
+    assert got[:14] == tuple(expected)
+    assert got.stime == expected.stime
+    assert got.rtime == expected.rtime
+
+
+def test_subvolume_info(btrfs_mountpoint: Path) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+    snapshot = btrfs_mountpoint / "snapshot"
+    btrfsutil.create_snapshot(source, snapshot, read_only=True)
+
+    _assert_same_info(btrfsioctl.subvolume_info(source), source)
+    _assert_same_info(btrfsioctl.subvolume_info(snapshot), snapshot)
+
+
+def test_is_subvolume(btrfs_mountpoint: Path, ext4_mountpoint: Path) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+    (btrfs_mountpoint / "dir").mkdir()
+    (btrfs_mountpoint / "file").touch()
+
+    assert btrfsioctl.is_subvolume(btrfs_mountpoint)
+    assert btrfsioctl.is_subvolume(source)
+    assert not btrfsioctl.is_subvolume(btrfs_mountpoint / "dir")
+    assert not btrfsioctl.is_subvolume(btrfs_mountpoint / "file")
+    assert not btrfsioctl.is_subvolume(ext4_mountpoint)
+
+
+def test_create_and_delete_snapshot(btrfs_mountpoint: Path) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+    snapshot = btrfs_mountpoint / "snapshot"
+
+    btrfsioctl.create_snapshot(source, snapshot, read_only=True)
+
+    info = btrfsutil.subvolume_info(snapshot)
+    assert info.parent_uuid == btrfsutil.subvolume_info(source).uuid
+    assert info.flags & SubvolumeFlags.ReadOnly
+
+    btrfsioctl.delete_subvolume(snapshot)
+
+    assert not snapshot.exists()
+
+
+@pytest.mark.parametrize("tree_search", [True, False])
+def test_list_subvolumes(btrfs_mountpoint: Path, *, tree_search: bool) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+    top = btrfs_mountpoint / "top"
+    (top / "subdir").mkdir(parents=True)
+    (top / "file").touch()
+    btrfsutil.create_snapshot(source, top / "b", read_only=True)
+    btrfsutil.create_subvolume(top / "c")
+    btrfsutil.create_snapshot(source, top / "subdir" / "a", read_only=True)
+    expected = [top / "b", top / "c", top / "subdir" / "a"]
+    # Not found, since it's inside another subvolume
+    btrfsutil.create_subvolume(top / "c" / "nested")
+    # Not found, since it's outside top
+    btrfsutil.create_snapshot(source, btrfs_mountpoint / "outside")
+
+    if tree_search:
+        got = btrfsioctl.list_subvolumes(top)
+    else:
+        with patch.object(
+            btrfsioctl, "_list_with_tree_search", side_effect=PermissionError
+        ):
+            got = btrfsioctl.list_subvolumes(top)
+
+    assert [path for path, _ in got] == expected
+    for path, info in got:
+        _assert_same_info(info, path)
+
+
+def test_list_subvolumes_not_recursive(btrfs_mountpoint: Path) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+    (btrfs_mountpoint / "subdir").mkdir()
+    btrfsutil.create_snapshot(source, btrfs_mountpoint / "subdir" / "a")
+
+    got = btrfsioctl.list_subvolumes(btrfs_mountpoint, recursive=False)
+
+    assert [path for path, _ in got] == [source]
+
+
+def test_sync(btrfs_mountpoint: Path) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+    (source / "file").write_bytes(b"dummy")
+
+    btrfsioctl.sync(source)
+
+    assert btrfsutil.subvolume_info(source).generation > 0
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import contextlib
+import ctypes
+from typing import Tuple
+from typing import TYPE_CHECKING
+from unittest.mock import patch
+
+from btrfs2s3._internal.btrfsioctl import _IOC_TREE_SEARCH_V2
+from btrfs2s3._internal.btrfsioctl import _SEARCH_HEADER
+from btrfs2s3._internal.btrfsioctl import _SearchArgsV2
+from btrfs2s3._internal.btrfsioctl import _tree_search
+import pytest
+
+if TYPE_CHECKING:
+    from typing import Iterator
+    from typing import Sequence
+
+_Item = Tuple[int, int, int, bytes]
+
+
+@contextlib.contextmanager
+def _fake_tree_search(items: Sequence[_Item], *, max_per_call: int) -> Iterator[None]:
+    # Return items the way the kernel does: everything between the min and
+    # max keys, compared as whole keys
+    def ioctl(_: int, request: int, buf: bytearray) -> int:
+        assert request == _IOC_TREE_SEARCH_V2
+        key = _SearchArgsV2.from_buffer(buf).key
+        min_key = (key.min_objectid, key.min_type, key.min_offset)
+        max_key = (key.max_objectid, key.max_type, key.max_offset)
+        found = [item for item in sorted(items) if min_key <= item[:3] <= max_key]
+        found = found[:max_per_call]
+        pos = ctypes.sizeof(_SearchArgsV2)
+        for objectid, type_, offset, data in found:
+            _SEARCH_HEADER.pack_into(buf, pos, 0, objectid, offset, type_, len(data))
+            pos += _SEARCH_HEADER.size
+            buf[pos : pos + len(data)] = data
+            pos += len(data)
+        _SearchArgsV2.from_buffer(buf).key.nr_items = len(found)
+        return 0
+
+    with patch("fcntl.ioctl", ioctl):
+        yield
+
+
+@pytest.mark.parametrize("max_per_call", [1, 2, 100])
+def test_paginate_and_filter_types(max_per_call: int) -> None:
+    items = [
+        (255, 132, 0, b"too low"),
+        (256, 1, 0, b"inode"),
+        (256, 132, 0, b"a"),
+        (256, 132, 2**64 - 1, b"b"),
+        (256, 144, 5, b"backref"),
+        (257, 132, 0, b"c"),
+        (300, 132, 7, b"d"),
+        (301, 132, 0, b"too high"),
+    ]
+
+    with _fake_tree_search(items, max_per_call=max_per_call):
+        got = list(
+            _tree_search(
+                0,
+                tree_id=1,
+                min_objectid=256,
+                max_objectid=300,
+                min_type=132,
+                max_type=132,
+            )
+        )
+
+    assert [(item.objectid, item.offset, item.data) for item in got] == [
+        (256, 0, b"a"),
+        (256, 2**64 - 1, b"b"),
+        (257, 0, b"c"),
+        (300, 7, b"d"),
+    ]
+
+
+def test_empty() -> None:
+    with _fake_tree_search([], max_per_call=100):
+        got = list(
+            _tree_search(
+                0, tree_id=1, min_objectid=0, max_objectid=0, min_type=0, max_type=0
+            )
+        )
+
+    assert got == []
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import dataclasses
+from dataclasses import field
+import pickle
+from typing import Generic
+from typing import TypeVar
+
+from btrfs2s3._internal.slots import add_slots
+import pytest
+
+_T = TypeVar("_T")
+
+
+@add_slots
+@dataclasses.dataclass
+class _Mutable:
+    a: int
+    b: int = 1
+    c: list[int] = field(default_factory=list)
+
+
+@add_slots
+@dataclasses.dataclass(frozen=True)
+class _Frozen:
+    a: int
+    b: str = "b"
+
+
+@add_slots
+@dataclasses.dataclass
+class _Generic(Generic[_T]):
+    item: _T
+
+
+def test_no_dict() -> None:
+    assert not hasattr(_Mutable(0), "__dict__")
+    assert not hasattr(_Frozen(0), "__dict__")
+    assert _Mutable.__slots__ == ("a", "b", "c")  # type: ignore[attr-defined]
+
+
+def test_defaults() -> None:
+    one = _Mutable(0)
+    two = _Mutable(0)
+
+    assert one == _Mutable(a=0, b=1, c=[])
+    assert one.c is not two.c
+    assert _Frozen(0).b == "b"
+
+
+def test_mutable() -> None:
+    obj = _Mutable(0)
+
+    obj.b = 2
+
+    assert obj.b == 2
+    with pytest.raises(AttributeError):
+        obj.d = 3  # type: ignore[attr-defined]
+
+
+def test_frozen() -> None:
+    obj = _Frozen(0)
+
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        obj.a = 1  # type: ignore[misc]
+
+
+def test_pickle() -> None:
+    for obj in (_Mutable(0, 1, [2]), _Frozen(0, "x")):
+        assert pickle.loads(pickle.dumps(obj)) == obj
+
+
+def test_generic() -> None:
+    obj: _Generic[int] = _Generic(1)
+
+    assert obj.item == 1
+    assert not hasattr(obj, "__dict__")
+    assert _Generic.__qualname__ == "_Generic"
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import _thread
+import threading
+
+from btrfs2s3._internal.taskgraph import run_tasks
+from btrfs2s3._internal.taskgraph import Task
+import pytest
+
+
+def test_empty() -> None:
+    run_tasks([], max_workers=1)
+
+
+def test_order_with_one_worker() -> None:
+    done: list[str] = []
+    a = Task(name="a", run=lambda: done.append("a"))
+    b = Task(name="b", run=lambda: done.append("b"))
+    c = Task(name="c", run=lambda: done.append("c"), dependencies=[a])
+
+    run_tasks([c, a, b], max_workers=1)
+
+    assert done == ["a", "b", "c"]
+
+
+def test_independent_tasks_run_concurrently() -> None:
+    barrier = threading.Barrier(3, timeout=10)
+    tasks = [Task(name=str(i), run=barrier.wait) for i in range(3)]
+
+    run_tasks(tasks, max_workers=3)
+
+
+def test_dependencies_wait() -> None:
+    finished = threading.Event()
+
+    def slow() -> None:
+        # The dependent task must not start until this returns
+        finished.wait(0.1)
+        finished.set()
+
+    def dependent() -> None:
+        assert finished.is_set()
+
+    a = Task(name="a", run=slow)
+    b = Task(name="b", run=dependent, dependencies=[a])
+
+    run_tasks([a, b], max_workers=2)
+
+
+def test_failure_skips_dependents_only() -> None:
+    done: list[str] = []
+
+    def fail() -> None:
+        msg = "failed"
+        raise RuntimeError(msg)
+
+    a = Task(name="a", run=fail)
+    b = Task(name="b", run=lambda: done.append("b"), dependencies=[a])
+    c = Task(name="c", run=lambda: done.append("c"), dependencies=[b])
+    d = Task(name="d", run=lambda: done.append("d"))
+
+    with pytest.raises(RuntimeError, match="failed"):
+        run_tasks([a, b, c, d], max_workers=1)
+
+    assert done == ["d"]
+
+
+def test_unscheduled_dependency() -> None:
+    a = Task(name="a", run=lambda: None)
+    b = Task(name="b", run=lambda: None, dependencies=[a])
+
+    with pytest.raises(ValueError, match="not scheduled"):
+        run_tasks([b], max_workers=1)
+
+
+def test_cycle() -> None:
+    a = Task(name="a", run=lambda: None)
+    b = Task(name="b", run=lambda: None, dependencies=[a])
+    a.dependencies.append(b)
+
+    with pytest.raises(ValueError, match="cycle"):
+        run_tasks([a, b], max_workers=1)
+
+
+def test_interrupt_skips_queued_tasks() -> None:
+    done: list[str] = []
+
+    def interrupt() -> None:
+        _thread.interrupt_main()
+        done.append("interrupt")
+
+    tasks = [Task(name="interrupt", run=interrupt)] + [
+        Task(name=str(i), run=lambda i=i: done.append(str(i)))  # type: ignore[misc]
+        for i in range(9)
+    ]
+
+    with pytest.raises(KeyboardInterrupt):
+        run_tasks(tasks, max_workers=1)
+
+    assert done == ["interrupt"]
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from datetime import timedelta
+from datetime import timezone
+from random import uniform
+from typing import TYPE_CHECKING
+
+from btrfs2s3._internal import timespanbuckets
+from btrfs2s3._internal.timespanbuckets import bucket_time_spans
+from btrfs2s3._internal.timespans import FRAMES
+from btrfs2s3._internal.timespans import iter_time_spans
+from btrfs2s3.zoneinfo import get_zoneinfo
+import pytest
+
+if TYPE_CHECKING:
+    from datetime import tzinfo
+    from typing import Sequence
+
+_ZONES = [
+    timezone.utc,
+    timezone(timedelta(hours=5, minutes=30)),
+    get_zoneinfo("America/Los_Angeles"),
+    get_zoneinfo("America/Santiago"),
+    get_zoneinfo("Australia/Lord_Howe"),
+    get_zoneinfo("Pacific/Apia"),
+]
+
+
+def _expected(
+    timestamps: Sequence[float], tzinfo: tzinfo
+) -> list[tuple[list[tuple[float, float]], list[int]]]:
+    result: list[tuple[dict[tuple[float, float], int], list[int]]] = [
+        ({}, []) for _ in FRAMES
+    ]
+    for timestamp in timestamps:
+        for (index, ids), span in zip(
+            result, iter_time_spans(timestamp, tzinfo, FRAMES)
+        ):
+            ids.append(index.setdefault(span, len(index)))
+    return [(list(index), ids) for index, ids in result]
+
+
+def _check(timestamps: Sequence[float], tzinfo: tzinfo) -> None:
+    got = bucket_time_spans(timestamps, tzinfo, FRAMES)
+    assert [(b.time_spans, b.ids) for b in got] == _expected(timestamps, tzinfo)
+
+
+@pytest.fixture(params=["numpy", "scalar"])
+def _path(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch) -> None:
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(timespanbuckets, "_HAVE_NUMPY", False)
+
+
+@pytest.mark.usefixtures("_path")
+def test_empty() -> None:
+    assert bucket_time_spans([], timezone.utc, FRAMES) == [
+        timespanbuckets.TimeSpanBuckets(time_spans=[], ids=[]) for _ in FRAMES
+    ]
+
+
+@pytest.mark.usefixtures("_path")
+@pytest.mark.parametrize("tzinfo", _ZONES, ids=str)
+def test_random_timestamps(tzinfo: tzinfo) -> None:
+    _check([uniform(-2e9, 4e9) for _ in range(500)], tzinfo)
+
+
+@pytest.mark.parametrize("tzinfo", _ZONES, ids=str)
+def test_hourly_history(tzinfo: tzinfo) -> None:
+    pytest.importorskip("numpy")
+    # A year of hourly timestamps crosses DST transitions
+    start = uniform(1e9, 1.5e9)
+    _check([start + i * 3600 for i in range(366 * 24)], tzinfo)
+
+
+@pytest.mark.parametrize("tzinfo", _ZONES, ids=str)
+def test_dense_history(tzinfo: tzinfo) -> None:
+    pytest.importorskip("numpy")
+    start = uniform(1e9, 1.5e9)
+    _check([start + i * 61.7 for i in range(5000)], tzinfo)
+
+
+@pytest.mark.usefixtures("_path")
+def test_rounding() -> None:
+    # datetime.fromtimestamp() rounds to the nearest microsecond
+    timestamps = [
+        t + frac
+        for t in (-86400.0, 0.0, 1e9)
+        for frac in (-0.0000006, -0.0000004, 0.0000004, 0.5, 0.9999994, 0.9999996)
+    ] * 10
+    _check(timestamps, get_zoneinfo("America/Los_Angeles"))
+
+
+@pytest.mark.usefixtures("_path")
+def test_sub_second_offset() -> None:
+    # The NumPy path only supports whole-second offsets, but should fall back
+    tzinfo = timezone(timedelta(microseconds=1))
+    _check([uniform(0, 2e9) for _ in range(100)], tzinfo)
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+from datetime import datetime
+from datetime import timezone
+from random import Random
+from typing import TYPE_CHECKING
+
+import arrow
+from btrfs2s3._internal.arrowutil import convert_span
+from btrfs2s3._internal.timespans import FRAMES
+from btrfs2s3._internal.timespans import iter_time_spans
+from btrfs2s3.zoneinfo import get_zoneinfo
+import pytest
+
+if TYPE_CHECKING:
+    from datetime import tzinfo
+
+# Zones with DST transitions at midnight, half-hour DST, zones which skipped
+# a whole day and zones with unusual offsets
+_ZONES = [
+    timezone.utc,
+    get_zoneinfo("America/Los_Angeles"),
+    get_zoneinfo("America/Santiago"),
+    get_zoneinfo("America/Havana"),
+    get_zoneinfo("Asia/Beirut"),
+    get_zoneinfo("America/Sao_Paulo"),
+    get_zoneinfo("Australia/Lord_Howe"),
+    get_zoneinfo("Pacific/Apia"),
+    get_zoneinfo("America/St_Johns"),
+]
+
+
+def _expected(timestamp: float, tzinfo: tzinfo) -> list[tuple[float, float]]:
+    a = arrow.get(timestamp, tzinfo=tzinfo)
+    return [convert_span(a.span(frame, bounds="[]")) for frame in FRAMES]
+
+
+def _iter_transitions(tzinfo: tzinfo, start: float, end: float) -> list[float]:
+    # Find the timestamps at which the UTC offset changes, to the second
+    def offset(t: float) -> object:
+        return datetime.fromtimestamp(t, tzinfo).utcoffset()
+
+    result = []
+    step = 6 * 3600
+    t = start
+    while t < end:
+        if offset(t) != offset(t + step):
+            lo, hi = t, t + step
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if offset(mid) == offset(lo):
+                    lo = mid
+                else:
+                    hi = mid
+            result.append(hi)
+        t += step
+    return result
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("tzinfo", _ZONES, ids=str)
+def test_random_timestamps_match_arrow(tzinfo: tzinfo, seed: int) -> None:
+    rng = Random(seed)
+    for _ in range(100):
+        timestamp = rng.uniform(-2e9, 4e9)
+        got = list(iter_time_spans(timestamp, tzinfo, FRAMES))
+        assert got == _expected(timestamp, tzinfo), timestamp
+
+
+@pytest.mark.parametrize("tzinfo", _ZONES, ids=str)
+def test_dst_transitions_match_arrow(tzinfo: tzinfo) -> None:
+    start = arrow.get("2008").timestamp()
+    end = arrow.get("2016").timestamp()
+    for transition in _iter_transitions(tzinfo, start, end):
+        for offset in (-86400, -3601, -3600, -1800, -1, 0, 1, 1800, 3599, 3600):
+            timestamp = transition + offset
+            got = list(iter_time_spans(timestamp, tzinfo, FRAMES))
+            assert got == _expected(timestamp, tzinfo), timestamp
+
+
+@pytest.mark.parametrize("year", range(2000, 2030))
+def test_iso_week_boundaries_match_arrow(year: int) -> None:
+    tzinfo = get_zoneinfo("America/Los_Angeles")
+    new_year = arrow.get(str(year), tzinfo=tzinfo).timestamp()
+    for offset in range(-4 * 86400, 4 * 86400, 3 * 3600):
+        timestamp = new_year + offset
+        got = list(iter_time_spans(timestamp, tzinfo, FRAMES))
+        assert got == _expected(timestamp, tzinfo), timestamp
+
+
+def test_frames_in_given_order() -> None:
+    timestamp = arrow.get("2006-01-02").timestamp()
+    got = list(iter_time_spans(timestamp, timezone.utc, ("day", "year")))
+    assert got == [
+        convert_span(arrow.get(timestamp).span("day", bounds="[]")),
+        convert_span(arrow.get(timestamp).span("year", bounds="[]")),
+    ]
@@ -1,19 +1,21 @@
 from __future__ import annotations
 
 import functools
+from pathlib import Path
 from typing import TYPE_CHECKING
+from unittest.mock import patch
 
 import arrow
 from botocore.exceptions import ClientError
+from btrfs2s3 import action
+from btrfs2s3._internal import btrfsioctl
 from btrfs2s3._internal.util import backup_of_snapshot
 from btrfs2s3.action import Actions
 import btrfsutil
-from btrfsutil import SubvolumeInfo
 import pytest
 
 if TYPE_CHECKING:
-    from pathlib import Path
-
+    from btrfs2s3._internal.btrfsioctl import SubvolumeInfo
     from mypy_boto3_s3.client import S3Client
 
     from tests.conftest import DownloadAndPipe
@@ -35,7 +37,7 @@ def test_create_and_rename(btrfs_mountpoint: Path, s3: S3Client, bucket: str) ->
 
     @functools.lru_cache
     def get_info() -> SubvolumeInfo:
-        return btrfsutil.subvolume_info(initial_path)
+        return btrfsioctl.subvolume_info(initial_path)
 
     def get_target_path() -> Path:
         ctime = arrow.get(get_info().ctime)
@@ -70,7 +72,7 @@ def test_create_rename_backup(
 
     @functools.lru_cache
     def get_info() -> SubvolumeInfo:
-        return btrfsutil.subvolume_info(initial_path)
+        return btrfsioctl.subvolume_info(initial_path)
 
     def get_target_path() -> Path:
         ctime = arrow.get(get_info().ctime)
@@ -81,7 +83,7 @@ def test_create_rename_backup(
 
     def get_key() -> str:
         backup = backup_of_snapshot(
-            get_info(), send_parent=btrfsutil.subvolume_info(snapshot1)
+            get_info(), send_parent=btrfsioctl.subvolume_info(snapshot1)
         )
         return f"{source.name}{''.join(backup.get_path_suffixes())}"
 
@@ -157,3 +159,124 @@ def test_other_actions(
     # Check delete
     with pytest.raises(ClientError):
         s3.head_object(Bucket=bucket, Key=delete_me_key)
+
+
+def test_concurrent_backups(
+    btrfs_mountpoint: Path,
+    s3: S3Client,
+    bucket: str,
+    download_and_pipe: DownloadAndPipe,
+) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+
+    def mksnapshot(name: str) -> Path:
+        path = btrfs_mountpoint / name
+        btrfsutil.create_snapshot(source, path, read_only=True)
+        return path
+
+    actions = Actions()
+    parent = mksnapshot("parent")
+    child = mksnapshot("child")
+    other = mksnapshot("other")
+    actions.create_backup(source=source, snapshot=other, send_parent=None, key="other")
+    actions.create_backup(
+        source=source, snapshot=child, send_parent=parent, key="child"
+    )
+    actions.delete_snapshot(parent)
+    actions.delete_snapshot(other)
+
+    actions.execute(s3, bucket, max_concurrent_backups=4)
+
+    download_and_pipe("other", ["btrfs", "receive", "--dump"])
+    download_and_pipe("child", ["btrfs", "receive", "--dump"])
+    assert not parent.exists()
+    assert not other.exists()
+
+
+def test_failed_backup_keeps_send_parent(
+    btrfs_mountpoint: Path, s3: S3Client, bucket: str
+) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+
+    def mksnapshot(name: str) -> Path:
+        path = btrfs_mountpoint / name
+        btrfsutil.create_snapshot(source, path, read_only=True)
+        return path
+
+    actions = Actions()
+    parent = mksnapshot("parent")
+    child = mksnapshot("child")
+    unrelated = mksnapshot("unrelated")
+    actions.create_backup(
+        source=source, snapshot=child, send_parent=parent, key="child"
+    )
+    actions.delete_snapshot(parent)
+    actions.delete_snapshot(unrelated)
+    s3.put_object(Bucket=bucket, Key="old", Body=b"dummy")
+    actions.delete_backup("old")
+
+    with patch.object(s3, "put_object", side_effect=RuntimeError("injected")):  # noqa: SIM117
+        with pytest.raises(RuntimeError, match="injected"):
+            actions.execute(s3, bucket, max_concurrent_backups=2)
+
+    # The send-parent is still needed to retry the backup
+    assert parent.exists()
+    # Independent actions still happen
+    assert not unrelated.exists()
+    # Backups are not deleted when new backups failed
+    s3.head_object(Bucket=bucket, Key="old")
+
+
+def test_backup_priority(s3: S3Client, bucket: str) -> None:
+    actions = Actions()
+    sizes = {"small-delta": 10, "big-delta": 1000, "full": 100}
+    for name in sizes:
+        actions.create_backup(
+            source=Path("source"),
+            snapshot=Path(name),
+            send_parent=None if name == "full" else Path("parent"),
+            key=name,
+        )
+
+    def fake_estimate_send_size(*, snapshot: Path, **_: object) -> int:
+        return sizes[snapshot.name]
+
+    created: list[tuple[str, int | None]] = []
+
+    def fake_create_backup(
+        *, key: str, estimated_size: int | None, **_: object
+    ) -> None:
+        created.append((key, estimated_size))
+
+    with patch.object(action, "estimate_send_size", fake_estimate_send_size):  # noqa: SIM117
+        with patch.object(action, "create_backup", fake_create_backup):
+            actions.execute(s3, bucket)
+
+    assert created == [("full", 100), ("big-delta", 1000), ("small-delta", 10)]
+
+
+def test_deletions_committed_once(s3: S3Client, bucket: str) -> None:
+    actions = Actions()
+    for name in ("used-1", "used-2"):
+        actions.create_backup(
+            source=Path("source"),
+            snapshot=Path("snapshots") / name,
+            send_parent=None,
+            key=name,
+        )
+    for name in ("used-1", "used-2", "unused"):
+        actions.delete_snapshot(Path("snapshots") / name)
+
+    with patch.object(action, "estimate_send_size", return_value=0):  # noqa: SIM117
+        with patch.object(action, "create_backup"):
+            with patch.object(action, "delete_snapshots") as delete_snapshots:
+                with patch.object(btrfsioctl, "sync") as sync:
+                    actions.execute(s3, bucket, wait_for_commit=True)
+
+    # Each deletion task only deletes, without committing
+    assert delete_snapshots.call_count == 3
+    for call in delete_snapshots.call_args_list:
+        assert not call.kwargs.get("wait_for_commit")
+    sync.assert_called_once_with(Path("snapshots"))
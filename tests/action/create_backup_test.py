@@ -2,11 +2,20 @@ from __future__ import annotations
 
 from base64 import b64decode
 import gzip
+import os
 import subprocess
 from typing import TYPE_CHECKING
+from unittest.mock import patch
 
+import boto3
 from botocore.exceptions import ClientError
+from btrfs2s3 import action
 from btrfs2s3.action import create_backup
+from btrfs2s3.action import Mirror
+from btrfs2s3.compress import CompressParams
+from btrfs2s3.sendstream import supports_compressed_data
+from btrfs2s3.upload import MIN_PART_SIZE
+from btrfs2s3.upload import UploadParams
 import btrfsutil
 import pytest
 
@@ -61,6 +70,63 @@ def test_large_archive_multipart_upload(
     download_and_pipe(key, ["btrfs", "receive", "--dump"])
 
 
+def test_fixed_upload_params(
+    btrfs_mountpoint: Path,
+    s3: S3Client,
+    bucket: str,
+    download_and_pipe: DownloadAndPipe,
+) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+    (source / "large-file").write_bytes(b"\xff" * (16 * 2**20))
+
+    snapshot = btrfs_mountpoint / "snapshot"
+    btrfsutil.create_snapshot(source, snapshot, read_only=True)
+
+    key = "test-backup"
+
+    create_backup(
+        s3=s3,
+        bucket=bucket,
+        snapshot=snapshot,
+        send_parent=None,
+        key=key,
+        upload_params=UploadParams(part_size=MIN_PART_SIZE, concurrency=2),
+    )
+
+    # Just check the archive is valid
+    download_and_pipe(key, ["btrfs", "receive", "--dump"])
+
+
+def test_precomputed_estimated_size(
+    btrfs_mountpoint: Path,
+    s3: S3Client,
+    bucket: str,
+    download_and_pipe: DownloadAndPipe,
+) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+    (source / "dummy-file").write_bytes(b"dummy")
+
+    snapshot = btrfs_mountpoint / "snapshot"
+    btrfsutil.create_snapshot(source, snapshot, read_only=True)
+
+    key = "test-backup"
+
+    with patch.object(action, "estimate_send_size") as estimate_send_size:
+        create_backup(
+            s3=s3,
+            bucket=bucket,
+            snapshot=snapshot,
+            send_parent=None,
+            key=key,
+            estimated_size=1000,
+        )
+
+    estimate_send_size.assert_not_called()
+    download_and_pipe(key, ["btrfs", "receive", "--dump"])
+
+
 def test_send_full_and_delta_archives_and_restore(
     btrfs_mountpoint: Path,
     s3: S3Client,
@@ -149,6 +215,124 @@ def test_pipe_success(btrfs_mountpoint: Path, s3: S3Client, bucket: str) -> None
     subprocess.run(["btrfs", "receive", "--dump"], input=data, check=True)
 
 
+def test_compress(
+    btrfs_mountpoint: Path,
+    s3: S3Client,
+    bucket: str,
+    download_and_pipe: DownloadAndPipe,
+) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+    (source / "large-file").write_bytes(b"\xff" * (16 * 2**20))
+
+    snapshot = btrfs_mountpoint / "snapshot"
+    btrfsutil.create_snapshot(source, snapshot, read_only=True)
+
+    key = "test-backup.zst"
+
+    create_backup(
+        s3=s3,
+        bucket=bucket,
+        key=key,
+        snapshot=snapshot,
+        send_parent=None,
+        compress=CompressParams(window_log=27),
+    )
+
+    assert s3.head_object(Bucket=bucket, Key=key)["ContentLength"] < 2**20
+    download_and_pipe(key, ["zstd", "-d", "--long=27", "-o", "/dev/null"])
+
+
+def test_compress_before_pipe(
+    btrfs_mountpoint: Path, s3: S3Client, bucket: str
+) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+
+    snapshot = btrfs_mountpoint / "snapshot"
+    btrfsutil.create_snapshot(source, snapshot, read_only=True)
+
+    key = "test-backup.zst"
+
+    create_backup(
+        s3=s3,
+        bucket=bucket,
+        key=key,
+        snapshot=snapshot,
+        send_parent=None,
+        pipe_through=[["base64"]],
+        compress=CompressParams(),
+    )
+
+    # Check the archive was compressed, then piped
+    encoded_compressed_data = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    data = subprocess.run(
+        ["zstd", "-d"],
+        input=b64decode(encoded_compressed_data),
+        capture_output=True,
+        check=True,
+    ).stdout
+    subprocess.run(["btrfs", "receive", "--dump"], input=data, check=True)
+
+
+def test_compress_and_pipe_fails(
+    btrfs_mountpoint: Path, s3: S3Client, bucket: str
+) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+
+    snapshot = btrfs_mountpoint / "snapshot"
+    btrfsutil.create_snapshot(source, snapshot, read_only=True)
+
+    key = "test-backup.zst"
+
+    with pytest.raises(RuntimeError, match="exited with code "):
+        create_backup(
+            s3=s3,
+            bucket=bucket,
+            snapshot=snapshot,
+            send_parent=None,
+            key=key,
+            pipe_through=[["base64", "--bad-option"]],
+            compress=CompressParams(),
+        )
+
+    # Check delete
+    with pytest.raises(ClientError):
+        s3.head_object(Bucket=bucket, Key=key)
+
+
+def test_compressed_data(
+    btrfs_mountpoint: Path,
+    s3: S3Client,
+    bucket: str,
+    download_and_pipe: DownloadAndPipe,
+) -> None:
+    if not supports_compressed_data():
+        pytest.skip("btrfs send --compressed-data isn't supported")
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+    (source / "large-file").write_bytes(b"\xff" * (16 * 2**20))
+
+    snapshot = btrfs_mountpoint / "snapshot"
+    btrfsutil.create_snapshot(source, snapshot, read_only=True)
+
+    key = "test-backup.v2"
+
+    create_backup(
+        s3=s3,
+        bucket=bucket,
+        key=key,
+        snapshot=snapshot,
+        send_parent=None,
+        compressed_data=True,
+    )
+
+    data = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    assert data.startswith(b"btrfs-stream\0\x02\0\0\0")
+    download_and_pipe(key, ["btrfs", "receive", "--dump"])
+
+
 def test_end_of_pipe_fails(
     btrfs_mountpoint: Path, s3: S3Client, bucket: str, capfd: pytest.CaptureFixture[str]
 ) -> None:
@@ -229,3 +413,85 @@ def test_start_of_pipe_fails(
     # Check delete
     with pytest.raises(ClientError):
         s3.head_object(Bucket=bucket, Key=key)
+
+
+def test_mirrors(btrfs_mountpoint: Path, s3: S3Client, bucket: str) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+    (source / "large-file").write_bytes(os.urandom(3 * MIN_PART_SIZE))
+
+    snapshot = btrfs_mountpoint / "snapshot"
+    btrfsutil.create_snapshot(source, snapshot, read_only=True)
+
+    key = "test-backup"
+    s3.create_bucket(Bucket="mirror-bucket")
+    mirror = Mirror(s3=boto3.client("s3"), bucket="mirror-bucket")
+
+    with patch.object(action, "Popen", wraps=subprocess.Popen) as popen:
+        create_backup(
+            s3=s3,
+            bucket=bucket,
+            snapshot=snapshot,
+            send_parent=None,
+            key=key,
+            upload_params=UploadParams(part_size=MIN_PART_SIZE),
+            mirrors=[mirror],
+        )
+
+    # The archive is only created once
+    assert popen.call_count == 1
+    data = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    assert s3.get_object(Bucket="mirror-bucket", Key=key)["Body"].read() == data
+    subprocess.run(["btrfs", "receive", "--dump"], input=data, check=True)
+
+
+def test_mirror_fails(btrfs_mountpoint: Path, s3: S3Client, bucket: str) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+
+    snapshot = btrfs_mountpoint / "snapshot"
+    btrfsutil.create_snapshot(source, snapshot, read_only=True)
+
+    key = "test-backup"
+    mirror_s3 = boto3.client("s3")
+    mirror_s3.create_bucket(Bucket="mirror-bucket")
+    mirror = Mirror(s3=mirror_s3, bucket="mirror-bucket")
+
+    with patch.object(  # noqa: SIM117
+        mirror_s3, "put_object", side_effect=RuntimeError("injected")
+    ):
+        with pytest.raises(RuntimeError, match="injected"):
+            create_backup(
+                s3=s3,
+                bucket=bucket,
+                snapshot=snapshot,
+                send_parent=None,
+                key=key,
+                mirrors=[mirror],
+            )
+
+    # The backup isn't kept anywhere, so the buckets don't diverge
+    for bucket_name in (bucket, "mirror-bucket"):
+        with pytest.raises(ClientError):
+            s3.head_object(Bucket=bucket_name, Key=key)
+
+
+def test_send_failure_with_mirrors(tmp_path: Path, s3: S3Client, bucket: str) -> None:
+    snapshot = tmp_path / "not-a-btrfs-subvolume"
+    key = "test-backup"
+    s3.create_bucket(Bucket="mirror-bucket")
+    mirror = Mirror(s3=s3, bucket="mirror-bucket")
+
+    with pytest.raises(RuntimeError, match="exited with code "):
+        create_backup(
+            s3=s3,
+            bucket=bucket,
+            snapshot=snapshot,
+            send_parent=None,
+            key=key,
+            mirrors=[mirror],
+        )
+
+    for bucket_name in (bucket, "mirror-bucket"):
+        with pytest.raises(ClientError):
+            s3.head_object(Bucket=bucket_name, Key=key)
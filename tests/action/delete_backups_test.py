@@ -1,11 +1,18 @@
 from __future__ import annotations
 
+from typing import Callable
 from typing import TYPE_CHECKING
+from unittest.mock import patch
 
+from botocore.exceptions import ClientError
+from btrfs2s3 import action
 from btrfs2s3.action import delete_backups
+import pytest
 
 if TYPE_CHECKING:
     from mypy_boto3_s3.client import S3Client
+    from mypy_boto3_s3.type_defs import DeleteObjectsOutputTypeDef
+    from mypy_boto3_s3.type_defs import DeleteTypeDef
 
 
 def test_good_delete_one_key(s3: S3Client, bucket: str) -> None:
@@ -43,3 +50,133 @@ def test_large_numbers_of_keys(s3: S3Client, bucket: str) -> None:
     delete_backups(s3, bucket, *keys)
 
     assert s3.list_objects_v2(Bucket=bucket).get("Contents", []) == []
+
+
+def test_concurrent_batches(
+    s3: S3Client, bucket: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(action, "_DELETE_BATCH_SIZE", 10)
+    keys = [f"test-backup{i}" for i in range(35)]
+    for key in keys:
+        s3.put_object(Bucket=bucket, Key=key, Body=b"dummy")
+
+    delete_backups(s3, bucket, *keys, max_concurrency=3)
+
+    assert s3.list_objects_v2(Bucket=bucket).get("Contents", []) == []
+
+
+def _fail_first_key(
+    s3: S3Client, code: str, *, times: int
+) -> tuple[Callable[..., DeleteObjectsOutputTypeDef], list[list[str]]]:
+    # Returns a replacement for delete_objects which reports an error for the
+    # first key of the first few requests
+    real_delete_objects = s3.delete_objects
+    calls: list[list[str]] = []
+
+    def delete_objects(
+        *,
+        Bucket: str,  # noqa: N803
+        Delete: DeleteTypeDef,  # noqa: N803
+    ) -> DeleteObjectsOutputTypeDef:
+        keys = [obj["Key"] for obj in Delete["Objects"]]
+        calls.append(keys)
+        if len(calls) > times:
+            return real_delete_objects(Bucket=Bucket, Delete=Delete)
+        response: DeleteObjectsOutputTypeDef = {"ResponseMetadata": {}}  # type: ignore[typeddict-item]
+        if keys[1:]:
+            response = real_delete_objects(
+                Bucket=Bucket,
+                Delete={"Quiet": True, "Objects": [{"Key": key} for key in keys[1:]]},
+            )
+        response["Errors"] = [{"Key": keys[0], "Code": code, "Message": "injected"}]
+        return response
+
+    return delete_objects, calls
+
+
+def test_retry_failed_keys(s3: S3Client, bucket: str) -> None:
+    keys = ["test-backup1", "test-backup2"]
+    for key in keys:
+        s3.put_object(Bucket=bucket, Key=key, Body=b"dummy")
+    delete_objects, calls = _fail_first_key(s3, "SlowDown", times=2)
+
+    with patch.object(s3, "delete_objects", delete_objects), patch("time.sleep"):
+        delete_backups(s3, bucket, *keys)
+
+    assert calls == [keys, ["test-backup1"], ["test-backup1"]]
+    assert s3.list_objects_v2(Bucket=bucket).get("Contents", []) == []
+
+
+def test_give_up_after_max_attempts(s3: S3Client, bucket: str) -> None:
+    keys = ["test-backup1", "test-backup2"]
+    for key in keys:
+        s3.put_object(Bucket=bucket, Key=key, Body=b"dummy")
+    delete_objects, calls = _fail_first_key(s3, "InternalError", times=100)
+
+    with patch.object(s3, "delete_objects", delete_objects), patch("time.sleep"):  # noqa: SIM117
+        with pytest.raises(RuntimeError, match="failed to delete 1 backups"):
+            delete_backups(s3, bucket, *keys)
+
+    assert len(calls) == action._DELETE_MAX_ATTEMPTS
+    assert [obj["Key"] for obj in s3.list_objects_v2(Bucket=bucket)["Contents"]] == [
+        "test-backup1"
+    ]
+
+
+def test_surface_permanent_errors(s3: S3Client, bucket: str) -> None:
+    keys = ["test-backup1", "test-backup2"]
+    for key in keys:
+        s3.put_object(Bucket=bucket, Key=key, Body=b"dummy")
+    delete_objects, calls = _fail_first_key(s3, "AccessDenied", times=1)
+
+    with patch.object(s3, "delete_objects", delete_objects):  # noqa: SIM117
+        with pytest.raises(RuntimeError, match="failed to delete 1 backups"):
+            delete_backups(s3, bucket, *keys)
+
+    # Not retried
+    assert calls == [keys]
+    assert [obj["Key"] for obj in s3.list_objects_v2(Bucket=bucket)["Contents"]] == [
+        "test-backup1"
+    ]
+
+
+def test_retry_throttled_requests(s3: S3Client, bucket: str) -> None:
+    key = "test-backup"
+    s3.put_object(Bucket=bucket, Key=key, Body=b"dummy")
+    real_delete_objects = s3.delete_objects
+    calls = 0
+
+    def delete_objects(
+        *,
+        Bucket: str,  # noqa: N803
+        Delete: DeleteTypeDef,  # noqa: N803
+    ) -> DeleteObjectsOutputTypeDef:
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise ClientError(
+                {"Error": {"Code": "SlowDown", "Message": "injected"}}, "DeleteObjects"
+            )
+        return real_delete_objects(Bucket=Bucket, Delete=Delete)
+
+    with patch.object(s3, "delete_objects", delete_objects), patch("time.sleep"):
+        delete_backups(s3, bucket, key)
+
+    assert calls == 2
+    assert s3.list_objects_v2(Bucket=bucket).get("Contents", []) == []
+
+
+def test_adaptive_limit() -> None:
+    limit = action._AdaptiveLimit(8)
+
+    limit.throttled()
+    assert limit.limit == 4
+    limit.throttled()
+    limit.throttled()
+    limit.throttled()
+    assert limit.limit == 1
+    limit.succeeded()
+    assert limit.limit == 2
+    for _ in range(10):
+        limit.succeeded()
+    assert limit.limit == 8
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING
+
+from btrfs2s3.action import delete_snapshots
+import btrfsutil
+import pytest
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+@pytest.mark.parametrize("wait_for_commit", [False, True])
+def test_call(
+    btrfs_mountpoint: Path, caplog: pytest.LogCaptureFixture, *, wait_for_commit: bool
+) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+    (btrfs_mountpoint / "subdir").mkdir()
+    snapshots = [
+        btrfs_mountpoint / "snapshot1",
+        btrfs_mountpoint / "snapshot2",
+        btrfs_mountpoint / "subdir" / "snapshot3",
+    ]
+    for snapshot in snapshots:
+        btrfsutil.create_snapshot(source, snapshot, read_only=True)
+
+    with caplog.at_level(logging.INFO):
+        delete_snapshots(snapshots, wait_for_commit=wait_for_commit)
+
+    for snapshot in snapshots:
+        assert not snapshot.exists()
+    assert "checked 3 snapshots" in caplog.text
+    assert "deleted 3 snapshots" in caplog.text
+    assert ("committed deletions" in caplog.text) == wait_for_commit
+
+
+def test_empty() -> None:
+    delete_snapshots([])
+
+
+def test_delete_nothing_if_any_target_is_invalid(btrfs_mountpoint: Path) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+    snapshot = btrfs_mountpoint / "snapshot"
+    btrfsutil.create_snapshot(source, snapshot, read_only=True)
+    not_read_only = btrfs_mountpoint / "not-read-only"
+    btrfsutil.create_snapshot(source, not_read_only)
+    not_subvolume = btrfs_mountpoint / "not-subvolume"
+    not_subvolume.mkdir()
+
+    with pytest.raises(RuntimeError, match="target isn't a read-only snapshot"):
+        delete_snapshots([snapshot, not_read_only])
+    with pytest.raises(RuntimeError, match="target isn't a snapshot"):
+        delete_snapshots([snapshot, source])
+    with pytest.raises(RuntimeError, match="target isn't a subvolume"):
+        delete_snapshots([snapshot, not_subvolume])
+    with pytest.raises(RuntimeError, match="target isn't a subvolume"):
+        delete_snapshots([snapshot, btrfs_mountpoint / "does-not-exist"])
+
+    assert snapshot.exists()
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import _thread
+from pathlib import Path
+from unittest.mock import patch
+
+from btrfs2s3 import action
+import pytest
+
+
+def test_estimate_send_sizes() -> None:
+    snapshots = [(Path(f"snapshot-{i}"), None) for i in range(5)]
+
+    with patch.object(
+        action, "_try_estimate_send_size", side_effect=lambda s, _: len(s.name)
+    ):
+        got = action._estimate_send_sizes(snapshots, max_workers=2)
+
+    assert got == [len("snapshot-0")] * 5
+
+
+def test_interrupt_skips_remaining_estimates() -> None:
+    snapshots = [(Path(f"snapshot-{i}"), None) for i in range(10)]
+    estimated: list[Path] = []
+
+    def estimate(snapshot: Path, _: Path | None) -> int:
+        if not estimated:
+            _thread.interrupt_main()
+        estimated.append(snapshot)
+        return 0
+
+    with patch.object(action, "_try_estimate_send_size", side_effect=estimate):  # noqa: SIM117
+        with pytest.raises(KeyboardInterrupt):
+            action._estimate_send_sizes(snapshots, max_workers=1)
+
+    assert estimated == [Path("snapshot-0")]
@@ -2,9 +2,12 @@ from __future__ import annotations
 
 import time
 from typing import TYPE_CHECKING
+from unittest.mock import patch
 from uuid import uuid4
 
 from botocore.exceptions import ClientError
+from btrfs2s3 import assessor
+from btrfs2s3._internal import btrfsioctl
 from btrfs2s3._internal.util import backup_of_snapshot
 from btrfs2s3._internal.util import NULL_UUID
 from btrfs2s3._internal.util import SubvolumeFlags
@@ -424,6 +427,34 @@ def test_ignore_snapshots_from_unrelated_sources(
     assert info.flags & SubvolumeFlags.ReadOnly
 
 
+def test_only_discover_snapshots_in_snapshot_dir(
+    btrfs_mountpoint: Path, s3: S3Client, bucket: str
+) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+    snapshot_dir = btrfs_mountpoint / "snapshots"
+    (snapshot_dir / "nested").mkdir(parents=True)
+    # Found, even in a subdirectory
+    nested_snapshot = snapshot_dir / "nested" / "snapshot"
+    btrfsutil.create_snapshot(source, nested_snapshot, read_only=True)
+    # Not found, since it's outside the snapshot dir
+    outside_snapshot = btrfs_mountpoint / "outside-snapshot"
+    btrfsutil.create_snapshot(source, outside_snapshot, read_only=True)
+    btrfsutil.sync(btrfs_mountpoint)
+
+    assessment = assess(
+        snapshot_dir=snapshot_dir,
+        sources=(source,),
+        s3=s3,
+        bucket=bucket,
+        policy=Policy(),
+    )
+
+    source_info = btrfsutil.subvolume_info(source)
+    snapshots = assessment.sources[source_info.uuid].snapshots.values()
+    assert [s.initial_path for s in snapshots if not s.new] == [nested_snapshot]
+
+
 def test_ignore_unrelated_s3_objects(
     btrfs_mountpoint: Path, s3: S3Client, bucket: str
 ) -> None:
@@ -482,7 +513,7 @@ def test_delete_old_backups(btrfs_mountpoint: Path, s3: S3Client, bucket: str) -
     dummy_snapshot = snapshot_dir / "dummy-snapshot"
     btrfsutil.create_snapshot(source, dummy_snapshot, read_only=True)
     # Create a dummy backup to match the snapshot
-    dummy_backup = backup_of_snapshot(btrfsutil.subvolume_info(dummy_snapshot))
+    dummy_backup = backup_of_snapshot(btrfsioctl.subvolume_info(dummy_snapshot))
     dummy_key = f"base{''.join(dummy_backup.get_path_suffixes())}"
     s3.put_object(Bucket=bucket, Key=dummy_key, Body=b"dummy")
     # Modify some data in the source
@@ -541,3 +572,125 @@ def test_second_run_is_a_no_op(
     actions = Actions()
     assessment_to_actions(assessment, actions)
     assert actions.empty()
+
+
+def test_prefix(btrfs_mountpoint: Path, s3: S3Client, bucket: str) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+    snapshot_dir = btrfs_mountpoint / "snapshots"
+    snapshot_dir.mkdir()
+    policy = Policy()
+
+    assessment = assess(
+        snapshot_dir=snapshot_dir,
+        sources=(source,),
+        s3=s3,
+        bucket=bucket,
+        policy=policy,
+        prefixes={source: "host/"},
+    )
+    actions = Actions()
+    assessment_to_actions(assessment, actions)
+    actions.execute(s3, bucket)
+
+    ((obj, backup),) = list(iter_backups(s3, bucket))
+    assert obj["Key"].startswith(f"host/{source.name}.")
+
+    # Backups outside the prefix aren't found
+    s3.put_object(Bucket=bucket, Key=obj["Key"][len("host/") :], Body=b"dummy")
+    with patch.object(s3, "list_objects_v2", wraps=s3.list_objects_v2) as list_objects:
+        assessment = assess(
+            snapshot_dir=snapshot_dir,
+            sources=(source,),
+            s3=s3,
+            bucket=bucket,
+            policy=policy,
+            prefixes={source: "host/"},
+        )
+
+    list_objects.assert_called_once_with(Bucket=bucket, Prefix="host/")
+    (source_asmt,) = assessment.sources.values()
+    (backup_asmt,) = source_asmt.backups.values()
+    assert backup_asmt.key() == obj["Key"]
+    assert backup_asmt.backup() == backup
+
+
+def test_suffix(btrfs_mountpoint: Path, s3: S3Client, bucket: str) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+    snapshot_dir = btrfs_mountpoint / "snapshots"
+    snapshot_dir.mkdir()
+    policy = Policy()
+
+    assessment = assess(
+        snapshot_dir=snapshot_dir,
+        sources=(source,),
+        s3=s3,
+        bucket=bucket,
+        policy=policy,
+        suffixes={source: ".zst"},
+    )
+    actions = Actions()
+    assessment_to_actions(assessment, actions)
+    actions.execute(s3, bucket)
+
+    ((obj, backup),) = list(iter_backups(s3, bucket))
+    assert obj["Key"].endswith(".zst")
+
+    # The existing backup is found with its suffix
+    assessment = assess(
+        snapshot_dir=snapshot_dir,
+        sources=(source,),
+        s3=s3,
+        bucket=bucket,
+        policy=policy,
+        suffixes={source: ".zst"},
+    )
+    (source_asmt,) = assessment.sources.values()
+    (backup_asmt,) = source_asmt.backups.values()
+    assert backup_asmt.key() == obj["Key"]
+    assert backup_asmt.backup() == backup
+
+
+def test_max_workers(btrfs_mountpoint: Path, s3: S3Client, bucket: str) -> None:
+    snapshot_dir = btrfs_mountpoint / "snapshots"
+    snapshot_dir.mkdir()
+    sources = []
+    for i in range(3):
+        source = btrfs_mountpoint / f"source{i}"
+        btrfsutil.create_subvolume(source)
+        for j in range(3):
+            (source / "dummy-file").write_bytes(b"dummy" * j)
+            btrfsutil.create_snapshot(
+                source, snapshot_dir / f"source{i}.{j}", read_only=True
+            )
+        sources.append(source)
+    policy = Policy(params=Params(years=1))
+
+    def summarize(max_workers: int) -> object:
+        assessment = assess(
+            snapshot_dir=snapshot_dir,
+            sources=sources,
+            s3=s3,
+            bucket=bucket,
+            policy=policy,
+            max_workers=max_workers,
+        )
+        return [
+            (
+                source_asmt.path,
+                {
+                    uuid: snapshot.keep_meta
+                    for uuid, snapshot in source_asmt.snapshots.items()
+                    if not snapshot.new
+                },
+                sorted(
+                    str(backup.keep_meta) for backup in source_asmt.backups.values()
+                ),
+            )
+            for source_asmt in assessment.sources.values()
+        ]
+
+    # Sources are assessed in parallel, with the same result in the same order
+    with patch.object(assessor, "_MIN_ITEMS_FOR_WORKERS", 0):
+        assert summarize(3) == summarize(1)
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from unittest.mock import patch
+from uuid import uuid4
+
+from btrfs2s3 import assessor
+from btrfs2s3._internal.util import backup_of_snapshot
+from btrfs2s3._internal.util import mksubvol
+from btrfs2s3.assessor import _resolve_all
+from btrfs2s3.preservation import Params
+from btrfs2s3.preservation import Policy
+from btrfs2s3.resolver import resolve
+import pytest
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_resolve_all(max_workers: int) -> None:
+    policy = Policy(params=Params(hours=3, minutes=30), now=1e9)
+    inputs = []
+    for _ in range(3):
+        parent_uuid = uuid4().bytes
+        snapshots = [
+            mksubvol(
+                uuid=uuid4().bytes,
+                parent_uuid=parent_uuid,
+                ctransid=i,
+                ctime=1e9 - i * 60,
+            )
+            for i in range(100)
+        ]
+        backups = [
+            backup_of_snapshot(snapshot, send_parent=None) for snapshot in snapshots
+        ]
+        inputs.append((snapshots, backups))
+
+    with patch.object(assessor, "_MIN_ITEMS_FOR_WORKERS", 0):
+        results = _resolve_all(inputs, policy=policy, max_workers=max_workers)
+
+    # Results are in the same order as the inputs
+    assert results == [
+        resolve(snapshots=snapshots, backups=backups, policy=policy)
+        for snapshots, backups in inputs
+    ]
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import random
+from uuid import uuid4
+
+import arrow
+from btrfs2s3.backups import BackupInfo
+import pytest
+
+
+def mkinfo(rng: random.Random) -> BackupInfo:
+    return BackupInfo(
+        uuid=uuid4().bytes,
+        parent_uuid=uuid4().bytes,
+        ctransid=rng.randrange(2**64),
+        ctime=rng.uniform(0, 2**32),
+        send_parent_uuid=rng.choice([None, uuid4().bytes]),
+    )
+
+
+_BASE_NAMES = ["source", "home.old", "prefix/source", "a.b/source", "source.full"]
+_EXTRA_SUFFIXES = ["", ".gz", ".gz.gpg", ".zst", ".pgp", ".sig", ".full", ".x"]
+_TIMEZONES = ["UTC", "US/Pacific", "Asia/Kolkata", "Australia/Lord_Howe"]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_same_as_from_path(seed: int) -> None:
+    rng = random.Random(seed)
+    paths = []
+    for _ in range(50):
+        info = mkinfo(rng)
+        suffixes = info.get_path_suffixes(tzinfo=rng.choice(_TIMEZONES))
+        base = rng.choice(_BASE_NAMES)
+        paths.append(f"{base}{''.join(suffixes)}{rng.choice(_EXTRA_SUFFIXES)}")
+
+    got = BackupInfo.from_paths(paths)
+
+    assert got == [BackupInfo._from_any_path(path) for path in paths]
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        # canonical
+        "name.t2006-01-01T00:00:00-08:00.i12345.u3fd11d8e-8110-4cd0-b85c-bae3dda86a3d"
+        ".s3ae01eae-d50d-4187-b67f-cef0ef973e1f.p9d9d3bcb-4b62-46a3-b6e2-678eeb24f54e",
+        # a later suffix overrides the canonical one
+        "name.t2006-01-01T00:00:00-08:00.i12345.u3fd11d8e-8110-4cd0-b85c-bae3dda86a3d"
+        ".s3ae01eae-d50d-4187-b67f-cef0ef973e1f.p9d9d3bcb-4b62-46a3-b6e2-678eeb24f54e"
+        ".i54321",
+        # an earlier suffix is a send parent of a full backup
+        "name.s3ae01eae-d50d-4187-b67f-cef0ef973e1f.t2006-01-01T00:00:00-08:00.i12345"
+        ".u3fd11d8e-8110-4cd0-b85c-bae3dda86a3d.full"
+        ".p9d9d3bcb-4b62-46a3-b6e2-678eeb24f54e",
+        # upper case uuid
+        "name.t2006-01-01T00:00:00Z.i12345.u3FD11D8E-8110-4CD0-B85C-BAE3DDA86A3D"
+        ".s3ae01eae-d50d-4187-b67f-cef0ef973e1f.p9d9d3bcb-4b62-46a3-b6e2-678eeb24f54e",
+        # trailing slash
+        "name.t2006-01-01T00:00:00-08:00.i12345.u3fd11d8e-8110-4cd0-b85c-bae3dda86a3d"
+        ".s3ae01eae-d50d-4187-b67f-cef0ef973e1f.p9d9d3bcb-4b62-46a3-b6e2-678eeb24f54e/",
+    ],
+)
+def test_unusual_paths_same_as_from_path(path: str) -> None:
+    assert BackupInfo.from_path(path) == BackupInfo._from_any_path(path)
+
+
+def test_invalid_paths_are_none() -> None:
+    info = BackupInfo(
+        uuid=uuid4().bytes,
+        parent_uuid=uuid4().bytes,
+        ctransid=1,
+        ctime=arrow.get().timestamp(),
+        send_parent_uuid=None,
+    )
+    valid = f"name{''.join(info.get_path_suffixes())}"
+
+    got = BackupInfo.from_paths(["not-a-backup", valid, "bad.path.with.suffixes"])
+
+    assert got == [None, info, None]
+
+
+@pytest.mark.parametrize("base", ["name", "dir/name", "name.old"])
+@pytest.mark.parametrize("extra", ["", ".gz", ".gz.gpg"])
+def test_canonical_paths_use_fast_path(base: str, extra: str) -> None:
+    info = BackupInfo(
+        uuid=uuid4().bytes,
+        parent_uuid=uuid4().bytes,
+        ctransid=1,
+        ctime=arrow.get().timestamp(),
+        send_parent_uuid=uuid4().bytes,
+    )
+    path = f"{base}{''.join(info.get_path_suffixes(tzinfo='US/Pacific'))}{extra}"
+
+    assert BackupInfo._from_canonical_path(path) == info
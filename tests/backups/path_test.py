@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import itertools
+import pickle
 from typing import TYPE_CHECKING
 from uuid import UUID
 
@@ -126,3 +127,17 @@ def test_bad_paths(bad_path: str) -> None:
         ValueError, match="missing or incomplete parameters for backup name"
     ):
         BackupInfo.from_path(bad_path)
+
+
+def test_slots_and_pickle() -> None:
+    info = BackupInfo(
+        uuid=UUID("3fd11d8e-8110-4cd0-b85c-bae3dda86a3d").bytes,
+        parent_uuid=UUID("9d9d3bcb-4b62-46a3-b6e2-678eeb24f54e").bytes,
+        ctransid=12345,
+        ctime=1.5,
+        send_parent_uuid=None,
+    )
+
+    assert not hasattr(info, "__dict__")
+    assert info.ctime == 1
+    assert pickle.loads(pickle.dumps(info)) == info
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+from random import randrange
+from typing import TYPE_CHECKING
+from unittest.mock import patch
+from uuid import uuid4
+
+import arrow
+from btrfs2s3.backups import BackupInfo
+from btrfs2s3.cache import ListingCache
+import pytest
+
+if TYPE_CHECKING:
+    from pathlib import Path
+    from typing import Sequence
+
+    from mypy_boto3_s3.client import S3Client
+
+
+def mkinfo() -> BackupInfo:
+    return BackupInfo(
+        uuid=uuid4().bytes,
+        parent_uuid=uuid4().bytes,
+        ctransid=randrange(100000),
+        ctime=arrow.get().timestamp(),
+        send_parent_uuid=uuid4().bytes,
+    )
+
+
+def put_backup(s3: S3Client, bucket: str, info: BackupInfo) -> str:
+    key = f"basename{''.join(info.get_path_suffixes())}"
+    s3.put_object(Bucket=bucket, Key=key, Body=b"dummy")
+    return key
+
+
+@pytest.fixture(params=["file", "memory"])
+def cache(request: pytest.FixtureRequest, tmp_path: Path) -> ListingCache:
+    if request.param == "memory":
+        return ListingCache(None)
+    return ListingCache.for_bucket(tmp_path / "state", "test-bucket")
+
+
+def infos_of(
+    cache: ListingCache, s3: S3Client, bucket: str, prefixes: Sequence[str] = ("",)
+) -> set[BackupInfo]:
+    return {info for _, info in cache.list_backups(s3, bucket, prefixes=prefixes)}
+
+
+def test_empty(cache: ListingCache, s3: S3Client, bucket: str) -> None:
+    assert cache.list_backups(s3, bucket) == []
+
+
+def test_cached_listing(cache: ListingCache, s3: S3Client, bucket: str) -> None:
+    info = mkinfo()
+    put_backup(s3, bucket, info)
+    assert infos_of(cache, s3, bucket) == {info}
+
+    with patch.object(s3, "list_objects_v2") as list_objects_v2:
+        assert infos_of(cache, s3, bucket) == {info}
+
+    list_objects_v2.assert_not_called()
+
+
+def test_cache_persists(tmp_path: Path, s3: S3Client, bucket: str) -> None:
+    info = mkinfo()
+    put_backup(s3, bucket, info)
+    ListingCache.for_bucket(tmp_path, bucket).list_backups(s3, bucket)
+
+    cache = ListingCache.for_bucket(tmp_path, bucket)
+    with patch.object(s3, "list_objects_v2") as list_objects_v2:
+        assert infos_of(cache, s3, bucket) == {info}
+
+    list_objects_v2.assert_not_called()
+
+
+def test_record_created_and_deleted(
+    cache: ListingCache, s3: S3Client, bucket: str
+) -> None:
+    old_info = mkinfo()
+    old_key = put_backup(s3, bucket, old_info)
+    cache.list_backups(s3, bucket)
+    new_info = mkinfo()
+    new_key = put_backup(s3, bucket, new_info)
+    s3.delete_object(Bucket=bucket, Key=old_key)
+
+    cache.record_created(s3, bucket, [new_key])
+    cache.record_deleted([old_key])
+
+    with patch.object(s3, "list_objects_v2") as list_objects_v2:
+        assert infos_of(cache, s3, bucket) == {new_info}
+
+    list_objects_v2.assert_not_called()
+
+
+def test_newest_object_deleted(cache: ListingCache, s3: S3Client, bucket: str) -> None:
+    key = put_backup(s3, bucket, mkinfo())
+    cache.list_backups(s3, bucket)
+    s3.delete_object(Bucket=bucket, Key=key)
+
+    assert cache.list_backups(s3, bucket) == []
+
+
+def test_newest_object_changed(cache: ListingCache, s3: S3Client, bucket: str) -> None:
+    info = mkinfo()
+    key = put_backup(s3, bucket, info)
+    cache.list_backups(s3, bucket)
+    s3.put_object(Bucket=bucket, Key=key, Body=b"changed")
+
+    ((obj, got_info),) = cache.list_backups(s3, bucket)
+
+    assert got_info == info
+    assert obj["Size"] == len(b"changed")
+
+
+def test_refresh_interval(tmp_path: Path, s3: S3Client, bucket: str) -> None:
+    cache = ListingCache.for_bucket(tmp_path, bucket, refresh_interval=2)
+    put_backup(s3, bucket, mkinfo())
+    cache.list_backups(s3, bucket)
+
+    with patch.object(
+        s3, "list_objects_v2", wraps=s3.list_objects_v2
+    ) as list_objects_v2:
+        for _ in range(3):
+            cache.list_backups(s3, bucket)
+
+    assert list_objects_v2.call_count == 1
+
+
+def test_invalidate(cache: ListingCache, s3: S3Client, bucket: str) -> None:
+    put_backup(s3, bucket, mkinfo())
+    cache.list_backups(s3, bucket)
+
+    cache.invalidate()
+
+    with patch.object(
+        s3, "list_objects_v2", wraps=s3.list_objects_v2
+    ) as list_objects_v2:
+        cache.list_backups(s3, bucket)
+
+    assert list_objects_v2.call_count == 1
+
+
+def test_unreadable_cache(tmp_path: Path, s3: S3Client, bucket: str) -> None:
+    cache = ListingCache(tmp_path / "cache.json")
+    (tmp_path / "cache.json").write_text("garbage")
+    info = mkinfo()
+    put_backup(s3, bucket, info)
+
+    assert infos_of(cache, s3, bucket) == {info}
+
+
+def test_buckets_have_separate_caches(tmp_path: Path) -> None:
+    a = ListingCache.for_bucket(tmp_path, "a")
+    b = ListingCache.for_bucket(tmp_path, "b")
+    c = ListingCache.for_bucket(tmp_path, "a", endpoint_url="https://example.com")
+
+    assert len({a._path, b._path, c._path}) == 3
+
+
+def test_prefixes_changed(cache: ListingCache, s3: S3Client, bucket: str) -> None:
+    info = mkinfo()
+    key = f"a/basename{''.join(info.get_path_suffixes())}"
+    s3.put_object(Bucket=bucket, Key=key, Body=b"dummy")
+    assert infos_of(cache, s3, bucket, prefixes=["b/"]) == set()
+
+    assert infos_of(cache, s3, bucket, prefixes=["a/", "b/"]) == {info}
+
+
+def test_memory_cache_writes_nothing(tmp_path: Path, s3: S3Client, bucket: str) -> None:
+    cache = ListingCache(None)
+    put_backup(s3, bucket, mkinfo())
+    cache.list_backups(s3, bucket)
+    cache.record_deleted([])
+    cache.invalidate()
+
+    assert list(tmp_path.iterdir()) == []
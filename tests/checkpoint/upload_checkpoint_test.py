@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from btrfs2s3.checkpoint import CheckpointPart
+from btrfs2s3.checkpoint import CheckpointState
+from btrfs2s3.checkpoint import UploadCheckpoints
+import pytest
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from mypy_boto3_s3.client import S3Client
+
+
+@pytest.fixture()
+def checkpoints(tmp_path: Path) -> UploadCheckpoints:
+    return UploadCheckpoints.for_bucket(tmp_path / "state", "test-bucket")
+
+
+def test_no_checkpoint(checkpoints: UploadCheckpoints) -> None:
+    assert checkpoints.get("test-key").load() is None
+
+
+def test_record_and_load(checkpoints: UploadCheckpoints) -> None:
+    checkpoint = checkpoints.get("test-key")
+    part = CheckpointPart(etag="etag", sha256=b"\x01" * 32)
+
+    checkpoint.start(CheckpointState(upload_id="upload-id", part_size=5, parts={}))
+    checkpoint.record_part(1, part)
+    checkpoint.close()
+
+    assert checkpoints.get("test-key").load() == CheckpointState(
+        upload_id="upload-id", part_size=5, parts={1: part}
+    )
+
+
+def test_resume_appends(checkpoints: UploadCheckpoints) -> None:
+    checkpoint = checkpoints.get("test-key")
+    part1 = CheckpointPart(etag="etag1", sha256=b"\x01" * 32)
+    part2 = CheckpointPart(etag="etag2", sha256=b"\x02" * 32)
+    checkpoint.start(CheckpointState(upload_id="upload-id", part_size=5, parts={}))
+    checkpoint.record_part(1, part1)
+    checkpoint.close()
+
+    state = checkpoint.load()
+    assert state is not None
+    checkpoint.start(state)
+    checkpoint.record_part(2, part2)
+    checkpoint.close()
+
+    assert checkpoint.load() == CheckpointState(
+        upload_id="upload-id", part_size=5, parts={1: part1, 2: part2}
+    )
+
+
+def test_partly_written_line(checkpoints: UploadCheckpoints, tmp_path: Path) -> None:
+    checkpoint = checkpoints.get("test-key")
+    part = CheckpointPart(etag="etag", sha256=b"\x01" * 32)
+    checkpoint.start(CheckpointState(upload_id="upload-id", part_size=5, parts={}))
+    checkpoint.record_part(1, part)
+    checkpoint.close()
+    (path,) = (tmp_path / "state").glob("*/*.jsonl")
+    with path.open("a") as fp:
+        fp.write('{"part_number": 2, "et')
+
+    assert checkpoint.load() == CheckpointState(
+        upload_id="upload-id", part_size=5, parts={1: part}
+    )
+
+
+def test_other_key(checkpoints: UploadCheckpoints, tmp_path: Path) -> None:
+    state = CheckpointState(upload_id="upload-id", part_size=5, parts={})
+    for key in ("test-key", "other-key"):
+        checkpoints.get(key).start(state)
+        checkpoints.get(key).close()
+    paths = sorted((tmp_path / "state").glob("*/*.jsonl"))
+    content = {path.read_text() for path in paths}
+    for path in paths:
+        path.write_text(next(text for text in content if "test-key" in text))
+
+    # A checkpoint is only used for the key it was written for
+    assert checkpoints.get("test-key").load() == state
+    assert checkpoints.get("other-key").load() is None
+
+
+def test_unreadable(checkpoints: UploadCheckpoints, tmp_path: Path) -> None:
+    checkpoint = checkpoints.get("test-key")
+    checkpoint.start(CheckpointState(upload_id="upload-id", part_size=5, parts={}))
+    checkpoint.close()
+    (path,) = (tmp_path / "state").glob("*/*.jsonl")
+    path.write_text("garbage")
+
+    assert checkpoint.load() is None
+
+
+def test_clear(checkpoints: UploadCheckpoints) -> None:
+    checkpoint = checkpoints.get("test-key")
+    checkpoint.start(CheckpointState(upload_id="upload-id", part_size=5, parts={}))
+
+    checkpoint.clear()
+
+    assert checkpoint.load() is None
+
+
+def test_for_bucket_is_unique(tmp_path: Path) -> None:
+    state = CheckpointState(upload_id="upload-id", part_size=5, parts={})
+    checkpoint = UploadCheckpoints.for_bucket(tmp_path, "bucket").get("test-key")
+    checkpoint.start(state)
+    checkpoint.close()
+
+    for other in (
+        UploadCheckpoints.for_bucket(tmp_path, "other-bucket"),
+        UploadCheckpoints.for_bucket(
+            tmp_path, "bucket", endpoint_url="https://example.com"
+        ),
+    ):
+        assert other.get("test-key").load() is None
+
+
+def test_prune(s3: S3Client, bucket: str, checkpoints: UploadCheckpoints) -> None:
+    upload_ids = {}
+    for key in ("keep-key", "prune-key"):
+        upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key)["UploadId"]
+        upload_ids[key] = upload_id
+        checkpoint = checkpoints.get(key)
+        checkpoint.start(CheckpointState(upload_id=upload_id, part_size=5, parts={}))
+        checkpoint.close()
+
+    checkpoints.prune(s3, bucket, keep={"keep-key"})
+
+    uploads = s3.list_multipart_uploads(Bucket=bucket)["Uploads"]
+    assert [upload["UploadId"] for upload in uploads] == [upload_ids["keep-key"]]
+    assert checkpoints.get("keep-key").load() is not None
+    assert checkpoints.get("prune-key").load() is None
+
+
+def test_prune_upload_gone(
+    s3: S3Client, bucket: str, checkpoints: UploadCheckpoints
+) -> None:
+    checkpoint = checkpoints.get("test-key")
+    checkpoint.start(CheckpointState(upload_id="missing", part_size=5, parts={}))
+    checkpoint.close()
+
+    checkpoints.prune(s3, bucket)
+
+    assert checkpoint.load() is None
+
+
+def test_prune_no_dir(s3: S3Client, bucket: str, tmp_path: Path) -> None:
+    UploadCheckpoints(tmp_path / "missing").prune(s3, bucket)
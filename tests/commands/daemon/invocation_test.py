@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+from unittest.mock import patch
+
+from btrfs2s3.commands import daemon
+from btrfs2s3.main import main
+from btrfs2s3.s3 import iter_backups
+import btrfsutil
+import pytest
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from mypy_boto3_s3.client import S3Client
+
+
+def test_daemon(
+    tmp_path: Path, btrfs_mountpoint: Path, s3: S3Client, bucket: str
+) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+    snapshot_dir = btrfs_mountpoint / "snapshots"
+    snapshot_dir.mkdir()
+    (source / "dummy-file").write_bytes(b"dummy")
+    btrfsutil.sync(source)
+
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(f"""
+      timezone: UTC
+      sources:
+      - path: {source}
+        snapshots: {snapshot_dir}
+        upload_to_remotes:
+        - id: aws
+          preserve: 1y
+      remotes:
+      - id: aws
+        s3:
+          bucket: {bucket}
+    """)
+
+    waits = 0
+
+    def wait(*_args: object, **_kwargs: object) -> None:
+        nonlocal waits
+        waits += 1
+        if waits > 1:
+            raise KeyboardInterrupt
+        # Modify the source after the first update
+        (source / "dummy-file").write_bytes(b"modified")
+        btrfsutil.sync(source)
+
+    with patch.object(daemon, "_wait", side_effect=wait):  # noqa: SIM117
+        with pytest.raises(KeyboardInterrupt):
+            main(argv=["daemon", str(config_path)])
+
+    ctransid = btrfsutil.subvolume_info(source).ctransid
+    infos = [btrfsutil.subvolume_info(path) for path in snapshot_dir.iterdir()]
+    (info,) = (info for info in infos if info.ctransid == ctransid)
+    backups = {backup.uuid for _, backup in iter_backups(s3, bucket)}
+    assert info.uuid in backups
@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from pathlib import Path
+import time
+from unittest.mock import patch
+
+from btrfs2s3.commands import daemon
+
+
+def test_wait_until() -> None:
+    start = time.time()
+    with patch.object(daemon, "read_ctransids", return_value={"source": 1}):
+        daemon._wait(
+            [Path("source")], {"source": 1}, until=start + 0.05, poll_interval=0.01
+        )
+
+    assert time.time() >= start + 0.05
+
+
+def test_wait_until_changed() -> None:
+    start = time.time()
+    with patch.object(
+        daemon,
+        "read_ctransids",
+        side_effect=[{"source": 1}, {"source": 1}, {"source": 2}],
+    ) as read_ctransids:
+        daemon._wait(
+            [Path("source")], {"source": 1}, until=start + 60, poll_interval=0.01
+        )
+
+    assert read_ctransids.call_count == 3
+    assert time.time() < start + 60
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import arrow
+from btrfs2s3.commands.next_wakeup import get_next_wakeup
+from btrfs2s3.config import load_from_path
+from btrfs2s3.main import main
+from rich.console import Console
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    import pytest
+
+
+def _write_config(path: Path, *preserves: str) -> None:
+    uploads = "".join(
+        f"""
+        - id: remote-{i}
+          preserve: {preserve}"""
+        for i, preserve in enumerate(preserves)
+    )
+    remotes = "".join(
+        f"""
+      - id: remote-{i}
+        s3:
+          bucket: bucket-{i}"""
+        for i in range(len(preserves))
+    )
+    path.write_text(f"""
+      timezone: UTC
+      sources:
+      - path: dummy_source
+        snapshots: dummy_snapshot_dir
+        upload_to_remotes:{uploads}
+      remotes:{remotes}
+    """)
+
+
+def test_get_next_wakeup(tmp_path: Path) -> None:
+    config_path = tmp_path / "config.yaml"
+    _write_config(config_path, "1y 3m", "1y 1d")
+    now = arrow.get("2006-01-02T15:04:05").timestamp()
+
+    got = get_next_wakeup(load_from_path(str(config_path)), now=now)
+
+    assert got == arrow.get("2006-01-03").timestamp()
+
+
+def test_print_iso8601(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    config_path = tmp_path / "config.yaml"
+    _write_config(config_path, "1y 1d")
+
+    assert main(console=Console(), argv=["next-wakeup", str(config_path)]) == 0
+
+    (out, err) = capsys.readouterr()
+    expected = arrow.utcnow().shift(days=1).floor("day")
+    assert arrow.get(out.strip()) == expected
+    assert err == ""
+
+
+def test_print_timestamp(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    config_path = tmp_path / "config.yaml"
+    _write_config(config_path, "1y")
+
+    argv = ["next-wakeup", "--timestamp", str(config_path)]
+    assert main(console=Console(), argv=argv) == 0
+
+    (out, _) = capsys.readouterr()
+    assert int(out) == arrow.utcnow().shift(years=1).floor("year").timestamp()
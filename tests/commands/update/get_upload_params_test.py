@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+from btrfs2s3.commands.update import get_upload_params
+from btrfs2s3.config import S3UploadConfig
+from btrfs2s3.upload import AutoUploadParams
+from btrfs2s3.upload import UploadParams
+
+
+def test_default() -> None:
+    assert get_upload_params(S3UploadConfig({})) == AutoUploadParams()
+
+
+def test_auto() -> None:
+    config = S3UploadConfig({"concurrency": 8, "max_memory": 2**30})
+    got = get_upload_params(config)
+    assert got == AutoUploadParams(concurrency=8, max_memory=2**30)
+
+
+def test_fixed_part_size() -> None:
+    config = S3UploadConfig({"part_size": 2**24, "concurrency": 8})
+    got = get_upload_params(config)
+    assert got == UploadParams(part_size=2**24, concurrency=8)
@@ -3,6 +3,7 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 from unittest.mock import patch
 
+from btrfs2s3.commands import update
 from btrfs2s3.console import THEME
 from btrfs2s3.main import main
 from btrfs2s3.s3 import iter_backups
@@ -177,3 +178,96 @@ def test_reject_continue_prompt(
     # Ensure there were no side effects
     assert list(snapshot_dir.iterdir()) == []
     assert s3.list_objects_v2(Bucket=bucket).get("Contents", []) == []
+
+
+def test_force_with_mirror(
+    tmp_path: Path, btrfs_mountpoint: Path, s3: S3Client, bucket: str
+) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+    snapshot_dir = btrfs_mountpoint / "snapshots"
+    snapshot_dir.mkdir()
+    (source / "dummy-file").write_bytes(b"dummy")
+    btrfsutil.sync(source)
+    s3.create_bucket(Bucket="mirror-bucket")
+
+    console = Console(force_terminal=True, theme=THEME, width=88, height=30)
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(f"""
+      timezone: UTC
+      sources:
+      - path: {source}
+        snapshots: {snapshot_dir}
+        upload_to_remotes:
+        - id: aws
+          preserve: 1y
+        - id: mirror
+          preserve: 1y
+      remotes:
+      - id: aws
+        s3:
+          bucket: {bucket}
+      - id: mirror
+        s3:
+          bucket: mirror-bucket
+    """)
+    argv = ["update", "--force", str(config_path)]
+    assert main(console=console, argv=argv) == 0
+
+    ((obj, _),) = iter_backups(s3, bucket)
+    ((mirror_obj, _),) = iter_backups(s3, "mirror-bucket")
+    assert mirror_obj["Key"] == obj["Key"]
+    assert (
+        s3.get_object(Bucket="mirror-bucket", Key=obj["Key"])["Body"].read()
+        == s3.get_object(Bucket=bucket, Key=obj["Key"])["Body"].read()
+    )
+
+
+def test_skip_when_nothing_changed(
+    tmp_path: Path,
+    btrfs_mountpoint: Path,
+    bucket: str,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+    snapshot_dir = btrfs_mountpoint / "snapshots"
+    snapshot_dir.mkdir()
+    (source / "dummy-file").write_bytes(b"dummy")
+    btrfsutil.sync(source)
+
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(f"""
+      timezone: UTC
+      state_dir: {tmp_path / "state"}
+      sources:
+      - path: {source}
+        snapshots: {snapshot_dir}
+        upload_to_remotes:
+        - id: aws
+          preserve: 1y
+      remotes:
+      - id: aws
+        s3:
+          bucket: {bucket}
+    """)
+    argv = ["update", "--force", str(config_path)]
+    assert main(argv=argv) == 0
+    capsys.readouterr()
+
+    # Nothing changed, so nothing should be examined
+    with patch.object(update, "Updater") as updater:
+        assert main(argv=argv) == 0
+
+    updater.assert_not_called()
+    (out, _) = capsys.readouterr()
+    assert "nothing to be done" in out
+
+    # After a change, the update should run in full
+    (source / "dummy-file").write_bytes(b"modified")
+    btrfsutil.sync(source)
+    assert main(argv=argv) == 0
+
+    ctransid = btrfsutil.subvolume_info(source).ctransid
+    infos = [btrfsutil.subvolume_info(path) for path in snapshot_dir.iterdir()]
+    assert ctransid in {info.ctransid for info in infos}
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from btrfs2s3.compress import CompressParams
+from btrfs2s3.compress import MAX_LEVEL
+from btrfs2s3.compress import MAX_WINDOW_LOG
+from btrfs2s3.compress import MIN_LEVEL
+from btrfs2s3.compress import MIN_WINDOW_LOG
+import pytest
+
+
+def test_defaults() -> None:
+    params = CompressParams()
+    assert params.suffix == ".zst"
+
+
+def test_bad_codec() -> None:
+    with pytest.raises(ValueError, match="unsupported codec"):
+        CompressParams(codec="gzip")  # type: ignore[arg-type]
+
+
+@pytest.mark.parametrize("level", [MIN_LEVEL - 1, MAX_LEVEL + 1])
+def test_bad_level(level: int) -> None:
+    with pytest.raises(ValueError, match="level must be between"):
+        CompressParams(level=level)
+
+
+@pytest.mark.parametrize("window_log", [MIN_WINDOW_LOG - 1, MAX_WINDOW_LOG + 1])
+def test_bad_window_log(window_log: int) -> None:
+    with pytest.raises(ValueError, match="window_log must be between"):
+        CompressParams(window_log=window_log)
+
+
+def test_bad_threads() -> None:
+    with pytest.raises(ValueError, match="threads must be at least -1"):
+        CompressParams(threads=-2)
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from io import BytesIO
+import os
+
+from btrfs2s3.compress import compress_stream
+from btrfs2s3.compress import CompressParams
+import pytest
+
+zstandard = pytest.importorskip("zstandard")
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        CompressParams(),
+        CompressParams(level=19, threads=0),
+        CompressParams(window_log=27, threads=2),
+    ],
+)
+def test_round_trip(params: CompressParams) -> None:
+    # Compressible, but not trivially
+    data = os.urandom(2**16) * 64
+
+    stream = compress_stream(BytesIO(data), params)
+    compressed = bytearray()
+    buffer = memoryview(bytearray(12345))
+    while True:
+        count = stream.readinto(buffer)
+        if not count:
+            break
+        compressed += buffer[:count]
+
+    assert len(compressed) < len(data)
+    decompressor = zstandard.ZstdDecompressor(max_window_size=2**31)
+    assert decompressor.stream_reader(BytesIO(compressed)).read() == data
+
+
+def test_source_not_closed() -> None:
+    source = BytesIO(b"data")
+
+    stream = compress_stream(source, CompressParams())
+    while stream.readinto(memoryview(bytearray(100))):
+        pass
+
+    assert not source.closed
@@ -8,6 +8,7 @@ from btrfs2s3.config import load_from_path
 from btrfs2s3.config import RemoteConfig
 from btrfs2s3.config import S3EndpointConfig
 from btrfs2s3.config import S3RemoteConfig
+from btrfs2s3.config import S3UploadConfig
 from btrfs2s3.config import SourceConfig
 from btrfs2s3.config import UploadToRemoteConfig
 import pytest
@@ -123,6 +124,128 @@ def test_s3_endpoint_config(path: Path) -> None:
     )
 
 
+def test_s3_upload_config(path: Path) -> None:
+    path.write_text("""
+        timezone: a
+        sources:
+        - path: b
+          snapshots: c
+          upload_to_remotes:
+          - id: aws
+            preserve: 1y 1m
+        remotes:
+        - id: aws
+          s3:
+            bucket: d
+            upload:
+              part_size: 16777216
+              concurrency: 8
+              max_memory: 134217728
+              max_concurrent_backups: 4
+              max_bandwidth: 1048576
+    """)
+    upload = load_from_path(path)["remotes"][0]["s3"]["upload"]
+    assert upload == S3UploadConfig(
+        {
+            "part_size": 16777216,
+            "concurrency": 8,
+            "max_memory": 134217728,
+            "max_concurrent_backups": 4,
+            "max_bandwidth": 1048576,
+        }
+    )
+
+
+@pytest.mark.parametrize(
+    "upload",
+    [
+        "part_size: 1024",
+        "part_size: big",
+        "concurrency: 0",
+        "max_memory: 1024",
+        "max_concurrent_backups: 0",
+        "max_bandwidth: 0",
+    ],
+)
+def test_invalid_s3_upload_config(path: Path, upload: str) -> None:
+    path.write_text(f"""
+        timezone: a
+        sources:
+        - path: b
+          snapshots: c
+          upload_to_remotes:
+          - id: aws
+            preserve: 1y 1m
+        remotes:
+        - id: aws
+          s3:
+            bucket: d
+            upload:
+              {upload}
+    """)
+    with pytest.raises(InvalidConfigError):
+        load_from_path(path)
+
+
+def test_state_dir(path: Path) -> None:
+    path.write_text("""
+        timezone: a
+        state_dir: /var/lib/btrfs2s3
+        sources:
+        - path: b
+          snapshots: c
+          upload_to_remotes:
+          - id: aws
+            preserve: 1y 1m
+        remotes:
+        - id: aws
+          s3:
+            bucket: d
+            list_refresh_interval: 10
+    """)
+    config = load_from_path(path)
+    assert config["state_dir"] == "/var/lib/btrfs2s3"
+    assert config["remotes"][0]["s3"]["list_refresh_interval"] == 10
+
+
+def test_invalid_list_refresh_interval(path: Path) -> None:
+    path.write_text("""
+        timezone: a
+        sources:
+        - path: b
+          snapshots: c
+          upload_to_remotes:
+          - id: aws
+            preserve: 1y 1m
+        remotes:
+        - id: aws
+          s3:
+            bucket: d
+            list_refresh_interval: 0
+    """)
+    with pytest.raises(InvalidConfigError):
+        load_from_path(path)
+
+
+def test_prefix(path: Path) -> None:
+    path.write_text("""
+        timezone: a
+        sources:
+        - path: b
+          snapshots: c
+          upload_to_remotes:
+          - id: aws
+            preserve: 1y 1m
+            prefix: backups/host/
+        remotes:
+        - id: aws
+          s3:
+            bucket: d
+    """)
+    config = load_from_path(path)
+    assert config["sources"][0]["upload_to_remotes"][0]["prefix"] == "backups/host/"
+
+
 def test_pipe_through(path: Path) -> None:
     path.write_text("""
         timezone: a
@@ -147,6 +270,82 @@ def test_pipe_through(path: Path) -> None:
     ]
 
 
+def test_compress(path: Path) -> None:
+    path.write_text("""
+        timezone: a
+        sources:
+        - path: b
+          snapshots: c
+          upload_to_remotes:
+          - id: aws
+            preserve: 1y 1m
+            compress:
+              codec: zstd
+              level: 9
+              window_log: 27
+              threads: 4
+        remotes:
+        - id: aws
+          s3:
+            bucket: d
+    """)
+    config = load_from_path(path)
+    assert config["sources"][0]["upload_to_remotes"][0]["compress"] == {
+        "codec": "zstd",
+        "level": 9,
+        "window_log": 27,
+        "threads": 4,
+    }
+
+
+@pytest.mark.parametrize(
+    "compress",
+    [
+        "{codec: gzip}",
+        "{level: 3}",
+        "{codec: zstd, level: 0}",
+        "{codec: zstd, window_log: 32}",
+        "{codec: zstd, threads: -2}",
+    ],
+)
+def test_bad_compress(path: Path, compress: str) -> None:
+    path.write_text(f"""
+        timezone: a
+        sources:
+        - path: b
+          snapshots: c
+          upload_to_remotes:
+          - id: aws
+            preserve: 1y 1m
+            compress: {compress}
+        remotes:
+        - id: aws
+          s3:
+            bucket: d
+    """)
+    with pytest.raises(InvalidConfigError):
+        load_from_path(path)
+
+
+def test_send_compressed_data(path: Path) -> None:
+    path.write_text("""
+        timezone: a
+        sources:
+        - path: b
+          snapshots: c
+          upload_to_remotes:
+          - id: aws
+            preserve: 1y 1m
+            send_compressed_data: true
+        remotes:
+        - id: aws
+          s3:
+            bucket: d
+    """)
+    config = load_from_path(path)
+    assert config["sources"][0]["upload_to_remotes"][0]["send_compressed_data"]
+
+
 def test_no_sources(path: Path) -> None:
     path.write_text("""
         timezone: a
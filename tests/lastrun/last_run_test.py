@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from typing import cast
+from typing import TYPE_CHECKING
+
+from btrfs2s3.config import Config
+from btrfs2s3.lastrun import LastRun
+import pytest
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def _config(preserve: str = "1y") -> Config:
+    return cast(
+        Config,
+        {
+            "timezone": "UTC",
+            "sources": [
+                {
+                    "path": "/source",
+                    "snapshots": "/snapshots",
+                    "upload_to_remotes": [{"id": "aws", "preserve": preserve}],
+                }
+            ],
+            "remotes": [{"id": "aws", "s3": {"bucket": "test-bucket"}}],
+        },
+    )
+
+
+@pytest.fixture()
+def last_run(tmp_path: Path) -> LastRun:
+    return LastRun.for_config(tmp_path / "state", _config())
+
+
+def test_no_record(last_run: LastRun) -> None:
+    assert not last_run.nothing_changed({"/source": 1}, now=0.0)
+
+
+def test_nothing_changed(last_run: LastRun) -> None:
+    last_run.record({"/source": 1}, next_wakeup=100.0)
+
+    assert last_run.nothing_changed({"/source": 1}, now=99.0)
+
+
+def test_source_changed(last_run: LastRun) -> None:
+    last_run.record({"/source": 1}, next_wakeup=100.0)
+
+    assert not last_run.nothing_changed({"/source": 2}, now=99.0)
+
+
+def test_boundary_passed(last_run: LastRun) -> None:
+    last_run.record({"/source": 1}, next_wakeup=100.0)
+
+    assert not last_run.nothing_changed({"/source": 1}, now=100.0)
+
+
+def test_no_boundary(last_run: LastRun) -> None:
+    last_run.record({"/source": 1}, next_wakeup=None)
+
+    assert last_run.nothing_changed({"/source": 1}, now=1e12)
+
+
+def test_record_persists(tmp_path: Path) -> None:
+    LastRun.for_config(tmp_path, _config()).record({"/source": 1}, next_wakeup=100.0)
+
+    last_run = LastRun.for_config(tmp_path, _config())
+    assert last_run.nothing_changed({"/source": 1}, now=99.0)
+
+
+def test_config_changed(tmp_path: Path) -> None:
+    LastRun.for_config(tmp_path, _config()).record({"/source": 1}, next_wakeup=100.0)
+
+    last_run = LastRun.for_config(tmp_path, _config("1y 1m"))
+    assert not last_run.nothing_changed({"/source": 1}, now=99.0)
+
+
+def test_same_path_different_config(tmp_path: Path) -> None:
+    LastRun(tmp_path / "last-run.json", _config()).record(
+        {"/source": 1}, next_wakeup=100.0
+    )
+
+    last_run = LastRun(tmp_path / "last-run.json", _config("1y 1m"))
+    assert not last_run.nothing_changed({"/source": 1}, now=99.0)
+
+
+def test_unreadable_record(tmp_path: Path) -> None:
+    (tmp_path / "last-run.json").write_text("garbage")
+    last_run = LastRun(tmp_path / "last-run.json", _config())
+
+    assert not last_run.nothing_changed({"/source": 1}, now=99.0)
@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import arrow
+from btrfs2s3.preservation import next_wakeup
+from btrfs2s3.preservation import Params
+from btrfs2s3.preservation import Policy
+from btrfs2s3.zoneinfo import get_zoneinfo
+import pytest
+
+
+@pytest.mark.parametrize(
+    ("params", "now", "expected"),
+    [
+        (Params(years=1), "2006-01-02T15:04:05", "2007-01-01T00:00:00"),
+        (Params(years=1, months=3, days=30), "2006-01-02T15:04:05", "2006-01-03"),
+        (Params(years=1, hours=1), "2006-01-02T15:04:05", "2006-01-02T16:00:00"),
+        (Params(months=1), "2006-01-31T23:59:59", "2006-02-01T00:00:00"),
+        # The first week of 2007 starts on Monday, January 1
+        (Params(weeks=1), "2006-12-28T00:00:00", "2007-01-01T00:00:00"),
+        # A new year starts before a new week
+        (Params(years=1, weeks=1), "2006-12-31T12:00:00", "2007-01-01T00:00:00"),
+        (Params(years=1, weeks=1), "2005-12-31T12:00:00", "2006-01-01T00:00:00"),
+        # Exactly on a boundary, the next one is a full time span away
+        (Params(days=1), "2006-01-02T00:00:00", "2006-01-03T00:00:00"),
+        (Params(seconds=1), "2006-01-02T00:00:00.5", "2006-01-02T00:00:01"),
+    ],
+)
+def test_next_wakeup(params: Params, now: str, expected: str) -> None:
+    policy = Policy(params=params, now=arrow.get(now).timestamp())
+
+    assert next_wakeup(policy) == arrow.get(expected).timestamp()
+
+
+def test_time_zone() -> None:
+    tzinfo = get_zoneinfo("America/Los_Angeles")
+    now = arrow.get("2006-01-02T15:04:05", tzinfo=tzinfo).timestamp()
+    policy = Policy(params=Params(days=1), tzinfo=tzinfo, now=now)
+
+    expected = arrow.get("2006-01-03T00:00:00", tzinfo=tzinfo).timestamp()
+    assert next_wakeup(policy) == expected
+
+
+def test_empty_policy() -> None:
+    assert next_wakeup(Policy()) is None
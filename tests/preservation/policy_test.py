@@ -76,3 +76,18 @@ def test_alternate_timezone() -> None:
 
     assert time_span in policy.iter_time_spans(time.time())
     assert policy.should_preserve_for_time_span(time_span)
+
+
+def test_bucket_time_spans() -> None:
+    policy = Policy(
+        params=Params(years=1, months=1, hours=1),
+        tzinfo=get_zoneinfo("America/Los_Angeles"),
+    )
+    timestamps = [uniform(0.0, 2e9) for _ in range(100)]
+
+    got = policy.bucket_time_spans(timestamps)
+
+    assert len(got) == 3
+    for i, timestamp in enumerate(timestamps):
+        expected = list(policy.iter_time_spans(timestamp))
+        assert [b.time_spans[b.ids[i]] for b in got] == expected
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+from uuid import uuid4
+
+import arrow
+from btrfs2s3._internal.util import backup_of_snapshot
+from btrfs2s3._internal.util import mksubvol
+from btrfs2s3.preservation import Params
+from btrfs2s3.preservation import Policy
+from btrfs2s3.resolver import IncrementalResolver
+from btrfs2s3.resolver import Reasons
+from btrfs2s3.resolver import resolve
+
+if TYPE_CHECKING:
+    from btrfs2s3._internal.btrfsioctl import SubvolumeInfo
+
+
+def _policy() -> Policy:
+    return Policy(
+        now=arrow.get("2006-03-15T12:00:00").timestamp(),
+        params=Params(years=1, months=3, days=7, hours=6),
+    )
+
+
+def _history() -> list[SubvolumeInfo]:
+    # A snapshot every 5 hours
+    start = arrow.get("2006-01-01").timestamp()
+    return [
+        mksubvol(uuid=uuid4().bytes, ctime=start + i * 5 * 3600, ctransid=i + 1)
+        for i in range(350)
+    ]
+
+
+def test_no_snapshots_added() -> None:
+    snapshots = _history()
+    policy = _policy()
+
+    got = IncrementalResolver(snapshots=snapshots, backups=(), policy=policy)
+
+    assert got.get_result() == resolve(snapshots=snapshots, backups=(), policy=policy)
+
+
+def test_add_most_recent_snapshot_matches_resolve() -> None:
+    snapshots = _history()
+    backups = [backup_of_snapshot(s) for s in snapshots[:100] if s.ctransid % 10 == 0]
+    policy = _policy()
+    new = mksubvol(
+        uuid=uuid4().bytes,
+        ctime=arrow.get("2006-03-15T11:00:00").timestamp(),
+        ctransid=1000,
+    )
+    resolver = IncrementalResolver(snapshots=snapshots, backups=backups, policy=policy)
+
+    got = resolver.add_snapshot(new)
+
+    expected = resolve(snapshots=[*snapshots, new], backups=backups, policy=policy)
+    assert got == expected.keep_backups[new.uuid]
+    result = resolver.get_result()
+    assert result.keep_snapshots[new.uuid] == expected.keep_snapshots[new.uuid]
+    assert result.keep_backups[new.uuid] == expected.keep_backups[new.uuid]
+    # The send-parent chain of the new backup is kept
+    assert got is not None
+    send_parent_uuid = got.item.send_parent_uuid
+    assert send_parent_uuid is not None
+    assert send_parent_uuid in result.keep_backups
+
+
+def test_add_preserved_snapshot_in_new_time_span() -> None:
+    policy = Policy(
+        now=arrow.get("2006-01-02").timestamp(), params=Params(years=1, days=2)
+    )
+    old = mksubvol(
+        uuid=uuid4().bytes, ctime=arrow.get("2006-01-01").timestamp(), ctransid=1
+    )
+    resolver = IncrementalResolver(snapshots=(old,), backups=(), policy=policy)
+    new = mksubvol(
+        uuid=uuid4().bytes, ctime=arrow.get("2006-01-02").timestamp(), ctransid=2
+    )
+
+    got = resolver.add_snapshot(new)
+
+    assert got is not None
+    assert got.item == backup_of_snapshot(new, send_parent=old)
+    assert got.meta.reasons == Reasons.Preserved | Reasons.MostRecent
+    assert got.meta.time_spans == {
+        (arrow.get("2006-01-02").timestamp(), arrow.get("2006-01-03").timestamp())
+    }
+
+
+def test_existing_marks_are_kept() -> None:
+    old = mksubvol(uuid=uuid4().bytes, ctime=0.0, ctransid=1)
+    resolver = IncrementalResolver(snapshots=(old,), backups=(), policy=Policy())
+    new = mksubvol(uuid=uuid4().bytes, ctime=1.0, ctransid=2)
+
+    resolver.add_snapshot(new)
+
+    result = resolver.get_result()
+    assert result.keep_snapshots[old.uuid].meta.reasons == Reasons.MostRecent
+    assert result.keep_snapshots[new.uuid].meta.reasons == Reasons.MostRecent
+
+
+def test_add_snapshot_not_kept() -> None:
+    recent = mksubvol(uuid=uuid4().bytes, ctime=1.0, ctransid=2)
+    resolver = IncrementalResolver(snapshots=(recent,), backups=(), policy=Policy())
+    new = mksubvol(uuid=uuid4().bytes, ctime=0.0, ctransid=1)
+
+    got = resolver.add_snapshot(new)
+
+    assert got is None
+    assert new.uuid not in resolver.get_result().keep_snapshots
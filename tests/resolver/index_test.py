@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from random import randrange
+from random import uniform
 from uuid import uuid4
 
 from btrfs2s3._internal.util import mksubvol
@@ -117,3 +119,60 @@ def test_get_all_time_spans() -> None:
     index = _Index(policy=Policy.all(), items=(snapshot,))
     got = index.get_all_time_spans()
     assert got == set(Policy.all().iter_time_spans(snapshot.ctime))
+
+
+def test_add_older() -> None:
+    snapshot1 = mksubvol(uuid=uuid4().bytes, ctransid=2)
+    snapshot2 = mksubvol(uuid=uuid4().bytes, ctransid=1)
+    index = _Index(policy=Policy.all(), items=(snapshot1,))
+
+    index.add(snapshot2)
+
+    assert index.get(snapshot2.uuid) == snapshot2
+    assert index.get_most_recent() == snapshot1
+    for timespan in Policy.all().iter_time_spans(snapshot1.ctime):
+        assert index.get_nominal(timespan) == snapshot2
+
+
+def test_add_newer() -> None:
+    snapshot1 = mksubvol(uuid=uuid4().bytes, ctransid=1)
+    snapshot2 = mksubvol(uuid=uuid4().bytes, ctransid=2)
+    index = _Index(policy=Policy.all(), items=(snapshot1,))
+
+    index.add(snapshot2)
+
+    assert index.get(snapshot2.uuid) == snapshot2
+    assert index.get_most_recent() == snapshot2
+    for timespan in Policy.all().iter_time_spans(snapshot1.ctime):
+        assert index.get_nominal(timespan) == snapshot1
+
+
+def test_add_new_time_span() -> None:
+    snapshot1 = mksubvol(uuid=uuid4().bytes, ctime=0.0, ctransid=1)
+    snapshot2 = mksubvol(uuid=uuid4().bytes, ctime=2000000000.0, ctransid=2)
+    index = _Index(policy=Policy.all(), items=(snapshot1,))
+
+    index.add(snapshot2)
+
+    assert set(index.get_all_time_spans()) == set(
+        Policy.all().iter_time_spans(snapshot1.ctime)
+    ) | set(Policy.all().iter_time_spans(snapshot2.ctime))
+    for timespan in Policy.all().iter_time_spans(snapshot2.ctime):
+        assert index.get_nominal(timespan) == snapshot2
+
+
+def test_bulk_matches_add() -> None:
+    policy = Policy.all()
+    snapshots = [
+        mksubvol(uuid=uuid4().bytes, ctime=uniform(0, 1e8), ctransid=randrange(50))
+        for _ in range(200)
+    ]
+    index = _Index(policy=policy, items=snapshots)
+    expected = _Index(policy=policy, items=snapshots[:0])
+    for snapshot in snapshots:
+        expected.add(snapshot)
+
+    assert set(index.get_all_time_spans()) == set(expected.get_all_time_spans())
+    for time_span in expected.get_all_time_spans():
+        assert index.get_nominal(time_span) is expected.get_nominal(time_span)
+    assert index.get_most_recent() is expected.get_most_recent()
@@ -16,7 +16,7 @@ from btrfs2s3.resolver import Reasons
 import pytest
 
 if TYPE_CHECKING:
-    from btrfsutil import SubvolumeInfo
+    from btrfs2s3._internal.btrfsioctl import SubvolumeInfo
 
 
 @pytest.fixture()
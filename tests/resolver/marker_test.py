@@ -1,12 +1,12 @@
 from __future__ import annotations
 
+from btrfs2s3._internal.btrfsioctl import SubvolumeInfo
 from btrfs2s3._internal.util import mksubvol
 from btrfs2s3.resolver import _MarkedItem
 from btrfs2s3.resolver import _Marker
 from btrfs2s3.resolver import Flags
 from btrfs2s3.resolver import KeepMeta
 from btrfs2s3.resolver import Reasons
-from btrfsutil import SubvolumeInfo
 
 
 def test_empty() -> None:
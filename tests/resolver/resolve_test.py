@@ -18,7 +18,7 @@ from btrfs2s3.resolver import Result
 import pytest
 
 if TYPE_CHECKING:
-    from btrfsutil import SubvolumeInfo
+    from btrfs2s3._internal.btrfsioctl import SubvolumeInfo
 
 from uuid import uuid4
 
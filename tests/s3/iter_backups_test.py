@@ -56,3 +56,15 @@ def test_pagination(s3: S3Client, bucket: str) -> None:
 
     got_infos = {info for _, info in got}
     assert got_infos == infos
+
+
+def test_prefix(s3: S3Client, bucket: str) -> None:
+    info = mkinfo()
+    key = f"prefix/basename{''.join(info.get_path_suffixes())}"
+    s3.put_object(Bucket=bucket, Key=key, Body=b"dummy")
+    other_key = f"other/basename{''.join(mkinfo().get_path_suffixes())}"
+    s3.put_object(Bucket=bucket, Key=other_key, Body=b"dummy")
+
+    got = list(iter_backups(s3, bucket, prefix="prefix/"))
+
+    assert [(obj["Key"], got_info) for obj, got_info in got] == [(key, info)]
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from random import randrange
+from typing import TYPE_CHECKING
+from uuid import uuid4
+
+import arrow
+from btrfs2s3.backups import BackupInfo
+from btrfs2s3.s3 import list_backups
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3.client import S3Client
+
+
+def mkinfo() -> BackupInfo:
+    return BackupInfo(
+        uuid=uuid4().bytes,
+        parent_uuid=uuid4().bytes,
+        ctransid=randrange(100000),
+        ctime=arrow.get().timestamp(),
+        send_parent_uuid=uuid4().bytes,
+    )
+
+
+def put_backup(s3: S3Client, bucket: str, prefix: str) -> str:
+    key = f"{prefix}basename{''.join(mkinfo().get_path_suffixes())}"
+    s3.put_object(Bucket=bucket, Key=key, Body=b"dummy")
+    return key
+
+
+def test_empty(s3: S3Client, bucket: str) -> None:
+    assert list_backups(s3, bucket) == []
+
+
+def test_whole_bucket(s3: S3Client, bucket: str) -> None:
+    keys = {put_backup(s3, bucket, prefix) for prefix in ("", "a/", "b/")}
+
+    got = list_backups(s3, bucket)
+
+    assert {obj["Key"] for obj, _ in got} == keys
+
+
+def test_prefixes(s3: S3Client, bucket: str) -> None:
+    a_keys = {put_backup(s3, bucket, "a/") for _ in range(3)}
+    b_keys = {put_backup(s3, bucket, "b/") for _ in range(3)}
+    put_backup(s3, bucket, "c/")
+    put_backup(s3, bucket, "")
+
+    got = list_backups(s3, bucket, prefixes=["b/", "a/", "a/x"], max_workers=2)
+
+    assert [obj["Key"] for obj, _ in got] == sorted(a_keys) + sorted(b_keys)
@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+from btrfs2s3.s3 import minimize_prefixes
+import pytest
+
+
+@pytest.mark.parametrize(
+    ("prefixes", "expected"),
+    [
+        ([], []),
+        ([""], [""]),
+        (["", "a/"], [""]),
+        (["b/", "a/", "b/"], ["a/", "b/"]),
+        (["a/b/", "a/", "ab/"], ["a/", "ab/"]),
+        (["a", "ab", "b"], ["a", "b"]),
+    ],
+)
+def test_minimize_prefixes(prefixes: list[str], expected: list[str]) -> None:
+    assert minimize_prefixes(prefixes) == expected
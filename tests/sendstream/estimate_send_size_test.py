@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import subprocess
+from typing import TYPE_CHECKING
+
+from btrfs2s3.sendstream import estimate_send_size
+import btrfsutil
+import pytest
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def _actual_send_size(snapshot: Path, send_parent: Path | None = None) -> int:
+    args: list[str | Path] = ["btrfs", "send", "-q"]
+    if send_parent is not None:
+        args += ["-p", send_parent]
+    args += [snapshot]
+    return len(subprocess.run(args, stdout=subprocess.PIPE, check=True).stdout)
+
+
+def test_full_and_delta(btrfs_mountpoint: Path) -> None:
+    source = btrfs_mountpoint / "source"
+    btrfsutil.create_subvolume(source)
+    (source / "large-file").write_bytes(b"\xff" * (16 * 2**20))
+    snapshot1 = btrfs_mountpoint / "snapshot1"
+    btrfsutil.create_snapshot(source, snapshot1, read_only=True)
+    with (source / "large-file").open(mode="ab") as fp:
+        fp.write(b"\xff" * (4 * 2**20))
+    snapshot2 = btrfs_mountpoint / "snapshot2"
+    btrfsutil.create_snapshot(source, snapshot2, read_only=True)
+
+    full = estimate_send_size(snapshot=snapshot1, send_parent=None)
+    actual_full = _actual_send_size(snapshot1)
+    assert actual_full * 0.99 <= full <= actual_full
+
+    delta = estimate_send_size(snapshot=snapshot2, send_parent=snapshot1)
+    actual_delta = _actual_send_size(snapshot2, snapshot1)
+    assert actual_delta * 0.99 <= delta <= actual_delta
+
+
+def test_send_failure(tmp_path: Path) -> None:
+    with pytest.raises(RuntimeError, match="exited with code "):
+        estimate_send_size(snapshot=tmp_path, send_parent=None)
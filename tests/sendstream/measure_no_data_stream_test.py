@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from io import BytesIO
+import struct
+
+from btrfs2s3.sendstream import Attribute
+from btrfs2s3.sendstream import Command
+from btrfs2s3.sendstream import InvalidStreamError
+from btrfs2s3.sendstream import iter_commands
+from btrfs2s3.sendstream import MAGIC
+from btrfs2s3.sendstream import measure_no_data_stream
+import pytest
+
+_PATH = 15
+_FILE_OFFSET = 18
+
+
+def _attribute(attribute: int, value: bytes) -> bytes:
+    return struct.pack("<HH", attribute, len(value)) + value
+
+
+def _command(command: int, *attributes: bytes) -> bytes:
+    payload = b"".join(attributes)
+    return struct.pack("<IHI", len(payload), command, 0) + payload
+
+
+def _stream(*commands: bytes, version: int = 1) -> bytes:
+    return MAGIC + struct.pack("<I", version) + b"".join(commands)
+
+
+def _update_extent(size: int) -> bytes:
+    return _command(
+        Command.UPDATE_EXTENT,
+        _attribute(_PATH, b"file"),
+        _attribute(_FILE_OFFSET, struct.pack("<Q", 0)),
+        _attribute(Attribute.SIZE, struct.pack("<Q", size)),
+    )
+
+
+def test_empty_stream() -> None:
+    stream = _stream()
+    assert measure_no_data_stream(BytesIO(stream)) == len(stream)
+
+
+def test_metadata_only() -> None:
+    stream = _stream(_command(3, _attribute(_PATH, b"file")), _command(Command.END))
+    assert measure_no_data_stream(BytesIO(stream)) == len(stream)
+
+
+def test_update_extents() -> None:
+    stream = _stream(_update_extent(1000), _update_extent(2**40), _command(Command.END))
+    assert measure_no_data_stream(BytesIO(stream)) == len(stream) + 1000 + 2**40
+
+
+def test_iter_commands() -> None:
+    stream = _stream(_command(3, _attribute(_PATH, b"file")), _command(Command.END))
+    got = list(iter_commands(BytesIO(stream)))
+    assert got == [(3, {_PATH: b"file"}), (Command.END, {})]
+
+
+def test_iter_commands_v2_implicit_data_length() -> None:
+    data = b"\xff" * 100
+    payload = _attribute(_PATH, b"file") + struct.pack("<HH", Attribute.DATA, 0) + data
+    command = struct.pack("<IHI", len(payload), Command.WRITE, 0) + payload
+    stream = _stream(command, version=2)
+    got = list(iter_commands(BytesIO(stream)))
+    assert got == [(Command.WRITE, {_PATH: b"file", Attribute.DATA: data})]
+
+
+@pytest.mark.parametrize(
+    "stream",
+    [
+        b"",
+        b"not-a-btrfs-stream-at-all",
+        _stream(_update_extent(1000))[:-1],
+        _stream(_update_extent(1000))[: len(_stream()) + 5],
+        _stream(b"\x00\x01"),
+    ],
+)
+def test_invalid_stream(stream: bytes) -> None:
+    with pytest.raises(InvalidStreamError):
+        measure_no_data_stream(BytesIO(stream))
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from subprocess import CompletedProcess
+from typing import TYPE_CHECKING
+from unittest.mock import patch
+
+from btrfs2s3 import sendstream
+from btrfs2s3.sendstream import supports_compressed_data
+import pytest
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+_HELP = b"""usage: btrfs send [-ve] [-p <parent>] [-c <clone-src>] <subvol>
+    --proto N             use send protocol N
+    --compressed-data     send data that is compressed on the filesystem
+"""
+
+
+@pytest.mark.parametrize(
+    ("kernel_version", "help_text", "expected"),
+    [
+        ("2\n", _HELP, True),
+        ("1\n", _HELP, False),
+        (None, _HELP, False),
+        ("2\n", b"usage: btrfs send [-ve] [-p <parent>] <subvol>\n", False),
+    ],
+)
+def test_supports_compressed_data(
+    tmp_path: Path, kernel_version: str | None, help_text: bytes, *, expected: bool
+) -> None:
+    path = tmp_path / "send_stream_version"
+    if kernel_version is not None:
+        path.write_text(kernel_version)
+
+    with patch.object(sendstream, "_SEND_STREAM_VERSION", path):  # noqa: SIM117
+        with patch.object(
+            sendstream, "run", return_value=CompletedProcess([], 0, help_text)
+        ):
+            assert supports_compressed_data() == expected
+
+
+def test_no_btrfs_progs(tmp_path: Path) -> None:
+    path = tmp_path / "send_stream_version"
+    path.write_text("2\n")
+
+    with patch.object(sendstream, "_SEND_STREAM_VERSION", path):  # noqa: SIM117
+        with patch.object(sendstream, "run", side_effect=FileNotFoundError):
+            assert not supports_compressed_data()
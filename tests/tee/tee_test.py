@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import os
+import threading
+
+from btrfs2s3.tee import Tee
+from btrfs2s3.tee import TeeBranch
+import pytest
+
+
+def _read_all(branch: TeeBranch, size: int = 1000) -> bytes:
+    result = bytearray()
+    buffer = memoryview(bytearray(size))
+    while True:
+        count = branch.readinto(buffer)
+        if not count:
+            return bytes(result)
+        result += buffer[:count]
+
+
+class _Failing(BytesIO):
+    def readinto(self, buffer: memoryview) -> int:  # type: ignore[override]
+        if self.tell():
+            msg = "injected"
+            raise OSError(msg)
+        return super().readinto(buffer)
+
+
+@pytest.mark.parametrize("size", [0, 1, 4096, 4096 * 10 + 1])
+@pytest.mark.parametrize("count", [1, 3])
+def test_all_branches_get_data(size: int, count: int) -> None:
+    data = os.urandom(size)
+    tee = Tee(BytesIO(data), count, chunk_size=4096, max_buffer=4096 * 2)
+
+    with ThreadPoolExecutor() as executor:
+        executor.submit(tee.run)
+        # Read with different buffer sizes
+        results = [
+            executor.submit(_read_all, branch, 1000 + i)
+            for i, branch in enumerate(tee.branches)
+        ]
+
+    assert [future.result() for future in results] == [data] * count
+
+
+def test_closed_branch_doesnt_stall() -> None:
+    data = os.urandom(4096 * 10)
+    tee = Tee(BytesIO(data), 2, chunk_size=4096, max_buffer=4096)
+    slow, fast = tee.branches
+
+    with ThreadPoolExecutor() as executor:
+        executor.submit(tee.run)
+        # Blocks until the first chunk is available
+        assert slow.readinto(memoryview(bytearray(1))) == 1
+        slow.close()
+        result = executor.submit(_read_all, fast)
+
+    assert result.result() == data
+
+
+def test_buffering_is_bounded() -> None:
+    data = os.urandom(4096 * 10)
+    tee = Tee(BytesIO(data), 2, chunk_size=4096, max_buffer=4096 * 2)
+    slow, fast = tee.branches
+    read = bytearray()
+    buffer = memoryview(bytearray(4096))
+    done = threading.Event()
+
+    def read_fast() -> None:
+        while fast.readinto(buffer):
+            read.extend(buffer)
+        done.set()
+
+    with ThreadPoolExecutor() as executor:
+        executor.submit(tee.run)
+        executor.submit(read_fast)
+        # The fast branch is held up once the slow branch's buffer is full
+        assert not done.wait(0.5)
+        assert len(read) <= 4096 * 3
+        assert _read_all(slow) == data
+
+    assert bytes(read) == data
+
+
+def test_source_error() -> None:
+    tee = Tee(_Failing(os.urandom(4096 * 3)), 2, chunk_size=4096)
+
+    with ThreadPoolExecutor() as executor:
+        executor.submit(tee.run)
+        results = [executor.submit(_read_all, branch) for branch in tee.branches]
+
+    for future in results:
+        with pytest.raises(OSError, match="injected"):
+            future.result()
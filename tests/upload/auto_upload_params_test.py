@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from btrfs2s3.upload import AutoUploadParams
+from btrfs2s3.upload import MAX_PART_SIZE
+from btrfs2s3.upload import MAX_PARTS
+from btrfs2s3.upload import MIN_PART_SIZE
+import pytest
+
+
+@pytest.mark.parametrize("estimated_size", [0, 1, 1000, MIN_PART_SIZE // 2])
+def test_small_streams_use_min_part_size(estimated_size: int) -> None:
+    params = AutoUploadParams().choose(estimated_size)
+    assert params.part_size == MIN_PART_SIZE
+
+
+def test_medium_streams_use_one_part() -> None:
+    estimated_size = 20 * 2**20
+    auto = AutoUploadParams(concurrency=4, max_memory=256 * 2**20)
+    params = auto.choose(estimated_size)
+    assert params.part_size >= estimated_size
+    assert params.max_memory <= auto.max_memory
+
+
+def test_large_streams_use_concurrent_parts() -> None:
+    estimated_size = 100 * 2**20
+    auto = AutoUploadParams(concurrency=4, max_memory=256 * 2**20)
+    params = auto.choose(estimated_size)
+    assert params.concurrency == 4
+    assert params.part_size * 4 >= estimated_size
+    assert params.max_memory <= auto.max_memory
+
+
+@pytest.mark.parametrize("estimated_size", [2**30, 100 * 2**30, 2 * 2**40])
+def test_huge_streams_fit_in_max_parts(estimated_size: int) -> None:
+    params = AutoUploadParams().choose(estimated_size)
+    assert params.part_size * MAX_PARTS >= estimated_size * 2
+    assert params.part_size % 2**20 == 0
+
+
+def test_huge_streams_reduce_concurrency() -> None:
+    auto = AutoUploadParams(concurrency=4, max_memory=256 * 2**20)
+    params = auto.choose(2 * 2**40)
+    assert params.part_size > auto.max_memory
+    assert params.concurrency == 1
+
+
+def test_too_huge_stream() -> None:
+    params = AutoUploadParams().choose(MAX_PART_SIZE * MAX_PARTS)
+    assert params.part_size == MAX_PART_SIZE
+
+
+def test_bad_concurrency() -> None:
+    with pytest.raises(ValueError, match="concurrency must be at least 1"):
+        AutoUploadParams(concurrency=0)
+
+
+def test_bad_max_memory() -> None:
+    with pytest.raises(ValueError, match="max_memory must be at least"):
+        AutoUploadParams(max_memory=MIN_PART_SIZE - 1)
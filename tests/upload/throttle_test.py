@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+from unittest.mock import patch
+
+from btrfs2s3 import upload
+from btrfs2s3.upload import Throttle
+import pytest
+
+if TYPE_CHECKING:
+    from typing import Iterator
+
+
+class _FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture()
+def clock() -> Iterator[_FakeClock]:
+    clock = _FakeClock()
+    with patch.object(upload, "time", clock):
+        yield clock
+
+
+def test_invalid_rate() -> None:
+    with pytest.raises(ValueError, match="rate"):
+        Throttle(0)
+
+
+def test_burst_is_not_delayed(clock: _FakeClock) -> None:
+    throttle = Throttle(1000)
+
+    throttle.consume(1000)
+
+    assert clock.now == 1000.0
+
+
+def test_sustained_rate(clock: _FakeClock) -> None:
+    throttle = Throttle(1000)
+
+    for _ in range(10):
+        throttle.consume(1000)
+
+    # The first second's worth is a burst, the rest is at the limit
+    assert clock.now == pytest.approx(1009.0)
+
+
+def test_idle_time_is_not_banked(clock: _FakeClock) -> None:
+    throttle = Throttle(1000)
+
+    clock.now += 100
+    for _ in range(3):
+        throttle.consume(1000)
+
+    assert clock.now == pytest.approx(1102.0)
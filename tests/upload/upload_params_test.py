@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+from btrfs2s3.upload import MAX_PART_SIZE
+from btrfs2s3.upload import MIN_PART_SIZE
+from btrfs2s3.upload import UploadParams
+import pytest
+
+
+def test_defaults() -> None:
+    params = UploadParams()
+    assert params.max_memory == params.part_size * params.concurrency
+
+
+@pytest.mark.parametrize("part_size", [0, MIN_PART_SIZE - 1, MAX_PART_SIZE + 1])
+def test_bad_part_size(part_size: int) -> None:
+    with pytest.raises(ValueError, match="part_size must be between"):
+        UploadParams(part_size=part_size)
+
+
+@pytest.mark.parametrize("concurrency", [0, -1])
+def test_bad_concurrency(concurrency: int) -> None:
+    with pytest.raises(ValueError, match="concurrency must be at least 1"):
+        UploadParams(concurrency=concurrency)
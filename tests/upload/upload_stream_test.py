@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+from io import BytesIO
+import os
+from typing import TYPE_CHECKING
+from unittest.mock import patch
+
+from botocore.exceptions import ClientError
+from btrfs2s3 import upload
+from btrfs2s3.checkpoint import UploadCheckpoints
+from btrfs2s3.upload import MIN_PART_SIZE
+from btrfs2s3.upload import Throttle
+from btrfs2s3.upload import upload_stream
+from btrfs2s3.upload import UploadParams
+import pytest
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from btrfs2s3.checkpoint import UploadCheckpoint
+    from mypy_boto3_s3.client import S3Client
+
+
+class _ShortReads(BytesIO):
+    # Simulate a pipe, which may return fewer bytes than requested
+    def readinto(self, buffer: memoryview) -> int:  # type: ignore[override]
+        return super().readinto(buffer[:1000])
+
+
+def test_empty_stream(s3: S3Client, bucket: str) -> None:
+    upload_stream(s3, bucket, "test-key", BytesIO())
+
+    assert s3.get_object(Bucket=bucket, Key="test-key")["Body"].read() == b""
+
+
+def test_single_part(s3: S3Client, bucket: str) -> None:
+    data = os.urandom(1000)
+
+    with patch.object(s3, "create_multipart_upload") as create_multipart_upload:
+        upload_stream(s3, bucket, "test-key", BytesIO(data))
+
+    create_multipart_upload.assert_not_called()
+    assert s3.get_object(Bucket=bucket, Key="test-key")["Body"].read() == data
+
+
+@pytest.mark.parametrize("concurrency", [1, 2, 4])
+@pytest.mark.parametrize("size", [MIN_PART_SIZE, MIN_PART_SIZE * 3 + 1])
+def test_multipart(s3: S3Client, bucket: str, concurrency: int, size: int) -> None:
+    data = os.urandom(size)
+    params = UploadParams(part_size=MIN_PART_SIZE, concurrency=concurrency)
+
+    upload_stream(s3, bucket, "test-key", BytesIO(data), params=params)
+
+    assert s3.get_object(Bucket=bucket, Key="test-key")["Body"].read() == data
+
+
+def test_short_reads(s3: S3Client, bucket: str) -> None:
+    data = os.urandom(MIN_PART_SIZE + 1)
+    params = UploadParams(part_size=MIN_PART_SIZE)
+
+    upload_stream(s3, bucket, "test-key", _ShortReads(data), params=params)
+
+    assert s3.get_object(Bucket=bucket, Key="test-key")["Body"].read() == data
+
+
+def test_buffers_are_bounded(s3: S3Client, bucket: str) -> None:
+    data = os.urandom(MIN_PART_SIZE * 5)
+    params = UploadParams(part_size=MIN_PART_SIZE, concurrency=2)
+    allocated: list[int] = []
+
+    def counting_bytearray(size: int) -> bytearray:
+        allocated.append(size)
+        return bytearray(size)
+
+    with patch.object(upload, "bytearray", counting_bytearray, create=True):
+        upload_stream(s3, bucket, "test-key", BytesIO(data), params=params)
+
+    assert allocated == [MIN_PART_SIZE] * 2
+    assert s3.get_object(Bucket=bucket, Key="test-key")["Body"].read() == data
+
+
+def test_part_failure_aborts(s3: S3Client, bucket: str) -> None:
+    data = os.urandom(MIN_PART_SIZE * 3)
+    params = UploadParams(part_size=MIN_PART_SIZE)
+
+    with patch.object(s3, "upload_part", side_effect=RuntimeError("injected")):  # noqa: SIM117
+        with pytest.raises(RuntimeError, match="injected"):
+            upload_stream(s3, bucket, "test-key", BytesIO(data), params=params)
+
+    assert s3.list_multipart_uploads(Bucket=bucket).get("Uploads", []) == []
+    with pytest.raises(ClientError):
+        s3.head_object(Bucket=bucket, Key="test-key")
+
+
+def test_too_many_parts(s3: S3Client, bucket: str) -> None:
+    data = os.urandom(MIN_PART_SIZE * 3)
+    params = UploadParams(part_size=MIN_PART_SIZE)
+
+    with patch.object(upload, "MAX_PARTS", 2):  # noqa: SIM117
+        with pytest.raises(RuntimeError, match="stream exceeds 2 parts"):
+            upload_stream(s3, bucket, "test-key", BytesIO(data), params=params)
+
+    assert s3.list_multipart_uploads(Bucket=bucket).get("Uploads", []) == []
+    with pytest.raises(ClientError):
+        s3.head_object(Bucket=bucket, Key="test-key")
+
+
+def test_throttle(s3: S3Client, bucket: str) -> None:
+    data = os.urandom(MIN_PART_SIZE + 1)
+    params = UploadParams(part_size=MIN_PART_SIZE)
+    throttle = Throttle(MIN_PART_SIZE)
+    consumed: list[int] = []
+
+    with patch.object(throttle, "consume", side_effect=consumed.append):
+        upload_stream(
+            s3, bucket, "test-key", BytesIO(data), params=params, throttle=throttle
+        )
+
+    # The stream is consumed in small chunks, to avoid bursts
+    assert max(consumed) < MIN_PART_SIZE
+    assert sum(consumed) == len(data)
+    assert s3.get_object(Bucket=bucket, Key="test-key")["Body"].read() == data
+
+
+def test_part_buffers_are_not_copied(s3: S3Client, bucket: str) -> None:
+    data = os.urandom(MIN_PART_SIZE * 2 + 1)
+    params = UploadParams(part_size=MIN_PART_SIZE)
+
+    with patch.object(s3, "upload_part", wraps=s3.upload_part) as upload_part:
+        upload_stream(s3, bucket, "test-key", BytesIO(data), params=params)
+
+    bodies = [call.kwargs["Body"] for call in upload_part.call_args_list]
+    assert all(isinstance(body, bytearray) for body in bodies)
+    assert sorted(len(body) for body in bodies) == [1, MIN_PART_SIZE, MIN_PART_SIZE]
+    assert s3.get_object(Bucket=bucket, Key="test-key")["Body"].read() == data
+
+
+class _Interrupted(BytesIO):
+    # Simulate a stream which fails after some data
+    def __init__(self, data: bytes, fail_at: int) -> None:
+        super().__init__(data)
+        self._fail_at = fail_at
+
+    def readinto(self, buffer: memoryview) -> int:  # type: ignore[override]
+        if self.tell() >= self._fail_at:
+            msg = "interrupted"
+            raise OSError(msg)
+        return super().readinto(buffer)
+
+
+def _interrupt(
+    s3: S3Client, bucket: str, data: bytes, checkpoint: UploadCheckpoint
+) -> None:
+    params = UploadParams(part_size=MIN_PART_SIZE)
+    with pytest.raises(OSError, match="interrupted"):
+        upload_stream(
+            s3,
+            bucket,
+            "test-key",
+            _Interrupted(data, MIN_PART_SIZE * 2),
+            params=params,
+            checkpoint=checkpoint,
+        )
+
+
+def test_resume(s3: S3Client, bucket: str, tmp_path: Path) -> None:
+    data = os.urandom(MIN_PART_SIZE * 3 + 1)
+    checkpoints = UploadCheckpoints(tmp_path)
+    _interrupt(s3, bucket, data, checkpoints.get("test-key"))
+
+    # The upload is left to be resumed
+    assert len(s3.list_multipart_uploads(Bucket=bucket)["Uploads"]) == 1
+
+    with patch.object(s3, "upload_part", wraps=s3.upload_part) as upload_part:
+        upload_stream(
+            s3,
+            bucket,
+            "test-key",
+            BytesIO(data),
+            # The checkpoint's part size is used
+            params=UploadParams(part_size=MIN_PART_SIZE * 2),
+            checkpoint=checkpoints.get("test-key"),
+        )
+
+    part_numbers = sorted(
+        call.kwargs["PartNumber"] for call in upload_part.call_args_list
+    )
+    assert part_numbers == [3, 4]
+    assert s3.get_object(Bucket=bucket, Key="test-key")["Body"].read() == data
+    assert s3.list_multipart_uploads(Bucket=bucket).get("Uploads", []) == []
+    assert checkpoints.get("test-key").load() is None
+
+
+def test_resume_changed_stream(s3: S3Client, bucket: str, tmp_path: Path) -> None:
+    checkpoint = UploadCheckpoints(tmp_path).get("test-key")
+    _interrupt(s3, bucket, os.urandom(MIN_PART_SIZE * 3), checkpoint)
+    data = os.urandom(MIN_PART_SIZE * 3)
+
+    with patch.object(s3, "upload_part", wraps=s3.upload_part) as upload_part:
+        upload_stream(
+            s3,
+            bucket,
+            "test-key",
+            BytesIO(data),
+            params=UploadParams(part_size=MIN_PART_SIZE),
+            checkpoint=checkpoint,
+        )
+
+    # Parts which don't match are uploaded again
+    assert upload_part.call_count == 3
+    assert s3.get_object(Bucket=bucket, Key="test-key")["Body"].read() == data
+
+
+def test_resume_short_stream(s3: S3Client, bucket: str, tmp_path: Path) -> None:
+    checkpoint = UploadCheckpoints(tmp_path).get("test-key")
+    _interrupt(s3, bucket, os.urandom(MIN_PART_SIZE * 3), checkpoint)
+
+    upload_stream(s3, bucket, "test-key", BytesIO(b"short"), checkpoint=checkpoint)
+
+    assert s3.get_object(Bucket=bucket, Key="test-key")["Body"].read() == b"short"
+    assert s3.list_multipart_uploads(Bucket=bucket).get("Uploads", []) == []
+    assert checkpoint.load() is None
+
+
+def test_resume_upload_gone(s3: S3Client, bucket: str, tmp_path: Path) -> None:
+    data = os.urandom(MIN_PART_SIZE * 3)
+    checkpoint = UploadCheckpoints(tmp_path).get("test-key")
+    _interrupt(s3, bucket, data, checkpoint)
+    (upload_info,) = s3.list_multipart_uploads(Bucket=bucket)["Uploads"]
+    s3.abort_multipart_upload(
+        Bucket=bucket, Key="test-key", UploadId=upload_info["UploadId"]
+    )
+
+    upload_stream(
+        s3,
+        bucket,
+        "test-key",
+        BytesIO(data),
+        params=UploadParams(part_size=MIN_PART_SIZE),
+        checkpoint=checkpoint,
+    )
+
+    assert s3.get_object(Bucket=bucket, Key="test-key")["Body"].read() == data
+
+
+def test_too_many_parts_with_checkpoint(
+    s3: S3Client, bucket: str, tmp_path: Path
+) -> None:
+    data = os.urandom(MIN_PART_SIZE * 3)
+    checkpoint = UploadCheckpoints(tmp_path).get("test-key")
+
+    with patch.object(upload, "MAX_PARTS", 2):  # noqa: SIM117
+        with pytest.raises(RuntimeError, match="stream exceeds 2 parts"):
+            upload_stream(
+                s3,
+                bucket,
+                "test-key",
+                BytesIO(data),
+                params=UploadParams(part_size=MIN_PART_SIZE),
+                checkpoint=checkpoint,
+            )
+
+    # Resuming wouldn't help, so the upload is aborted
+    assert s3.list_multipart_uploads(Bucket=bucket).get("Uploads", []) == []
+    assert checkpoint.load() is None